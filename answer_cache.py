@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# --- Cache settings (override via environment) ---
+CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256"))
+# Preceding user/assistant messages that are part of the key: a follow-up like
+# "and in staging?" only matches an answer given after the same exchange
+CACHE_CONTEXT_MESSAGES = int(os.getenv("ANSWER_CACHE_CONTEXT_MESSAGES", "4"))
+
+# Tools that change cluster or bucket state. Running any of them clears the
+# cache, and answers produced by a run that used one are never cached.
+MUTATING_TOOLS = {
+    # Kubernetes
+    "exec_pod", "scale_deployment", "rollout_restart", "rollback_deployment",
+    "port_forward_service", "port_forward_pod", "stop_port_forward", "test_dns",
+    "cordon_node", "uncordon_node", "drain_node", "switch_context",
+    # AWS S3
+    "create_bucket_advanced", "delete_bucket_interactive", "empty_bucket", "set_bucket_versioning",
+    "upload_file", "download_file", "sync_to_s3", "sync_from_s3", "copy_prefix", "move_prefix", "delete_object",
+    "set_bucket_policy_json", "delete_bucket_policy", "update_bucket_policy_json", "refresh_inventory",
+}
+
+# kubectl tables carry relative ages ("5m", "2d3h") that change every minute
+# without the underlying resources changing; the AGE column is masked before
+# hashing. Only that column: "250m" in `kubectl top` output is CPU, not an age.
+_AGE_HEADER = re.compile(r"(?<!\S)AGE(?!\S)")
+_AGE_VALUE = re.compile(r"\d+[smhdy](\d+[smhd])?(?!\S)")
+
+
+def normalize_query(text: str) -> str:
+    text = re.sub(r"\s+", " ", (text or "").strip().lower())
+    return text.rstrip(" ?.!")
+
+
+def content_text(content) -> str:
+    """Flatten LangChain message/tool content (str or list of blocks) to text."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, (list, tuple)):
+        parts = []
+        for block in content:
+            if isinstance(block, dict):
+                parts.append(str(block.get("text", "")))
+            else:
+                parts.append(str(block))
+        return "\n".join(parts)
+    return str(content)
+
+
+def mask_ages(text: str) -> str:
+    """Replace values in the AGE column of kubectl tables with <age>.
+
+    kubectl pads columns, so a value starts at the offset of its header. A
+    blank line ends a table (``get all`` prints several).
+    """
+    lines = text.split("\n")
+    column = None
+    for i, line in enumerate(lines):
+        header = _AGE_HEADER.search(line)
+        if header and line == line.upper():
+            column = header.start()
+        elif not line.strip():
+            column = None
+        elif column is not None:
+            value = _AGE_VALUE.match(line, column)
+            if value and (column == 0 or line[column - 1] == " "):
+                lines[i] = line[:column] + "<age>" + line[value.end():]
+    return "\n".join(lines)
+
+
+def result_hash(content) -> str:
+    text = mask_ages(content_text(content))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def tool_results(messages):
+    """Pair tool calls with their results: [(name, args, result_hash), ...]."""
+    calls = {}
+    for message in messages:
+        for call in getattr(message, "tool_calls", None) or []:
+            calls[call["id"]] = call
+    results = []
+    for message in messages:
+        if getattr(message, "type", "") != "tool":
+            continue
+        call = calls.get(getattr(message, "tool_call_id", None))
+        if call is None:
+            continue
+        results.append((call["name"], call.get("args") or {}, result_hash(message.content)))
+    return results
+
+
+def conversation_key(messages, max_messages: int = CACHE_CONTEXT_MESSAGES) -> str:
+    """Hash of the last user/assistant messages before a question ("" when there are none).
+
+    Accepts chat rows ({"role", "content"}) as well as LangChain messages;
+    tool calls and tool results are skipped.
+    """
+    texts = []
+    for message in messages:
+        if isinstance(message, dict):
+            role, content = message.get("role"), message.get("content")
+        else:
+            role, content = getattr(message, "type", ""), getattr(message, "content", "")
+        role = {"human": "user", "ai": "assistant"}.get(role, role)
+        text = content_text(content).strip()
+        if role in ("user", "assistant") and text:
+            texts.append(f"{role}: {text}")
+    texts = texts[-max_messages:] if max_messages > 0 else texts
+    if not texts:
+        return ""
+    return hashlib.sha256("\n".join(texts).encode("utf-8")).hexdigest()[:16]
+
+
+class AnswerCache:
+    """LRU answer cache keyed by model, conversation context and normalized query.
+
+    Each entry stores a state fingerprint: the hashes of the results of every
+    read-only tool the answer relied on. An entry is only served after those
+    tools are re-run and return the same results, so answers follow the
+    cluster/bucket state without another LLM round trip.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query: str, model_name: str, context: str = "") -> tuple:
+        return (model_name, context, normalize_query(query))
+
+    def get(self, query: str, model_name: str, context: str = ""):
+        key = self.key(query, model_name, context)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry["created"] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, query: str, model_name: str, answer: str, fingerprint, context: str = ""):
+        key = self.key(query, model_name, context)
+        with self._lock:
+            self._entries[key] = {"answer": answer, "fingerprint": fingerprint, "created": time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, query: str, model_name: str, context: str = ""):
+        with self._lock:
+            self._entries.pop(self.key(query, model_name, context), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def record_outcome(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+_cache = AnswerCache()
+
+
+def get_answer_cache() -> AnswerCache:
+    return _cache
+
+
+async def lookup(query: str, model_name: str, tools, config=None, context: str = "") -> str | None:
+    """Return a cached answer if its state fingerprint still matches, else None.
+
+    ``config`` (e.g. callbacks) is passed to the validating tool calls.
+    ``context`` is the conversation_key() of the messages before the query.
+    """
+    if not CACHE_ENABLED:
+        return None
+    entry = _cache.get(query, model_name, context)
+    if entry is None:
+        _cache.record_outcome(False)
+        return None
+
+    tools_by_name = {t.name: t for t in tools}
+    fingerprint = entry["fingerprint"]
+    if any(name not in tools_by_name for name, _, _ in fingerprint):
+        _cache.invalidate(query, model_name, context)
+        _cache.record_outcome(False)
+        return None
+
+    try:
+        current = await asyncio.gather(
+            *(tools_by_name[name].ainvoke(args, config) for name, args, _ in fingerprint)
+        )
+    except Exception:
+        _cache.invalidate(query, model_name, context)
+        _cache.record_outcome(False)
+        return None
+
+    for (_, _, expected), result in zip(fingerprint, current):
+        if result_hash(result) != expected:
+            _cache.invalidate(query, model_name, context)
+            _cache.record_outcome(False)
+            return None
+
+    _cache.record_outcome(True)
+    return entry["answer"]
+
+
+def record(query: str, model_name: str, new_messages, answer: str, context: str = ""):
+    """Cache the answer of a completed run, or clear the cache if it mutated state."""
+    if not CACHE_ENABLED:
+        return
+    fingerprint = tool_results(new_messages)
+    if any(name in MUTATING_TOOLS for name, _, _ in fingerprint):
+        _cache.clear()
+        return
+    # Args are stored as JSON-safe copies so later validation re-runs the same calls
+    fingerprint = [(name, json.loads(json.dumps(args, default=str)), h) for name, args, h in fingerprint]
+    _cache.put(query, model_name, answer, fingerprint, context)
@@ -1,39 +1,253 @@
-import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
 from mcp.server.fastmcp import FastMCP
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
-import uvicorn
 import threading
+import hashlib
 import json
+import os
+import queue
+import re
 import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlencode
+
+import s3_inventory
+import tracing
+from health_probe import HealthProber, add_health_routes
+from mcp_serving import serve
 
 
 # --- Initialize MCP server for AWS S3 ---
 # Bind to 0.0.0.0 so other containers can reach it
 s3_mcp = FastMCP("AWS S3", host="0.0.0.0", port=8010)
+# Every tool call is a span, joined to the caller's trace via its traceparent header
+tracing.instrument_mcp(s3_mcp, "s3-mcp")
+
+# --- Shared S3 client pool (override via environment) ---
+# Creating a client resolves credentials, loads endpoint data and builds a new
+# connection pool, so clients are created once per (region, profile) and
+# reused by every tool. boto3 clients are thread-safe.
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "50"))
+S3_RETRY_MODE = os.getenv("S3_RETRY_MODE", "adaptive")  # legacy | standard | adaptive
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "5"))
+S3_CONNECT_TIMEOUT = float(os.getenv("S3_CONNECT_TIMEOUT", "5"))
+S3_READ_TIMEOUT = float(os.getenv("S3_READ_TIMEOUT", "60"))
+
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+_s3_client_metrics = {"created": 0, "reused": 0, "create_ms_total": 0.0, "create_ms_max": 0.0}
+
+
+def get_s3_client(region: str = None, profile: str = None):
+    """Return the shared S3 client for a region and credentials profile."""
+    key = (
+        region or os.getenv("AWS_REGION") or os.getenv("AWS_DEFAULT_REGION"),
+        profile or os.getenv("AWS_PROFILE"),
+    )
+    with _s3_clients_lock:
+        client = _s3_clients.get(key)
+        if client is not None:
+            _s3_client_metrics["reused"] += 1
+            return client
+
+        start = time.perf_counter()
+        # boto3 is imported by the first client, not at server startup
+        import boto3
+        from botocore.config import Config
+
+        session = boto3.session.Session(profile_name=key[1])
+        client = session.client(
+            "s3",
+            region_name=key[0],
+            config=Config(
+                max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                retries={"mode": S3_RETRY_MODE, "max_attempts": S3_MAX_ATTEMPTS},
+                connect_timeout=S3_CONNECT_TIMEOUT,
+                read_timeout=S3_READ_TIMEOUT,
+            ),
+        )
+        # One span per API call made inside a traced tool call (retries included)
+        tracing.instrument_botocore(client, "s3-mcp")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        _s3_client_metrics["created"] += 1
+        _s3_client_metrics["create_ms_total"] += elapsed_ms
+        _s3_client_metrics["create_ms_max"] = max(_s3_client_metrics["create_ms_max"], elapsed_ms)
+        _s3_clients[key] = client
+        return client
+
+
+def s3_client_stats() -> dict:
+    with _s3_clients_lock:
+        stats = dict(_s3_client_metrics)
+        stats["clients"] = [{"region": region, "profile": profile} for region, profile in _s3_clients]
+    calls = stats["created"] + stats["reused"]
+    # Average creation cost spread over every get_s3_client() call
+    stats["create_ms_per_call"] = stats["create_ms_total"] / calls if calls else 0.0
+    stats["max_pool_connections"] = S3_MAX_POOL_CONNECTIONS
+    stats["retry_mode"] = S3_RETRY_MODE
+    return stats
+
 
 # --- FastAPI app for health ---
+# S3 reachability is probed in the background; the routes serve cached results
 s3_health_app = FastAPI()
 
-@s3_health_app.get("/health")
-def health_check():
-    try:
-        s3 = boto3.client("s3")
-        s3.list_buckets()
-        return JSONResponse(content={"status": "ok"})
-    except ClientError as e:
-        return JSONResponse(content={"status": "error", "detail": str(e)}, status_code=500)
 
+def check_s3():
+    get_s3_client().list_buckets()
+
+
+s3_prober = HealthProber({"s3": check_s3}, critical=["s3"])
+add_health_routes(s3_health_app, s3_prober)
+
+
+@s3_health_app.get("/metrics")
+def metrics():
+    return JSONResponse(content={"s3_clients": s3_client_stats()})
+
+
+# --- Utility functions ---
+MB = 1024 * 1024
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if size < 1024 or unit == "TB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+# --- Utility function: parallel bucket emptying ---
+# One producer lists every object version and delete marker (plain objects of
+# unversioned buckets come back with VersionId "null") into a bounded queue;
+# worker threads delete them in batches of up to 1000 keys, the DeleteObjects
+# maximum. Keys that fail inside a batch are retried with backoff.
+S3_DELETE_WORKERS = int(os.getenv("S3_DELETE_WORKERS", "8"))
+DELETE_BATCH_SIZE = 1000
+DELETE_MAX_RETRIES = 3
 
-# --- Utility function: paginated delete objects ---
-def delete_all_objects(s3, bucket_name):
-    paginator = s3.get_paginator('list_objects_v2')
-    for page in paginator.paginate(Bucket=bucket_name):
-        objects = page.get("Contents", [])
-        if objects:
-            delete_keys = [{"Key": obj["Key"]} for obj in objects]
-            s3.delete_objects(Bucket=bucket_name, Delete={"Objects": delete_keys})
+
+def iter_version_batches(s3, bucket_name: str, prefix: str = "", batch_size: int = DELETE_BATCH_SIZE):
+    """Yield lists of {"Key", "VersionId", "Size"} covering every version and delete marker."""
+    batch = []
+    paginator = s3.get_paginator("list_object_versions")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for item in page.get("Versions", []) + page.get("DeleteMarkers", []):
+            batch.append({"Key": item["Key"], "VersionId": item["VersionId"], "Size": item.get("Size", 0)})
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _delete_batch(s3, bucket_name: str, batch):
+    """Delete one batch, retrying failed keys; return the keys that still failed.
+
+    Items without a VersionId delete the current version of the key.
+    """
+    pending = [{k: item[k] for k in ("Key", "VersionId") if item.get(k)} for item in batch]
+    errors = []
+    for attempt in range(DELETE_MAX_RETRIES + 1):
+        try:
+            response = s3.delete_objects(Bucket=bucket_name, Delete={"Objects": pending, "Quiet": True})
+            errors = response.get("Errors", [])
+        except (ClientError, BotoCoreError) as e:
+            errors = [{**item, "Message": str(e)} for item in pending]
+        if not errors or attempt == DELETE_MAX_RETRIES:
+            return errors
+        failed = {(e["Key"], e.get("VersionId")) for e in errors}
+        pending = [item for item in pending if (item["Key"], item.get("VersionId")) in failed]
+        time.sleep(0.2 * 2 ** attempt)
+    return errors
+
+
+def empty_bucket_parallel(s3, bucket_name: str, prefix: str = "", workers: int = S3_DELETE_WORKERS,
+                          dry_run: bool = False, progress_every: float = 5.0) -> dict:
+    """Delete every object version and delete marker under `prefix`.
+
+    With dry_run=True nothing is deleted; the versions are only counted.
+    Returns counts, failed keys (first 20) and deletes per second.
+    """
+    stats = {"listed": 0, "bytes": 0, "deleted": 0, "failed": 0, "errors": []}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    last_report = [start]
+
+    def report(force=False):
+        now = time.perf_counter()
+        if force or now - last_report[0] >= progress_every:
+            last_report[0] = now
+            print(
+                f"🗑️  {bucket_name}: {stats['deleted']}/{stats['listed']} deleted, "
+                f"{stats['failed']} failed ({stats['deleted'] / (now - start):.0f}/s)"
+            )
+
+    if dry_run:
+        for batch in iter_version_batches(s3, bucket_name, prefix):
+            stats["listed"] += len(batch)
+            stats["bytes"] += sum(item["Size"] for item in batch)
+    else:
+        batches = queue.Queue(maxsize=workers * 2)
+        producer_error = []
+
+        def produce():
+            try:
+                for batch in iter_version_batches(s3, bucket_name, prefix):
+                    with lock:
+                        stats["listed"] += len(batch)
+                        stats["bytes"] += sum(item["Size"] for item in batch)
+                    batches.put(batch)
+            except Exception as e:
+                producer_error.append(e)
+            finally:
+                for _ in range(workers):
+                    batches.put(None)
+
+        def consume():
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    return
+                try:
+                    errors = _delete_batch(s3, bucket_name, batch)
+                except Exception as e:
+                    # Keep draining the queue, or the lister blocks on it once every deleter is gone
+                    errors = [{"Key": item["Key"], "Message": str(e)} for item in batch]
+                with lock:
+                    stats["deleted"] += len(batch) - len(errors)
+                    stats["failed"] += len(errors)
+                    stats["errors"].extend(errors[:20 - len(stats["errors"])])
+                    report()
+
+        threads = [threading.Thread(target=produce, name="s3-empty-lister")]
+        threads += [threading.Thread(target=consume, name=f"s3-empty-deleter-{i}") for i in range(workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        report(force=True)
+        if producer_error:
+            raise producer_error[0]
+
+    elapsed = time.perf_counter() - start
+    stats["elapsed_s"] = elapsed
+    stats["deletes_per_s"] = stats["deleted"] / elapsed if elapsed else 0.0
+    return stats
+
+
+def format_empty_stats(bucket_name: str, stats: dict) -> str:
+    text = (
+        f"{stats['deleted']} of {stats['listed']} object versions/delete markers "
+        f"({format_bytes(stats['bytes'])}) deleted from '{bucket_name}' in {stats['elapsed_s']:.1f}s "
+        f"({stats['deletes_per_s']:.0f}/s)."
+    )
+    if stats["failed"]:
+        failed = ", ".join(f"{e['Key']} ({e.get('Code') or e.get('Message', '')})" for e in stats["errors"])
+        text += f" {stats['failed']} failed: {failed}"
+    return text
 
 # --- S3 Bucket Operations ---
 
@@ -43,7 +257,7 @@ def delete_all_objects(s3, bucket_name):
 )
 def create_bucket_advanced(bucket_name: str, region: str = "us-east-1", enable_versioning: bool = False) -> str:
     try:
-        s3 = boto3.client("s3", region_name=region)
+        s3 = get_s3_client(region)
         if region == "us-east-1":
             s3.create_bucket(Bucket=bucket_name)
         else:
@@ -66,11 +280,11 @@ def create_bucket_advanced(bucket_name: str, region: str = "us-east-1", enable_v
     description="Delete an S3 bucket. If not empty, ask for confirmation before deleting all objects."
 )
 def delete_bucket_interactive(bucket_name: str, confirm: str = "no") -> str:
-    s3 = boto3.client("s3")
+    s3 = get_s3_client()
     try:
-        # Check if bucket has objects
-        response = s3.list_objects_v2(Bucket=bucket_name, MaxKeys=1)
-        objects_exist = response.get("KeyCount", 0) > 0
+        # Check if bucket has objects, object versions or delete markers
+        response = s3.list_object_versions(Bucket=bucket_name, MaxKeys=1)
+        objects_exist = bool(response.get("Versions") or response.get("DeleteMarkers"))
 
         if objects_exist and confirm.lower() != "yes":
             return (
@@ -78,9 +292,11 @@ def delete_bucket_interactive(bucket_name: str, confirm: str = "no") -> str:
                 "Pass confirm='yes' to delete all objects and the bucket."
             )
 
-        # Delete all objects if bucket not empty
+        # Delete all objects (every version) if bucket not empty
         if objects_exist:
-            delete_all_objects(s3, bucket_name)
+            stats = empty_bucket_parallel(s3, bucket_name)
+            if stats["failed"]:
+                return f"Error: bucket not deleted. {format_empty_stats(bucket_name, stats)}"
 
         # Delete the bucket
         s3.delete_bucket(Bucket=bucket_name)
@@ -88,10 +304,30 @@ def delete_bucket_interactive(bucket_name: str, confirm: str = "no") -> str:
     except ClientError as e:
         return f"Error: {e}"
 
+
+@s3_mcp.tool(
+    name="empty_bucket",
+    description=(
+        "Delete every object, object version and delete marker in a bucket (optionally only under a prefix). "
+        "Runs as a dry run that only counts them unless dry_run=False."
+    ),
+)
+def empty_bucket(bucket_name: str, prefix: str = "", dry_run: bool = True) -> str:
+    try:
+        stats = empty_bucket_parallel(get_s3_client(), bucket_name, prefix, dry_run=dry_run)
+        if dry_run:
+            return (
+                f"Dry run: {stats['listed']} object versions/delete markers ({format_bytes(stats['bytes'])}) "
+                f"under '{prefix or '/'}' in '{bucket_name}' would be deleted. Pass dry_run=False to delete them."
+            )
+        return format_empty_stats(bucket_name, stats)
+    except ClientError as e:
+        return f"Error: {e}"
+
 @s3_mcp.tool(name="list_buckets", description="List all S3 buckets")
 def list_buckets() -> str:
     try:
-        s3 = boto3.client("s3")
+        s3 = get_s3_client()
         response = s3.list_buckets()
         buckets = [b["Name"] for b in response.get("Buckets", [])]
         return "\n".join(buckets) if buckets else "No buckets found."
@@ -101,7 +337,7 @@ def list_buckets() -> str:
 @s3_mcp.tool(name="get_bucket_location", description="Get the AWS region of a bucket")
 def get_bucket_location(bucket_name: str) -> str:
     try:
-        s3 = boto3.client("s3")
+        s3 = get_s3_client()
         loc = s3.get_bucket_location(Bucket=bucket_name)
         region = loc.get("LocationConstraint") or "us-east-1"
         return f"Bucket '{bucket_name}' is in region '{region}'."
@@ -111,7 +347,7 @@ def get_bucket_location(bucket_name: str) -> str:
 @s3_mcp.tool(name="set_bucket_versioning", description="Enable or suspend versioning for a bucket")
 def set_bucket_versioning(bucket_name: str, status: str) -> str:
     try:
-        s3 = boto3.client("s3")
+        s3 = get_s3_client()
         s3.put_bucket_versioning(Bucket=bucket_name, VersioningConfiguration={"Status": status})
         return f"Bucket '{bucket_name}' versioning set to '{status}'."
     except ClientError as e:
@@ -119,25 +355,80 @@ def set_bucket_versioning(bucket_name: str, status: str) -> str:
 
 # --- S3 Object Operations ---
 
-@s3_mcp.tool(name="list_objects", description="List objects in a bucket with optional prefix")
-def list_objects(bucket_name: str, prefix: str = "") -> str:
+def summarize_prefixes(s3, bucket_name: str, prefix: str = "", delimiter: str = "/"):
+    """Count objects and bytes per first-level group under `prefix` in one streaming pass.
+
+    Returns ({group: [count, bytes]}, total_count, total_bytes). Only the
+    running totals are kept in memory, never the keys themselves.
+    """
+    groups = {}
+    total_count = total_bytes = 0
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            rest = obj["Key"][len(prefix):]
+            cut = rest.find(delimiter) if delimiter else -1
+            group = prefix + rest[:cut + len(delimiter)] if cut >= 0 else "(objects at this level)"
+            entry = groups.setdefault(group, [0, 0])
+            entry[0] += 1
+            entry[1] += obj["Size"]
+            total_count += 1
+            total_bytes += obj["Size"]
+    return groups, total_count, total_bytes
+
+
+@s3_mcp.tool(
+    name="list_objects",
+    description=(
+        "List one page of objects in a bucket with optional prefix. Use delimiter='/' for folder-style "
+        "listing (sub-folders are shown as prefixes) and pass the returned continuation_token to get the "
+        "next page. summarize=True returns object count and total size per sub-folder instead of keys."
+    ),
+)
+def list_objects(
+    bucket_name: str,
+    prefix: str = "",
+    max_keys: int = 200,
+    continuation_token: str = "",
+    delimiter: str = "",
+    summarize: bool = False,
+) -> str:
     try:
-        s3 = boto3.client("s3")
-        paginator = s3.get_paginator('list_objects_v2')
-        all_objects = []
-        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
-            all_objects.extend([obj["Key"] for obj in page.get("Contents", [])])
-        if not all_objects:
+        s3 = get_s3_client()
+        if summarize:
+            groups, total_count, total_bytes = summarize_prefixes(s3, bucket_name, prefix, delimiter or "/")
+            if not total_count:
+                return f"No objects found in bucket '{bucket_name}' with prefix '{prefix}'."
+            lines = [f"{total_count} objects, {format_bytes(total_bytes)} under '{prefix or '/'}':"]
+            ranked = sorted(groups.items(), key=lambda item: item[1][1], reverse=True)
+            for group, (count, size) in ranked[:max_keys]:
+                lines.append(f"{group}\t{count} objects\t{format_bytes(size)}")
+            if len(ranked) > max_keys:
+                lines.append(f"... {len(ranked) - max_keys} more prefixes")
+            return "\n".join(lines)
+
+        params = {"Bucket": bucket_name, "Prefix": prefix, "MaxKeys": max(1, min(max_keys, 1000))}
+        if continuation_token:
+            params["ContinuationToken"] = continuation_token
+        if delimiter:
+            params["Delimiter"] = delimiter
+        page = s3.list_objects_v2(**params)
+
+        lines = [f"{p['Prefix']} (prefix)" for p in page.get("CommonPrefixes", [])]
+        lines.extend(f"{obj['Key']}\t{format_bytes(obj['Size'])}" for obj in page.get("Contents", []))
+        if not lines:
             return f"No objects found in bucket '{bucket_name}' with prefix '{prefix}'."
-        return "\n".join(all_objects)
+        if page.get("IsTruncated"):
+            lines.append(f"More results: continuation_token='{page['NextContinuationToken']}'")
+        return "\n".join(lines)
     except ClientError as e:
         return f"Error: {e}"
 
 @s3_mcp.tool(name="upload_file", description="Upload a file to a bucket")
 def upload_file(bucket_name: str, file_path: str, s3_key: str) -> str:
     try:
-        s3 = boto3.client("s3")
-        s3.upload_file(file_path, bucket_name, s3_key)
+        s3 = get_s3_client()
+        s3.upload_file(file_path, bucket_name, s3_key, Config=transfer_config())
         return f"File '{file_path}' uploaded to '{bucket_name}/{s3_key}'."
     except ClientError as e:
         return f"Error: {e}"
@@ -145,8 +436,8 @@ def upload_file(bucket_name: str, file_path: str, s3_key: str) -> str:
 @s3_mcp.tool(name="download_file", description="Download a file from a bucket")
 def download_file(bucket_name: str, s3_key: str, local_path: str) -> str:
     try:
-        s3 = boto3.client("s3")
-        s3.download_file(bucket_name, s3_key, local_path)
+        s3 = get_s3_client()
+        s3.download_file(bucket_name, s3_key, local_path, Config=transfer_config())
         return f"File '{bucket_name}/{s3_key}' downloaded to '{local_path}'."
     except ClientError as e:
         return f"Error: {e}"
@@ -154,17 +445,664 @@ def download_file(bucket_name: str, s3_key: str, local_path: str) -> str:
 @s3_mcp.tool(name="delete_object", description="Delete an object from a bucket")
 def delete_object(bucket_name: str, s3_key: str) -> str:
     try:
-        s3 = boto3.client("s3")
+        s3 = get_s3_client()
         s3.delete_object(Bucket=bucket_name, Key=s3_key)
         return f"Deleted object '{s3_key}' from bucket '{bucket_name}'."
     except ClientError as e:
         return f"Error: {e}"
 
+# --- Object preview ---
+# Objects are read with ranged GETs of S3_PREVIEW_CHUNK_KB, gzip is
+# decompressed as it streams, and reading stops as soon as the output cap (or
+# the grep match limit) is reached, so only the bytes needed are fetched.
+S3_PREVIEW_CHUNK_KB = int(os.getenv("S3_PREVIEW_CHUNK_KB", "1024"))
+S3_PREVIEW_MAX_OUTPUT_KB = int(os.getenv("S3_PREVIEW_MAX_OUTPUT_KB", "16"))
+# Hard ceiling for the max_bytes argument of preview_object
+S3_PREVIEW_MAX_BYTES_KB = int(os.getenv("S3_PREVIEW_MAX_BYTES_KB", "1024"))
+S3_GREP_MAX_SCAN_MB = int(os.getenv("S3_GREP_MAX_SCAN_MB", "1024"))
+# Longer lines are matched and shown only up to this many bytes
+S3_GREP_MAX_LINE_KB = int(os.getenv("S3_GREP_MAX_LINE_KB", "64"))
+
+
+def iter_object_range(s3, bucket_name: str, key: str, start: int, end: int, chunk_size: int):
+    """Yield the bytes [start, end) of an object, one ranged GET per chunk."""
+    for offset in range(start, end, chunk_size):
+        last = min(offset + chunk_size, end) - 1
+        yield s3.get_object(Bucket=bucket_name, Key=key, Range=f"bytes={offset}-{last}")["Body"].read()
+
+
+def iter_decompressed(chunks, max_piece: int = S3_PREVIEW_CHUNK_KB * 1024):
+    """Stream-decompress gzip chunks (concatenated members included), at most `max_piece` bytes at a time."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        while chunk:
+            # max_length bounds the output of highly compressible input; the
+            # rest of the input waits in unconsumed_tail
+            piece = decompressor.decompress(chunk, max_piece)
+            if piece:
+                yield piece
+            if decompressor.eof:
+                # Next gzip member starts in the unused data
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                chunk = decompressor.unconsumed_tail
+
+
+def grep_chunks(chunks, pattern, max_output: int, max_line: int = S3_GREP_MAX_LINE_KB * 1024):
+    """Matching lines of a chunk stream as (line number, text); stops once `max_output` bytes are collected.
+
+    Lines are cut at `max_line` bytes (the rest of the line is skipped, not
+    buffered) and the last match is cut to what is left of `max_output`.
+    """
+    matches, line_no, budget = [], 0, max_output
+    partial, clipped = bytearray(), False
+
+    def check(line: bytes, clipped: bool) -> bool:
+        nonlocal budget
+        text = line.decode("utf-8", errors="replace")
+        if not pattern.search(text):
+            return False
+        shown = line[:budget]
+        if len(shown) < len(line):
+            text = shown.decode("utf-8", errors="replace")
+        if clipped or len(shown) < len(line):
+            text += " [line truncated]"
+        matches.append((line_no, text))
+        budget -= len(shown) + 1
+        return budget <= 0
+
+    for chunk in chunks:
+        pos = 0
+        while True:
+            newline = chunk.find(b"\n", pos)
+            piece = chunk[pos:] if newline < 0 else chunk[pos:newline]
+            room = max_line - len(partial)
+            if len(piece) > room:
+                piece, clipped = piece[:room], True
+            partial += piece
+            if newline < 0:
+                break
+            line_no += 1
+            if check(bytes(partial), clipped):
+                return matches, True
+            partial.clear()
+            clipped = False
+            pos = newline + 1
+    if partial:
+        line_no += 1
+        return matches, check(bytes(partial), clipped)
+    return matches, False
+
+
+@s3_mcp.tool(
+    name="preview_object",
+    description=(
+        "Show the beginning (mode='head') or end (mode='tail') of an object without downloading it, or search "
+        "it line by line with a regular expression (grep). gzip objects are decompressed on the fly."
+    ),
+)
+def preview_object(
+    bucket_name: str,
+    s3_key: str,
+    mode: str = "head",
+    grep: str = "",
+    ignore_case: bool = False,
+    max_bytes: int = S3_PREVIEW_MAX_OUTPUT_KB * 1024,
+) -> str:
+    max_bytes = max(1, min(max_bytes, S3_PREVIEW_MAX_BYTES_KB * 1024))
+    try:
+        s3 = get_s3_client()
+        head = s3.head_object(Bucket=bucket_name, Key=s3_key)
+        size = head["ContentLength"]
+        gzipped = s3_key.endswith(".gz") or head.get("ContentEncoding") == "gzip"
+        chunk_size = S3_PREVIEW_CHUNK_KB * 1024
+        content_type = head.get("ContentType", "unknown type")
+        info = f"{s3_key} ({format_bytes(size)}{', gzip' if gzipped else ''}, {content_type})"
+        if not size:
+            return f"{info}: empty object."
+        started = time.perf_counter()
+
+        if grep:
+            try:
+                pattern = re.compile(grep, re.IGNORECASE if ignore_case else 0)
+            except re.error as e:
+                return f"Invalid regular expression: {e}"
+            # Chunks are fetched lazily, so stopping the scan stops the GETs
+            chunks = iter_object_range(s3, bucket_name, s3_key, 0, size, chunk_size)
+            if gzipped:
+                chunks = iter_decompressed(chunks)
+            scanned = [0]
+            scan_limit = S3_GREP_MAX_SCAN_MB * MB
+
+            def counted(stream):
+                for chunk in stream:
+                    if scanned[0] >= scan_limit:
+                        return
+                    scanned[0] += len(chunk)
+                    yield chunk
+
+            matches, capped = grep_chunks(counted(chunks), pattern, max_bytes)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            lines = [f"{n}: {text}" for n, text in matches]
+            if capped:
+                note = f"stopped after {max_bytes} bytes of matches"
+            elif scanned[0] >= scan_limit:
+                note = f"scan limit of {S3_GREP_MAX_SCAN_MB} MB reached"
+            else:
+                note = "whole object scanned"
+            header = (
+                f"{info}: {len(matches)} matching lines for /{grep}/ "
+                f"({format_bytes(scanned[0])} scanned in {elapsed_ms:.0f} ms, {note})"
+            )
+            return "\n".join([header] + lines) if lines else header
+
+        if mode == "tail":
+            if gzipped:
+                return f"{info}: tail is not available for gzip objects; use mode='head' or grep."
+            data = s3.get_object(Bucket=bucket_name, Key=s3_key, Range=f"bytes=-{max_bytes}")["Body"].read()
+            text = data.decode("utf-8", errors="replace")
+            if len(data) < size:
+                text = text.split("\n", 1)[-1]  # drop the partial first line
+        else:
+            if gzipped:
+                out = bytearray()
+                for piece in iter_decompressed(iter_object_range(s3, bucket_name, s3_key, 0, size, chunk_size)):
+                    out.extend(piece)
+                    if len(out) >= max_bytes:
+                        break
+                data = bytes(out[:max_bytes])
+            else:
+                data = s3.get_object(Bucket=bucket_name, Key=s3_key, Range=f"bytes=0-{max_bytes - 1}")["Body"].read()
+            if b"\0" in data[:4096]:
+                return f"{info}: binary content, no preview."
+            text = data.decode("utf-8", errors="replace")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        return f"{info}, {mode} {format_bytes(len(text.encode('utf-8')))} in {elapsed_ms:.0f} ms:\n{text}"
+    except zlib.error as e:
+        return f"Error: not valid gzip data ({e})"
+    except ClientError as e:
+        return f"Error: {e}"
+
+
+# --- Server-side copy / move ---
+# Objects are copied inside S3 (no data passes through this server): CopyObject
+# up to 5 GB, multipart UploadPartCopy above. A listing thread feeds a bounded
+# queue drained by S3_COPY_WORKERS threads. Each copy is verified (ETag for
+# single-part sources, size otherwise) before a move deletes the source.
+S3_COPY_WORKERS = int(os.getenv("S3_COPY_WORKERS", "16"))
+S3_COPY_PART_MB = int(os.getenv("S3_COPY_PART_MB", "512"))
+COPY_OBJECT_MAX_BYTES = 5 * 1024 ** 3
+# Preserved on multipart copies (CopyObject keeps them with MetadataDirective=COPY)
+COPY_HEADERS = ("ContentType", "CacheControl", "ContentDisposition", "ContentEncoding", "ContentLanguage",
+                "Expires", "StorageClass", "ServerSideEncryption", "SSEKMSKeyId")
+
+
+def _multipart_copy(s3, source: dict, size: int, dst_bucket: str, dst_key: str) -> str:
+    head = s3.head_object(**source)
+    extra = {k: head[k] for k in COPY_HEADERS if head.get(k)}
+    # UploadPartCopy does not carry tags over (CopyObject does with TaggingDirective=COPY)
+    tags = s3.get_object_tagging(**source).get("TagSet", [])
+    if tags:
+        extra["Tagging"] = urlencode([(t["Key"], t["Value"]) for t in tags])
+    upload = s3.create_multipart_upload(Bucket=dst_bucket, Key=dst_key, Metadata=head.get("Metadata", {}), **extra)
+    part_size = S3_COPY_PART_MB * MB
+    parts = []
+    try:
+        for number, offset in enumerate(range(0, size, part_size), start=1):
+            end = min(offset + part_size, size) - 1
+            part = s3.upload_part_copy(
+                Bucket=dst_bucket, Key=dst_key, UploadId=upload["UploadId"], PartNumber=number,
+                CopySource=source, CopySourceRange=f"bytes={offset}-{end}",
+            )
+            parts.append({"PartNumber": number, "ETag": part["CopyPartResult"]["ETag"]})
+        result = s3.complete_multipart_upload(
+            Bucket=dst_bucket, Key=dst_key, UploadId=upload["UploadId"], MultipartUpload={"Parts": parts}
+        )
+    except BaseException:
+        # Any failure (connection errors, interrupts included) must not leave billed parts behind
+        s3.abort_multipart_upload(Bucket=dst_bucket, Key=dst_key, UploadId=upload["UploadId"])
+        raise
+    return result["ETag"]
+
+
+def copy_object_verified(s3, src_bucket: str, key: str, size: int, etag: str, dst_bucket: str, dst_key: str):
+    """Server-side copy of one object; raises ValueError if the copy does not match the source."""
+    source = {"Bucket": src_bucket, "Key": key}
+    if size > COPY_OBJECT_MAX_BYTES:
+        _multipart_copy(s3, source, size, dst_bucket, dst_key)
+    else:
+        result = s3.copy_object(
+            Bucket=dst_bucket, Key=dst_key, CopySource=source, MetadataDirective="COPY", TaggingDirective="COPY"
+        )
+        # A single-part source keeps its MD5 ETag, so the result proves the content matches
+        if "-" not in etag and result["CopyObjectResult"]["ETag"] == etag:
+            return
+    copied_size = s3.head_object(Bucket=dst_bucket, Key=dst_key)["ContentLength"]
+    if copied_size != size:
+        raise ValueError(f"size mismatch after copy ({copied_size} != {size} bytes)")
+
+
+def copy_prefix_parallel(s3, src_bucket: str, src_prefix: str, dst_bucket: str, dst_prefix: str,
+                         move: bool = False, workers: int = S3_COPY_WORKERS) -> dict:
+    """Copy (or move) every object under src_prefix to dst_prefix; returns counts and throughput."""
+    stats = {"listed": 0, "copied": 0, "bytes": 0, "deleted": 0, "failed": []}
+    lock = threading.Lock()
+    items = queue.Queue(maxsize=workers * 4)
+    to_delete = []
+    producer_error = []
+    start = time.perf_counter()
+
+    def produce():
+        try:
+            for page in s3.get_paginator("list_objects_v2").paginate(Bucket=src_bucket, Prefix=src_prefix):
+                for obj in page.get("Contents", []):
+                    with lock:
+                        stats["listed"] += 1
+                    items.put((obj["Key"], obj["Size"], obj["ETag"].strip('"')))
+        except Exception as e:
+            producer_error.append(e)
+        finally:
+            for _ in range(workers):
+                items.put(None)
+
+    def delete_sources(batch):
+        errors = _delete_batch(s3, src_bucket, [{"Key": key} for key in batch])
+        with lock:
+            stats["deleted"] += len(batch) - len(errors)
+            stats["failed"].extend(f"{e['Key']}: copied but not deleted ({e.get('Message', '')})" for e in errors)
+
+    def consume():
+        while True:
+            item = items.get()
+            if item is None:
+                return
+            key, size, etag = item
+            try:
+                copy_object_verified(s3, src_bucket, key, size, etag, dst_bucket, dst_prefix + key[len(src_prefix):])
+            except Exception as e:
+                # Record the key and keep consuming, or the lister blocks once every worker is gone
+                with lock:
+                    stats["failed"].append(f"{key}: {e}")
+                continue
+            batch = None
+            with lock:
+                stats["copied"] += 1
+                stats["bytes"] += size
+                if move:
+                    to_delete.append(key)
+                    if len(to_delete) >= DELETE_BATCH_SIZE:
+                        batch = to_delete[:]
+                        to_delete.clear()
+            if batch:
+                delete_sources(batch)
+
+    threads = [threading.Thread(target=produce, name="s3-copy-lister")]
+    threads += [threading.Thread(target=consume, name=f"s3-copy-{i}") for i in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if to_delete:
+        delete_sources(to_delete)
+    if producer_error:
+        raise producer_error[0]
+
+    elapsed = time.perf_counter() - start
+    stats["elapsed_s"] = elapsed
+    stats["objects_per_s"] = stats["copied"] / elapsed if elapsed else 0.0
+    stats["bytes_per_s"] = stats["bytes"] / elapsed if elapsed else 0.0
+    return stats
+
+
+def _copy_prefix_tool(src_bucket: str, src_prefix: str, dst_bucket: str, dst_prefix: str, move: bool) -> str:
+    dst_bucket = dst_bucket or src_bucket
+    # Prefixes are folders: "logs" copies logs/..., not logs-archive/...
+    src_prefix = src_prefix.rstrip("/") + "/" if src_prefix else ""
+    dst_prefix = dst_prefix.rstrip("/") + "/" if dst_prefix else ""
+    if src_bucket == dst_bucket and dst_prefix.startswith(src_prefix):
+        return "Error: the destination prefix must not be inside the source prefix in the same bucket."
+    try:
+        stats = copy_prefix_parallel(get_s3_client(), src_bucket, src_prefix, dst_bucket, dst_prefix, move=move)
+    except (ClientError, BotoCoreError) as e:
+        return f"Error: {e}"
+    if not stats["listed"]:
+        return f"No objects found in bucket '{src_bucket}' with prefix '{src_prefix}'."
+    verb = "moved" if move else "copied"
+    text = (
+        f"{stats['copied']} of {stats['listed']} objects ({format_bytes(stats['bytes'])}) {verb} from "
+        f"'{src_bucket}/{src_prefix}' to '{dst_bucket}/{dst_prefix}' in {stats['elapsed_s']:.1f}s "
+        f"({stats['objects_per_s']:.0f} objects/s, {format_bytes(stats['bytes_per_s'])}/s)."
+    )
+    if stats["failed"]:
+        text += f" {len(stats['failed'])} failed: " + "; ".join(stats["failed"][:10])
+    return text
+
+
+@s3_mcp.tool(
+    name="copy_prefix",
+    description=(
+        "Copy all objects under a prefix to another prefix and/or bucket, server-side, keeping metadata. "
+        "dst_bucket defaults to the source bucket."
+    ),
+)
+def copy_prefix(src_bucket: str, src_prefix: str, dst_prefix: str, dst_bucket: str = "") -> str:
+    return _copy_prefix_tool(src_bucket, src_prefix, dst_bucket, dst_prefix, move=False)
+
+
+@s3_mcp.tool(
+    name="move_prefix",
+    description=(
+        "Move all objects under a prefix to another prefix and/or bucket: server-side copy, verify, then "
+        "delete the source objects. dst_bucket defaults to the source bucket."
+    ),
+)
+def move_prefix(src_bucket: str, src_prefix: str, dst_prefix: str, dst_bucket: str = "") -> str:
+    return _copy_prefix_tool(src_bucket, src_prefix, dst_bucket, dst_prefix, move=True)
+
+
+# --- Directory sync ---
+# Files are compared by size, then modification time, then ETag (computed
+# locally, including the "<md5 of part md5s>-<parts>" form of multipart
+# uploads), and only changed files are transferred, several at a time.
+# Downloads go to a temporary file that is renamed into place and stamped with
+# the object's LastModified, so an interrupted sync resumes by running it again:
+# completed files are skipped by the diff.
+S3_SYNC_WORKERS = int(os.getenv("S3_SYNC_WORKERS", "8"))
+S3_MULTIPART_THRESHOLD_MB = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8"))
+S3_MULTIPART_CHUNK_MB = int(os.getenv("S3_MULTIPART_CHUNK_MB", "8"))
+S3_TRANSFER_CONCURRENCY = int(os.getenv("S3_TRANSFER_CONCURRENCY", "4"))  # parts in flight per file
+
+_transfer_config = None
+
+
+def transfer_config():
+    """TransferConfig for upload_file/download_file (created on first use)."""
+    global _transfer_config
+    if _transfer_config is None:
+        from boto3.s3.transfer import TransferConfig
+
+        _transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD_MB * MB,
+            multipart_chunksize=S3_MULTIPART_CHUNK_MB * MB,
+            max_concurrency=S3_TRANSFER_CONCURRENCY,
+            use_threads=True,
+        )
+    return _transfer_config
+
+
+SYNC_TMP_SUFFIX = ".s3sync.tmp"
+
+
+def _file_md5s(path: str, chunk_size: int):
+    """MD5 digests of consecutive `chunk_size` chunks of a file."""
+    digests = []
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digests.append(hashlib.md5(chunk).digest())
+    return digests
+
+
+def local_etag(path: str, chunk_size: int = 0) -> str:
+    """ETag S3 would report for this file uploaded in `chunk_size` parts (0 = single PUT)."""
+    if not chunk_size:
+        md5 = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(MB), b""):
+                md5.update(chunk)
+        return md5.hexdigest()
+    digests = _file_md5s(path, chunk_size)
+    return f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
+
+def etag_matches(path: str, size: int, etag: str) -> bool:
+    etag = etag.strip('"')
+    if "-" not in etag:
+        return local_etag(path) == etag
+    # The part size is not recorded in the ETag: try ours, the smallest MB
+    # multiple giving that many parts, and common client defaults
+    parts = int(etag.split("-")[1])
+    candidates = [S3_MULTIPART_CHUNK_MB * MB, -(-size // parts // MB) * MB, 8 * MB, 16 * MB, 5 * MB, 64 * MB]
+    for chunk_size in dict.fromkeys(candidates):
+        if chunk_size and -(-size // chunk_size) == parts and local_etag(path, chunk_size) == etag:
+            return True
+    return False
+
+
+def list_local_files(root: str):
+    """{relative posix path: (size, mtime)} of regular files under `root`."""
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith(SYNC_TMP_SUFFIX):
+                continue
+            path = os.path.join(dirpath, name)
+            st = os.stat(path)
+            files[os.path.relpath(path, root).replace(os.sep, "/")] = (st.st_size, st.st_mtime)
+    return files
+
+
+def list_remote_objects(s3, bucket_name: str, prefix: str):
+    """{key relative to prefix: (size, last_modified epoch, etag)}, folder markers excluded."""
+    objects = {}
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            rel = obj["Key"][len(prefix):].lstrip("/")
+            if rel and not obj["Key"].endswith("/"):
+                objects[rel] = (obj["Size"], obj["LastModified"].timestamp(), obj["ETag"])
+    return objects
+
+
+def _needs_transfer(src, dst, local_path: str) -> bool:
+    """Compare source and destination (size, mtime[, etag]); the ETag is only hashed when needed.
+
+    Exactly one side is remote and carries the ETag; `local_path` is the local file.
+    """
+    if dst is None or src[0] != dst[0]:
+        return True
+    if src[1] <= dst[1]:
+        return False
+    etag = src[2] if len(src) > 2 else dst[2]
+    return not etag_matches(local_path, src[0], etag)
+
+
+def run_transfers(jobs, transfer, workers: int = S3_SYNC_WORKERS) -> dict:
+    """Run transfer(rel, size) for every (rel, size) job in a thread pool; collect throughput stats."""
+    stats = {"transferred": 0, "bytes": 0, "failed": []}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(transfer, rel, size): (rel, size) for rel, size in jobs}
+        for future in as_completed(futures):
+            rel, size = futures[future]
+            try:
+                future.result()
+                stats["transferred"] += 1
+                stats["bytes"] += size
+            except Exception as e:
+                # S3UploadFailedError, connection drops, local I/O: report the file and keep going
+                stats["failed"].append(f"{rel}: {e}")
+    stats["elapsed_s"] = time.perf_counter() - start
+    return stats
+
+
+def format_sync_stats(direction: str, stats: dict, skipped: int, dry_run: bool) -> str:
+    if dry_run:
+        return (
+            f"Dry run: {stats['transferred']} files ({format_bytes(stats['bytes'])}) would be {direction}, "
+            f"{skipped} unchanged."
+        )
+    rate = stats["bytes"] / stats["elapsed_s"] if stats["elapsed_s"] else 0.0
+    text = (
+        f"{stats['transferred']} files ({format_bytes(stats['bytes'])}) {direction} in {stats['elapsed_s']:.1f}s "
+        f"({format_bytes(rate)}/s), {skipped} unchanged skipped."
+    )
+    if stats["failed"]:
+        text += f" {len(stats['failed'])} failed (run again to retry): " + "; ".join(stats["failed"][:10])
+    return text
+
+
+@s3_mcp.tool(
+    name="sync_to_s3",
+    description="Upload new and changed files of a local directory to a bucket prefix (size/mtime/ETag diff)",
+)
+def sync_to_s3(local_dir: str, bucket_name: str, prefix: str = "", dry_run: bool = False) -> str:
+    try:
+        if not os.path.isdir(local_dir):
+            return f"Error: '{local_dir}' is not a directory."
+        s3 = get_s3_client()
+        prefix = prefix.rstrip("/") + "/" if prefix else ""
+        remote = list_remote_objects(s3, bucket_name, prefix)
+        local = list_local_files(local_dir)
+        jobs = [
+            (rel, size) for rel, (size, mtime) in local.items()
+            if _needs_transfer((size, mtime), remote.get(rel), os.path.join(local_dir, rel))
+        ]
+        skipped = len(local) - len(jobs)
+        if dry_run:
+            planned = {"transferred": len(jobs), "bytes": sum(size for _, size in jobs)}
+            return format_sync_stats("uploaded", planned, skipped, True)
+
+        def upload(rel, size):
+            s3.upload_file(os.path.join(local_dir, rel), bucket_name, prefix + rel, Config=transfer_config())
+
+        return format_sync_stats("uploaded", run_transfers(jobs, upload), skipped, False)
+    except (ClientError, BotoCoreError) as e:
+        return f"Error: {e}"
+
+
+@s3_mcp.tool(
+    name="sync_from_s3",
+    description="Download new and changed objects under a bucket prefix into a local directory (size/mtime/ETag diff)",
+)
+def sync_from_s3(bucket_name: str, local_dir: str, prefix: str = "", dry_run: bool = False) -> str:
+    try:
+        s3 = get_s3_client()
+        prefix = prefix.rstrip("/") + "/" if prefix else ""
+        root = os.path.abspath(local_dir)
+        remote = list_remote_objects(s3, bucket_name, prefix)
+        local = list_local_files(root) if os.path.isdir(root) else {}
+        jobs, unsafe = [], 0
+        for rel, (size, last_modified, etag) in remote.items():
+            path = os.path.abspath(os.path.join(root, rel))
+            if os.path.commonpath([root, path]) != root:
+                unsafe += 1  # keys like "../x" must not escape the target directory
+                continue
+            if _needs_transfer((size, last_modified, etag), local.get(rel), path):
+                jobs.append((rel, size))
+        skipped = len(remote) - len(jobs) - unsafe
+        if dry_run:
+            planned = {"transferred": len(jobs), "bytes": sum(size for _, size in jobs)}
+            return format_sync_stats("downloaded", planned, skipped, True)
+
+        def download(rel, size):
+            path = os.path.join(root, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + SYNC_TMP_SUFFIX
+            s3.download_file(bucket_name, prefix + rel, tmp_path, Config=transfer_config())
+            os.replace(tmp_path, path)
+            # mtime = LastModified, so the next sync skips the file without hashing it
+            last_modified = remote[rel][1]
+            os.utime(path, (last_modified, last_modified))
+
+        text = format_sync_stats("downloaded", run_transfers(jobs, download), skipped, False)
+        if unsafe:
+            text += f" {unsafe} keys skipped because they would be written outside '{local_dir}'."
+        return text
+    except (ClientError, BotoCoreError) as e:
+        return f"Error: {e}"
+
+# --- Bucket inventory index ---
+# Optional local copy of a bucket listing (see s3_inventory.py); du/find/largest
+# queries run against it instead of crawling the bucket.
+def _inventory_footer(bucket_name: str, started: float) -> str:
+    age_min = s3_inventory.status(bucket_name)["age_s"] / 60
+    return f"(inventory {age_min:.0f} min old, query {(time.perf_counter() - started) * 1000:.0f} ms)"
+
+
+def _no_inventory(bucket_name: str) -> str:
+    return f"No inventory for bucket '{bucket_name}'. Run refresh_inventory first."
+
+
+@s3_mcp.tool(
+    name="refresh_inventory",
+    description=(
+        "Build or refresh the local inventory index of a bucket (used by inventory_du, inventory_find and "
+        "inventory_largest). Only prefixes not refreshed within the last hour are re-listed unless full=True."
+    ),
+)
+def refresh_inventory(bucket_name: str, full: bool = False) -> str:
+    try:
+        result = s3_inventory.refresh(get_s3_client(), bucket_name, full=full)
+        status = s3_inventory.status(bucket_name)
+        return (
+            f"Inventory of '{bucket_name}': {status['objects']} objects, {format_bytes(status['bytes'] or 0)}. "
+            f"Re-listed {result['refreshed']} of {result['partitions']} top-level prefixes "
+            f"({result['objects_listed']} objects) in {result['elapsed_s']:.1f}s."
+        )
+    except ClientError as e:
+        return f"Error: {e}"
+
+
+@s3_mcp.tool(
+    name="inventory_du",
+    description="Disk usage (object count and size) per sub-folder of a prefix, from the inventory index",
+)
+def inventory_du(bucket_name: str, prefix: str = "", limit: int = 30) -> str:
+    if s3_inventory.status(bucket_name) is None:
+        return _no_inventory(bucket_name)
+    started = time.perf_counter()
+    rows = s3_inventory.du(bucket_name, prefix, limit)
+    if not rows:
+        return f"No objects under '{prefix}' in the inventory of '{bucket_name}'."
+    lines = [f"{group}\t{count} objects\t{format_bytes(size)}" for group, count, size in rows]
+    lines.append(_inventory_footer(bucket_name, started))
+    return "\n".join(lines)
+
+
+@s3_mcp.tool(
+    name="inventory_find",
+    description="Find keys matching a glob pattern (e.g. 'logs/*.parquet'), from the inventory index",
+)
+def inventory_find(bucket_name: str, pattern: str, limit: int = 100) -> str:
+    if s3_inventory.status(bucket_name) is None:
+        return _no_inventory(bucket_name)
+    started = time.perf_counter()
+    rows = s3_inventory.find(bucket_name, pattern, limit)
+    if not rows:
+        return f"No keys matching '{pattern}' in the inventory of '{bucket_name}'."
+    lines = [f"{key}\t{format_bytes(size)}\t{last_modified}" for key, size, last_modified in rows]
+    if len(rows) == limit:
+        lines.append(f"(first {limit} matches)")
+    lines.append(_inventory_footer(bucket_name, started))
+    return "\n".join(lines)
+
+
+@s3_mcp.tool(
+    name="inventory_largest",
+    description="Largest objects in a bucket or under a prefix, from the inventory index",
+)
+def inventory_largest(bucket_name: str, prefix: str = "", limit: int = 20) -> str:
+    if s3_inventory.status(bucket_name) is None:
+        return _no_inventory(bucket_name)
+    started = time.perf_counter()
+    rows = s3_inventory.largest(bucket_name, prefix, limit)
+    if not rows:
+        return f"No objects under '{prefix}' in the inventory of '{bucket_name}'."
+    lines = [
+        f"{format_bytes(size)}\t{key}\t{storage_class}\t{last_modified}"
+        for key, size, last_modified, storage_class in rows
+    ]
+    lines.append(_inventory_footer(bucket_name, started))
+    return "\n".join(lines)
+
 # --- Bucket Policy Tools ---
 
 @s3_mcp.tool(name="get_bucket_policy_json", description="Get the JSON policy of a bucket")
 def get_bucket_policy_json(bucket_name: str) -> str:
-    s3 = boto3.client("s3")
+    s3 = get_s3_client()
     try:
         policy = s3.get_bucket_policy(Bucket=bucket_name)
         return policy.get("Policy", "Bucket has no policy attached.")
@@ -175,7 +1113,7 @@ def get_bucket_policy_json(bucket_name: str) -> str:
 
 @s3_mcp.tool(name="set_bucket_policy_json", description="Set a bucket policy from JSON")
 def set_bucket_policy_json(bucket_name: str, policy_json: str) -> str:
-    s3 = boto3.client("s3")
+    s3 = get_s3_client()
     try:
         policy_dict = json.loads(policy_json)
         s3.put_bucket_policy(Bucket=bucket_name, Policy=json.dumps(policy_dict))
@@ -187,7 +1125,7 @@ def set_bucket_policy_json(bucket_name: str, policy_json: str) -> str:
 
 @s3_mcp.tool(name="delete_bucket_policy", description="Delete a bucket policy")
 def delete_bucket_policy(bucket_name: str) -> str:
-    s3 = boto3.client("s3")
+    s3 = get_s3_client()
     try:
         s3.delete_bucket_policy(Bucket=bucket_name)
         return f"Policy deleted for bucket '{bucket_name}'."
@@ -200,7 +1138,7 @@ def delete_bucket_policy(bucket_name: str) -> str:
     description="Update an existing bucket policy by merging with new JSON statements."
 )
 def update_bucket_policy_json(bucket_name: str, new_policy_json: str) -> str:
-    s3 = boto3.client("s3")
+    s3 = get_s3_client()
     try:
         # Get current policy
         try:
@@ -227,22 +1165,7 @@ def update_bucket_policy_json(bucket_name: str, new_policy_json: str) -> str:
     except ClientError as e:
         return f"AWS error: {e}"
 
-# --- Run S3 MCP server ---
-def run_s3_mcp():
-    print("AWS S3 MCP server running on port 8010")
-    # Ensure it binds to all interfaces
-    s3_mcp.run(transport="streamable-http")
-
-# --- Run S3 Health server ---
-def run_s3_health_server():
-    print("AWS S3 Health server running on port 8011")
-    uvicorn.run(s3_health_app, host="0.0.0.0", port=8011)
-
+# --- Run S3 MCP and health servers ---
 if __name__ == "__main__":
-    # Run both servers in separate threads
-    threading.Thread(target=run_s3_mcp, daemon=True).start()
-    threading.Thread(target=run_s3_health_server, daemon=True).start()
-
-    # Keep the main thread alive
-    while True:
-        time.sleep(1)
\ No newline at end of file
+    # One process by default; MCP_WORKERS=N serves N worker processes behind port 8010 (see mcp_serving.py)
+    serve(s3_mcp, "aws_s3_server:s3_mcp", health_app=s3_health_app, health_port=8011, prober=s3_prober)
@@ -0,0 +1,106 @@
+"""Offline latency breakdown of one agent turn against a local MCP server.
+
+Uses the scripted fake model (no network access to the LLM provider) to drive
+the agent graph through: model step -> one tool call -> model step. The time of
+a turn is split into:
+
+  * model      - artificial latency of the scripted model
+  * tool exec  - the tool run in-process via FastMCP (no transport)
+  * transport  - MCP round trip minus in-process execution
+  * graph      - everything else (LangGraph bookkeeping, routing, message handling)
+
+Start the server first (``python k8_mcp_server.py``), then:
+
+    python -m benchmarks.agent_latency_bench --tool get_current_context --iterations 50
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import statistics
+import time
+
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
+
+from mcp_client_langgraph import build_graph, percentile
+from model_backend import ScriptedChatModel
+
+
+def summarize(label, samples_ms):
+    print(
+        f"  {label:<11} mean {statistics.mean(samples_ms):8.2f} ms   "
+        f"p50 {percentile(samples_ms, 50):8.2f} ms   p95 {percentile(samples_ms, 95):8.2f} ms"
+    )
+
+
+async def main(args):
+    tool_args = json.loads(args.args)
+    client = MultiServerMCPClient({"local": {"transport": "streamable_http", "url": args.url}})
+
+    async with client.session("local") as session:
+        tools = await load_mcp_tools(session)
+        tool = next((t for t in tools if t.name == args.tool), None)
+        if tool is None:
+            raise SystemExit(f"Tool '{args.tool}' not found on {args.url}")
+
+        model = ScriptedChatModel(
+            script=[
+                {"tool_calls": [{"name": args.tool, "args": tool_args}]},
+                {"content": "{tool_output}"},
+            ],
+            latency_ms=args.model_latency_ms,
+        )
+        graph = build_graph(model, tools)
+
+        # Warm up connections and caches
+        await tool.ainvoke(tool_args)
+        await graph.ainvoke({"messages": [{"role": "user", "content": "warm up"}]})
+
+        turn_ms, model_ms, mcp_ms, graph_ms = [], [], [], []
+        for _ in range(args.iterations):
+            stats = {"llm_s": 0.0, "tool_s": 0.0, "llm_calls": 0, "tool_calls": 0}
+            start = time.perf_counter()
+            await graph.ainvoke(
+                {"messages": [{"role": "user", "content": f"run {args.tool}"}]},
+                {"configurable": {"stats": stats}},
+            )
+            total = time.perf_counter() - start
+            turn_ms.append(total * 1000)
+            model_ms.append(stats["llm_s"] * 1000)
+            graph_ms.append((total - stats["llm_s"] - stats["tool_s"]) * 1000)
+
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            await tool.ainvoke(tool_args)
+            mcp_ms.append((time.perf_counter() - start) * 1000)
+
+    # Same tool executed in-process through FastMCP, without any transport
+    server = getattr(importlib.import_module(args.server_module), args.server_attr)
+    exec_ms = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        await server.call_tool(args.tool, tool_args)
+        exec_ms.append((time.perf_counter() - start) * 1000)
+
+    transport_ms = [max(0.0, m - e) for m, e in zip(mcp_ms, exec_ms)]
+
+    print(f"\n⏱️  {args.iterations} turns, tool '{args.tool}' on {args.url}")
+    summarize("turn", turn_ms)
+    summarize("model", model_ms)
+    summarize("graph", graph_ms)
+    summarize("mcp call", mcp_ms)
+    summarize("tool exec", exec_ms)
+    summarize("transport", transport_ms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agent turn latency breakdown with a scripted model")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/mcp", help="Local MCP server URL")
+    parser.add_argument("--server-module", default="k8_mcp_server", help="Module defining the FastMCP server")
+    parser.add_argument("--server-attr", default="mcp", help="FastMCP instance name in that module")
+    parser.add_argument("--tool", default="get_current_context", help="Tool the scripted model calls")
+    parser.add_argument("--args", default="{}", help="Tool arguments as JSON")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--model-latency-ms", type=float, default=0.0, help="Artificial model latency per call")
+    asyncio.run(main(parser.parse_args()))
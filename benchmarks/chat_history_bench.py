@@ -0,0 +1,136 @@
+"""Chat history throughput under concurrent writers.
+
+Compares the pooled WAL connection layer in chat_history.py (per-row commit
+and write-behind batching) with the previous connect-per-call,
+rollback-journal access pattern. Each run uses a fresh temporary database,
+N writer threads calling save_message and one reader thread timing
+load_messages. Write-behind throughput includes the final flush.
+
+    python -m benchmarks.chat_history_bench --writers 4 --messages 500
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import chat_history
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+# --- Previous access pattern (baseline) ---
+def legacy_save_message(session_id, role, content):
+    conn = sqlite3.connect(chat_history.DB_FILE)
+    conn.execute(
+        "INSERT INTO chats (session_id, role, content) VALUES (?, ?, ?)",
+        (session_id, role, content),
+    )
+    conn.commit()
+    conn.close()
+
+
+def legacy_load_messages(session_id):
+    conn = sqlite3.connect(chat_history.DB_FILE)
+    rows = conn.execute(
+        "SELECT role, content FROM chats WHERE session_id=? ORDER BY id ASC", (session_id,)
+    ).fetchall()
+    conn.close()
+    return [{"role": r, "content": c} for r, c in rows]
+
+
+def run(save, load, writers, messages, init, finish=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        chat_history.DB_FILE = os.path.join(tmp, "chat_history.db")
+        init()
+
+        errors = []
+        read_ms = []
+        done = threading.Event()
+        content = "NAME READY STATUS\n" + "pod-x 1/1 Running\n" * 20
+
+        def writer(n):
+            try:
+                for i in range(messages):
+                    save(f"session-{n}", "user" if i % 2 == 0 else "assistant", content)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+
+        def reader():
+            while not done.is_set():
+                start = time.perf_counter()
+                try:
+                    load("session-0")
+                except sqlite3.OperationalError as e:
+                    errors.append(str(e))
+                read_ms.append((time.perf_counter() - start) * 1000)
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+        reader_thread = threading.Thread(target=reader)
+        start = time.perf_counter()
+        reader_thread.start()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if finish:
+            finish()
+        elapsed = time.perf_counter() - start
+        done.set()
+        reader_thread.join()
+
+    return {
+        "inserts_per_s": writers * messages / elapsed,
+        "read_p50_ms": percentile(read_ms, 50),
+        "read_p95_ms": percentile(read_ms, 95),
+        "reads": len(read_ms),
+        "errors": len(errors),
+    }
+
+
+def legacy_init():
+    conn = sqlite3.connect(chat_history.DB_FILE)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT,
+            role TEXT,
+            content TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+
+def main(args):
+    def write_behind_init():
+        chat_history.init_db()
+        chat_history.enable_write_behind()
+
+    modes = {
+        "per-call connect": (legacy_save_message, legacy_load_messages, legacy_init, None),
+        "pooled WAL": (chat_history.save_message, chat_history.load_messages, chat_history.init_db, None),
+        "write-behind": (chat_history.save_message, chat_history.load_messages, write_behind_init, chat_history.flush),
+    }
+    print(f"{args.writers} writers x {args.messages} messages, 1 reader\n")
+    print(f"{'mode':<18} {'inserts/s':>10} {'read p50 ms':>12} {'read p95 ms':>12} {'reads':>7} {'errors':>7}")
+    for name, (save, load, init, finish) in modes.items():
+        r = run(save, load, args.writers, args.messages, init, finish)
+        print(
+            f"{name:<18} {r['inserts_per_s']:>10.0f} {r['read_p50_ms']:>12.2f} "
+            f"{r['read_p95_ms']:>12.2f} {r['reads']:>7} {r['errors']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat history concurrent write/read benchmark")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=500, help="Messages inserted per writer")
+    main(parser.parse_args())
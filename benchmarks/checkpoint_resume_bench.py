@@ -0,0 +1,89 @@
+"""Resume latency vs. session length: replaying chat history vs. loading a checkpoint.
+
+Runs a stub agent graph (no LLM, no MCP) against a temporary copy of the chat
+history schema, so only history loading and graph bookkeeping are measured.
+
+    python -m benchmarks.checkpoint_resume_bench
+"""
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.graph import StateGraph, MessagesState, START, END
+
+import chat_history
+
+SESSION_LENGTHS = [10, 100, 500, 1000]
+REPEATS = 5
+
+
+def build_graph():
+    async def call_model(state: MessagesState):
+        return {"messages": [AIMessage(content="ok")]}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("call_model", call_model)
+    builder.add_edge(START, "call_model")
+    builder.add_edge("call_model", END)
+    return builder
+
+
+def seed_session(session_id, turns):
+    history = [{"role": "system", "content": "You are an assistant."}]
+    for i in range(turns):
+        user = f"list pods in namespace ns-{i}"
+        answer = "NAME READY STATUS\n" + "\n".join(f"pod-{i}-{j} 1/1 Running" for j in range(20))
+        chat_history.save_message(session_id, "user", user)
+        chat_history.save_message(session_id, "assistant", answer)
+        history += [{"role": "user", "content": user}, {"role": "assistant", "content": answer}]
+    return history
+
+
+async def bench_length(builder, turns):
+    session_id = f"bench-{turns}"
+    history = seed_session(session_id, turns)
+    config = {"configurable": {"thread_id": session_id}}
+
+    async with AsyncSqliteSaver.from_conn_string(chat_history.DB_FILE) as checkpointer:
+        graph = builder.compile(checkpointer=checkpointer)
+        await graph.aupdate_state(config, {"messages": history}, as_node="call_model")
+
+        replay, resume = [], []
+        stateless = builder.compile()
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            messages = [{"role": "system", "content": "You are an assistant."}] + [
+                {"role": m["role"], "content": m["content"]}
+                for m in chat_history.load_messages(session_id)
+            ]
+            messages.append({"role": "user", "content": "next question"})
+            await stateless.ainvoke({"messages": messages})
+            replay.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await graph.aget_state(config)
+            await graph.ainvoke({"messages": [{"role": "user", "content": "next question"}]}, config)
+            resume.append(time.perf_counter() - start)
+            chat_history.compact_checkpoints(thread_id=session_id)
+
+    return statistics.median(replay) * 1000, statistics.median(resume) * 1000
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        chat_history.DB_FILE = os.path.join(tmp, "chat_history.db")
+        chat_history.init_db()
+        builder = build_graph()
+
+        print(f"{'turns':>6} {'replay ms':>10} {'resume ms':>10}")
+        for turns in SESSION_LENGTHS:
+            replay_ms, resume_ms = await bench_length(builder, turns)
+            print(f"{turns:>6} {replay_ms:>10.2f} {resume_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
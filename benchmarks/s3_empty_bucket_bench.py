@@ -0,0 +1,121 @@
+"""Deletes/sec of bucket emptying: previous sequential loop vs the parallel engine.
+
+Runs against moto's in-process S3 stand-in by default (``pip install moto``),
+or against any S3-compatible endpoint (moto server, MinIO) with
+``--endpoint-url``. Both are measured on a plain bucket and on a versioned
+bucket where every key has ``--versions`` versions plus a delete marker; the
+sequential baseline only lists current objects, so it cannot empty the latter.
+``--latency-ms`` adds an artificial round trip to every DeleteObjects call,
+since an in-process stand-in has none.
+
+    python -m benchmarks.s3_empty_bucket_bench --objects 5000 --workers 8 --latency-ms 30
+"""
+import argparse
+import contextlib
+import os
+import time
+
+# moto needs (fake) credentials and a region before any client is created
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import boto3
+
+from aws_s3_server import empty_bucket_parallel
+
+
+# --- Previous implementation (baseline) ---
+def legacy_delete_all_objects(s3, bucket_name):
+    deleted = 0
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name):
+        objects = page.get("Contents", [])
+        if objects:
+            delete_keys = [{"Key": obj["Key"]} for obj in objects]
+            s3.delete_objects(Bucket=bucket_name, Delete={"Objects": delete_keys})
+            deleted += len(delete_keys)
+    return deleted
+
+
+def mock_s3():
+    try:
+        from moto import mock_aws
+    except ImportError:  # moto < 5
+        from moto import mock_s3 as mock_aws
+    return mock_aws()
+
+
+def fill_bucket(s3, bucket_name, objects, versions):
+    s3.create_bucket(Bucket=bucket_name)
+    s3.put_bucket_versioning(Bucket=bucket_name, VersioningConfiguration={"Status": "Enabled"})
+    for i in range(objects):
+        key = f"data/{i % 50:02d}/object-{i:07d}.json"
+        for v in range(versions):
+            s3.put_object(Bucket=bucket_name, Key=key, Body=f'{{"version": {v}}}'.encode())
+    # A delete marker on every key, as left behind by deletes on a versioned bucket
+    for start in range(0, objects, 1000):
+        keys = [{"Key": f"data/{i % 50:02d}/object-{i:07d}.json"} for i in range(start, min(start + 1000, objects))]
+        s3.delete_objects(Bucket=bucket_name, Delete={"Objects": keys, "Quiet": True})
+
+
+def remaining_versions(s3, bucket_name):
+    count = 0
+    for page in s3.get_paginator("list_object_versions").paginate(Bucket=bucket_name):
+        count += len(page.get("Versions", [])) + len(page.get("DeleteMarkers", []))
+    return count
+
+
+def main(args):
+    with (contextlib.nullcontext() if args.endpoint_url else mock_s3()):
+        s3 = boto3.client("s3", endpoint_url=args.endpoint_url)
+        if args.latency_ms:
+            s3.meta.events.register(
+                "before-call.s3.DeleteObjects", lambda **kwargs: time.sleep(args.latency_ms / 1000)
+            )
+
+        print(f"{args.objects} keys x {args.versions} versions + delete markers, "
+              f"{args.latency_ms} ms added per DeleteObjects call\n")
+        print(f"{'mode':<22} {'deleted':>9} {'seconds':>9} {'deletes/s':>10} {'left':>8}")
+
+        # Plain (unversioned) bucket: both implementations can empty it
+        s3.create_bucket(Bucket="bench-plain")
+        for i in range(args.objects):
+            s3.put_object(Bucket="bench-plain", Key=f"object-{i:07d}", Body=b"x")
+        start = time.perf_counter()
+        deleted = legacy_delete_all_objects(s3, "bench-plain")
+        elapsed = time.perf_counter() - start
+        print(f"{'sequential (plain)':<22} {deleted:>9} {elapsed:>9.2f} {deleted / elapsed:>10.0f} "
+              f"{remaining_versions(s3, 'bench-plain'):>8}")
+
+        for i in range(args.objects):
+            s3.put_object(Bucket="bench-plain", Key=f"object-{i:07d}", Body=b"x")
+        stats = empty_bucket_parallel(s3, "bench-plain", workers=args.workers, progress_every=3600)
+        print(f"{'parallel (plain)':<22} {stats['deleted']:>9} {stats['elapsed_s']:>9.2f} "
+              f"{stats['deletes_per_s']:>10.0f} {remaining_versions(s3, 'bench-plain'):>8}")
+
+        # Versioned bucket: only the parallel engine removes versions and delete markers
+        fill_bucket(s3, "bench-versioned", args.objects, args.versions)
+        start = time.perf_counter()
+        deleted = legacy_delete_all_objects(s3, "bench-versioned")
+        elapsed = time.perf_counter() - start
+        rate = deleted / elapsed if elapsed else 0.0
+        print(f"{'sequential (versioned)':<22} {deleted:>9} {elapsed:>9.2f} {rate:>10.0f} "
+              f"{remaining_versions(s3, 'bench-versioned'):>8}")
+
+        dry = empty_bucket_parallel(s3, "bench-versioned", dry_run=True)
+        stats = empty_bucket_parallel(s3, "bench-versioned", workers=args.workers, progress_every=3600)
+        print(f"{'parallel (versioned)':<22} {stats['deleted']:>9} {stats['elapsed_s']:>9.2f} "
+              f"{stats['deletes_per_s']:>10.0f} {remaining_versions(s3, 'bench-versioned'):>8}")
+        print(f"\nDry run counted {dry['listed']} versions/delete markers in {dry['elapsed_s']:.2f}s; "
+              f"{stats['failed']} keys failed after retries")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="S3 bucket emptying benchmark (moto or S3-compatible endpoint)")
+    parser.add_argument("--objects", type=int, default=5000, help="Keys per bucket")
+    parser.add_argument("--versions", type=int, default=2, help="Versions per key in the versioned bucket")
+    parser.add_argument("--workers", type=int, default=8, help="Deleter threads of the parallel engine")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Artificial latency per DeleteObjects call")
+    parser.add_argument("--endpoint-url", help="S3-compatible endpoint instead of in-process moto")
+    main(parser.parse_args())
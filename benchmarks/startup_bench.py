@@ -0,0 +1,166 @@
+"""Cold-start cost of the entry points: import time per module and server time-to-ready.
+
+Import profile: each entry module is imported in a fresh interpreter (median
+of ``--repeat`` runs, interpreter startup excluded). The heaviest direct
+imports come from ``python -X importtime``. The eager column imports what
+used to be loaded at startup (boto3 for the S3 server, the langchain /
+langgraph agent stack for the web app) before the module, as a baseline.
+
+Time-to-ready: each MCP server is started as in the container. Ready means
+the first MCP ``initialize`` request on its port succeeds. SIGTERM is then
+sent and the time to exit is measured as well. ``--workers`` sets
+MCP_WORKERS. The servers use their fixed ports (8000/8001, 8010/8011), which
+must be free. Everything runs in a temporary directory with its own empty
+data/, so the repository's data/ files are not touched. A statement that fails
+is reported in its row instead of stopping the run.
+
+    python -m benchmarks.startup_bench --repeat 5 --workers 1
+"""
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# entry module -> (import statement, statement loading what used to be imported eagerly)
+ENTRY_POINTS = {
+    "k8_mcp_server": ("import k8_mcp_server", None),
+    "aws_s3_server": (
+        "import aws_s3_server",
+        "import boto3, boto3.s3.transfer, botocore.config; import aws_s3_server",
+    ),
+    "web_app": ("import web_app", "import web_app; web_app._preload_agent_modules()"),
+}
+SERVERS = {"k8_mcp_server.py": 8000, "aws_s3_server.py": 8010}
+
+
+def _env(**extra):
+    env = dict(os.environ, PYTHONPATH=REPO, PRELOAD_AGENT_MODULES="false", **extra)
+    env.pop("PYTHONIMPORTTIME", None)
+    return env
+
+
+def import_ms(statement: str, cwd: str) -> float:
+    code = f"import time; t = time.perf_counter(); {statement}; print((time.perf_counter() - t) * 1000)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=_env(), capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"exited with {result.returncode}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def heaviest_imports(module: str, cwd: str, top: int):
+    """(cumulative ms, module) of the heaviest imports made directly by `module`."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=cwd, env=_env(),
+                            capture_output=True, text=True)
+    children, rows = [], []
+    # Nested imports are indented two spaces per level and listed before their parent
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            children.append((int(cumulative) / 1000, name.strip()))
+        elif depth == 0:
+            if name.strip() == module:
+                rows = children
+            children = []
+    return sorted(rows, reverse=True)[:top]
+
+
+def mcp_initialize(port: int):
+    body = json.dumps({
+        "jsonrpc": "2.0", "id": 1, "method": "initialize",
+        "params": {"protocolVersion": "2025-03-26", "capabilities": {},
+                   "clientInfo": {"name": "startup-bench", "version": "1"}},
+    }).encode()
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/mcp", data=body,
+        headers={"Content-Type": "application/json", "Accept": "application/json, text/event-stream"},
+    )
+    with urllib.request.urlopen(request, timeout=2) as response:
+        response.read(1)
+
+
+def time_to_ready(script: str, port: int, workers: int, cwd: str, timeout: float = 60.0):
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.join(REPO, script)], cwd=cwd,
+                            env=_env(MCP_WORKERS=str(workers)), stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{script} exited with {proc.returncode} before it was ready")
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError(f"{script} not ready after {timeout:.0f}s")
+            try:
+                mcp_initialize(port)
+                break
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                time.sleep(0.02)
+        ready_s = time.perf_counter() - start
+
+        stop = time.perf_counter()
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout)
+        return ready_s, time.perf_counter() - stop
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+def median_import_ms(statement: str, cwd: str, repeat: int):
+    """(median ms, None), or (None, error) if the statement fails."""
+    try:
+        return statistics.median(import_ms(statement, cwd) for _ in range(repeat)), None
+    except RuntimeError as e:
+        return None, str(e)
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        # Modules open their SQLite files under data/ at import time
+        os.makedirs(os.path.join(tmp, "data"))
+        print(f"Import time, median of {args.repeat} fresh interpreters\n")
+        print(f"{'entry point':<16} {'import ms':>10} {'eager ms':>10}")
+        for module, (statement, eager) in ENTRY_POINTS.items():
+            lazy_ms, lazy_error = median_import_ms(statement, tmp, args.repeat)
+            eager_ms, eager_error = median_import_ms(eager, tmp, args.repeat) if eager else (None, None)
+            lazy_col = f"{lazy_ms:>10.0f}" if lazy_ms is not None else f"{'-':>10}"
+            eager_col = f"{eager_ms:>10.0f}" if eager_ms is not None else f"{'-':>10}"
+            print(f"{module:<16} {lazy_col} {eager_col}")
+            for label, error in (("import", lazy_error), ("eager", eager_error)):
+                if error:
+                    print(f"    {label} failed: {error}")
+            if lazy_error:
+                continue
+            for ms, name in heaviest_imports(module, tmp, args.top):
+                print(f"    {ms:>8.1f} ms  {name}")
+
+        print(f"\nTime to first MCP initialize (MCP_WORKERS={args.workers})\n")
+        print(f"{'server':<20} {'ready s':>8} {'stop s':>8}")
+        for script, port in SERVERS.items():
+            try:
+                ready_s, stop_s = time_to_ready(script, port, args.workers, tmp)
+                print(f"{script:<20} {ready_s:>8.2f} {stop_s:>8.2f}")
+            except RuntimeError as e:
+                print(f"{script:<20} {'-':>8} {'-':>8}  ({e})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time and time-to-ready benchmark of the entry points")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per import measurement")
+    parser.add_argument("--top", type=int, default=8, help="Heaviest direct imports listed per entry point")
+    parser.add_argument("--workers", type=int, default=1, help="MCP_WORKERS for the time-to-ready runs")
+    main(parser.parse_args())
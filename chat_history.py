@@ -1,74 +1,1204 @@
+import argparse
+import atexit
+import gzip
+import json
+import os
+import queue
+import re
 import sqlite3
-from datetime import datetime
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
 
 DB_FILE = "data/chat_history.db"
 
 
-# Initialize DB
-def init_db():
-   conn = sqlite3.connect(DB_FILE)
-   c = conn.cursor()
-   c.execute("""
-       CREATE TABLE IF NOT EXISTS chats (
-           id INTEGER PRIMARY KEY AUTOINCREMENT,
-           session_id TEXT,
-           role TEXT,
-           content TEXT,
-           timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+# --- Connection management ---
+# Each thread keeps one long-lived connection (Streamlit runs every browser
+# session on its own script thread), so statements stay prepared in the
+# connection's statement cache instead of being re-parsed on every call.
+# WAL journaling lets readers proceed while another session writes.
+BUSY_TIMEOUT_MS = int(os.getenv("CHAT_DB_BUSY_TIMEOUT_MS", "5000"))
+CACHE_SIZE_KB = int(os.getenv("CHAT_DB_CACHE_SIZE_KB", "16384"))
+MMAP_SIZE = int(os.getenv("CHAT_DB_MMAP_SIZE", str(128 * 1024 * 1024)))
+SYNCHRONOUS = os.getenv("CHAT_DB_SYNCHRONOUS", "NORMAL")
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+
+def _connect(db_file):
+   conn = sqlite3.connect(
+       db_file,
+       timeout=BUSY_TIMEOUT_MS / 1000,
+       cached_statements=STATEMENT_CACHE_SIZE,
+   )
+   # Only takes effect on a new, empty file (and before WAL is enabled); existing
+   # databases are converted once with enable_incremental_vacuum()
+   conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+   conn.execute("PRAGMA journal_mode=WAL")
+   conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+   # Negative cache_size is in KiB
+   conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+   conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+   conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+   conn.execute("PRAGMA temp_store=MEMORY")
+   return conn
+
+
+def get_connection():
+   """Return this thread's connection to DB_FILE, opening it on first use."""
+   conn = getattr(_local, "conn", None)
+   # DB_FILE may be repointed (benchmarks, tools); reconnect if it changed
+   if conn is None or _local.db_file != DB_FILE:
+      if conn is not None:
+         conn.close()
+      conn = _connect(DB_FILE)
+      _local.conn = conn
+      _local.db_file = DB_FILE
+   return conn
+
+
+def close_connection():
+   """Close this thread's connection (e.g. before a worker thread exits)."""
+   conn = getattr(_local, "conn", None)
+   if conn is not None:
+      conn.close()
+      _local.conn = None
+
+
+# --- Schema migrations ---
+# PRAGMA user_version records the last applied migration, so existing
+# databases are upgraded in place the first time init_db() runs.
+PREVIEW_CHARS = 200
+
+
+def _migrate_sessions_table(conn):
+   """v1: `sessions` table maintained on insert, and an index for per-session scans."""
+   conn.execute("""
+       CREATE TABLE IF NOT EXISTS sessions (
+           session_id TEXT PRIMARY KEY,
+           started_at DATETIME,
+           last_active DATETIME,
+           message_count INTEGER NOT NULL DEFAULT 0,
+           preview TEXT NOT NULL DEFAULT ''
        )
    """)
-   conn.commit()
-   conn.close()
+   conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_started ON sessions(started_at DESC, session_id DESC)")
+   conn.execute("CREATE INDEX IF NOT EXISTS idx_chats_session_id ON chats(session_id, id)")
+   # The preview is the first user message of the session
+   conn.execute(f"""
+       CREATE TRIGGER IF NOT EXISTS trg_chats_insert_session AFTER INSERT ON chats
+       BEGIN
+           INSERT INTO sessions (session_id, started_at, last_active, message_count, preview)
+           VALUES (
+               NEW.session_id, NEW.timestamp, NEW.timestamp, 1,
+               CASE WHEN NEW.role = 'user' THEN SUBSTR(NEW.content, 1, {PREVIEW_CHARS}) ELSE '' END
+           )
+           ON CONFLICT(session_id) DO UPDATE SET
+               last_active = excluded.last_active,
+               message_count = sessions.message_count + 1,
+               preview = CASE WHEN sessions.preview = '' THEN excluded.preview ELSE sessions.preview END;
+       END
+   """)
+   # Backfill from existing messages
+   conn.execute(f"""
+       INSERT OR REPLACE INTO sessions (session_id, started_at, last_active, message_count, preview)
+       SELECT s.session_id, MIN(s.timestamp), MAX(s.timestamp), COUNT(*),
+              COALESCE((
+                  SELECT SUBSTR(u.content, 1, {PREVIEW_CHARS}) FROM chats u
+                  WHERE u.session_id = s.session_id AND u.role = 'user'
+                  ORDER BY u.id LIMIT 1
+              ), '')
+       FROM chats s
+       GROUP BY s.session_id
+   """)
+
+
+def _fts5_available(conn):
+   try:
+      conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp._fts5_probe USING fts5(x)")
+      conn.execute("DROP TABLE temp._fts5_probe")
+      return True
+   except sqlite3.OperationalError:
+      return False
+
+
+def _migrate_fts(conn):
+   """v2: FTS5 index over message content, kept in sync by triggers."""
+   if not _fts5_available(conn):
+      # search_sessions() falls back to a LIKE scan on SQLite builds without FTS5
+      return
+   conn.execute("""
+       CREATE VIRTUAL TABLE IF NOT EXISTS chats_fts USING fts5(
+           content, content='chats', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+       )
+   """)
+   conn.execute("""
+       CREATE TRIGGER IF NOT EXISTS trg_chats_fts_insert AFTER INSERT ON chats
+       BEGIN
+           INSERT INTO chats_fts (rowid, content) VALUES (NEW.id, NEW.content);
+       END
+   """)
+   conn.execute("""
+       CREATE TRIGGER IF NOT EXISTS trg_chats_fts_delete AFTER DELETE ON chats
+       BEGIN
+           INSERT INTO chats_fts (chats_fts, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+       END
+   """)
+   conn.execute("""
+       CREATE TRIGGER IF NOT EXISTS trg_chats_fts_update AFTER UPDATE OF content ON chats
+       BEGIN
+           INSERT INTO chats_fts (chats_fts, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+           INSERT INTO chats_fts (rowid, content) VALUES (NEW.id, NEW.content);
+       END
+   """)
+   conn.execute("INSERT INTO chats_fts (chats_fts) VALUES ('rebuild')")
+
+
+def _migrate_archive(conn):
+   """v3: compressed archive of old sessions' messages."""
+   conn.execute("""
+       CREATE TABLE IF NOT EXISTS chats_archive (
+           session_id TEXT PRIMARY KEY,
+           codec TEXT NOT NULL,
+           payload BLOB NOT NULL,
+           raw_bytes INTEGER NOT NULL,
+           message_count INTEGER NOT NULL,
+           first_id INTEGER,
+           last_id INTEGER,
+           archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+       )
+   """)
+   conn.execute("ALTER TABLE sessions ADD COLUMN archived INTEGER NOT NULL DEFAULT 0")
+   conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions(last_active)")
+
+
+def _migrate_tool_calls(conn):
+   """v4: one row per MCP tool call made while answering a turn."""
+   conn.execute("""
+       CREATE TABLE IF NOT EXISTS tool_calls (
+           id INTEGER PRIMARY KEY,
+           session_id TEXT NOT NULL,
+           turn INTEGER,
+           server TEXT,
+           tool TEXT NOT NULL,
+           args_hash TEXT,
+           latency_ms REAL NOT NULL,
+           output_bytes INTEGER NOT NULL DEFAULT 0,
+           cache_hit INTEGER NOT NULL DEFAULT 0,
+           error INTEGER NOT NULL DEFAULT 0,
+           created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+       )
+   """)
+   # Analytics scan a time window per tool; the session index serves deletes
+   conn.execute("CREATE INDEX IF NOT EXISTS idx_tool_calls_created ON tool_calls(created_at, tool, latency_ms)")
+   conn.execute("CREATE INDEX IF NOT EXISTS idx_tool_calls_session ON tool_calls(session_id, turn)")
+
+
+MIGRATIONS = [
+   _migrate_sessions_table,
+   _migrate_fts,
+   _migrate_archive,
+   _migrate_tool_calls,
+]
+
+
+def _migrate(conn):
+   version = conn.execute("PRAGMA user_version").fetchone()[0]
+   if version >= len(MIGRATIONS):
+      return
+   conn.execute("BEGIN IMMEDIATE")
+   try:
+      # Re-read inside the write lock in case another process migrated first
+      version = conn.execute("PRAGMA user_version").fetchone()[0]
+      for target, migration in enumerate(MIGRATIONS, start=1):
+         if version < target:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version={target}")
+      conn.commit()
+   except Exception:
+      conn.rollback()
+      raise
+
+
+# Initialize DB
+def init_db():
+   conn = get_connection()
+   with conn:
+      conn.execute("""
+          CREATE TABLE IF NOT EXISTS chats (
+              id INTEGER PRIMARY KEY AUTOINCREMENT,
+              session_id TEXT,
+              role TEXT,
+              content TEXT,
+              timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+          )
+      """)
+   _migrate(conn)
+
+
+# --- Write-behind persistence ---
+# Optional: save_message() enqueues rows for a background thread that inserts
+# them in one transaction every WRITE_BEHIND_FLUSH_MS or WRITE_BEHIND_BATCH_ROWS
+# rows. Row ids are reserved up front in blocks from sqlite_sequence, so callers
+# still get the final id immediately and the load_* functions can merge queued
+# rows (read-your-writes) without duplicates.
+WRITE_BEHIND = os.getenv("CHAT_HISTORY_WRITE_BEHIND", "false").lower() == "true"
+WRITE_BEHIND_FLUSH_MS = int(os.getenv("CHAT_HISTORY_FLUSH_MS", "50"))
+WRITE_BEHIND_BATCH_ROWS = int(os.getenv("CHAT_HISTORY_BATCH_ROWS", "200"))
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("CHAT_HISTORY_MAX_QUEUE", "10000"))
+# flush()/close() give up after this many seconds instead of waiting forever
+WRITE_BEHIND_FLUSH_TIMEOUT = float(os.getenv("CHAT_HISTORY_FLUSH_TIMEOUT", "30"))
+WRITE_BEHIND_RETRIES = 5
+ID_BLOCK_SIZE = 1000
+
+
+def _reserve_id_block(size):
+   """Advance the chats AUTOINCREMENT sequence by `size`; return the first reserved id."""
+   conn = get_connection()
+   conn.execute("BEGIN IMMEDIATE")
+   try:
+      row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='chats'").fetchone()
+      if row is None:
+         start = conn.execute("SELECT COALESCE(MAX(id), 0) FROM chats").fetchone()[0]
+         conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('chats', ?)", (start + size,))
+      else:
+         start = row[0]
+         conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name='chats'", (start + size,))
+      conn.commit()
+   except Exception:
+      conn.rollback()
+      raise
+   return start + 1
+
+
+class WriteBehindWriter:
+   """Background batching writer for chat messages."""
+
+   def __init__(self, flush_ms=WRITE_BEHIND_FLUSH_MS, batch_rows=WRITE_BEHIND_BATCH_ROWS,
+                max_queue=WRITE_BEHIND_MAX_QUEUE):
+      self.flush_interval = flush_ms / 1000
+      self.batch_rows = batch_rows
+      # Bounded: when the writer falls behind, save_message blocks (backpressure)
+      self._queue = queue.Queue(maxsize=max_queue)
+      self._pending = {}
+      self._pending_lock = threading.Lock()
+      self._id_lock = threading.Lock()
+      self._next_id = 0
+      self._id_limit = 0
+      self._stop = threading.Event()
+      self._error = None
+      self.dropped_rows = 0
+      self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+      self._thread.start()
+
+   def _allocate_id(self):
+      with self._id_lock:
+         if self._next_id >= self._id_limit:
+            self._next_id = _reserve_id_block(ID_BLOCK_SIZE)
+            self._id_limit = self._next_id + ID_BLOCK_SIZE
+         row_id = self._next_id
+         self._next_id += 1
+         return row_id
+
+   def submit(self, session_id, role, content):
+      row = {
+          "id": self._allocate_id(),
+          "session_id": session_id,
+          "role": role,
+          "content": content,
+          # Same format as SQLite's CURRENT_TIMESTAMP (UTC)
+          "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+      }
+      with self._pending_lock:
+         self._pending.setdefault(session_id, []).append(row)
+      self._queue.put(row)
+      return row
+
+   def pending_rows(self, session_id):
+      with self._pending_lock:
+         return list(self._pending.get(session_id, ()))
+
+   def _run(self):
+      while not (self._stop.is_set() and self._queue.empty()):
+         try:
+            first = self._queue.get(timeout=0.1)
+         except queue.Empty:
+            continue
+         batch = [first]
+         deadline = time.monotonic() + self.flush_interval
+         while len(batch) < self.batch_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+               break
+            try:
+               batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+               break
+         try:
+            self._write(batch)
+         except Exception as e:
+            # Never let the writer thread die: flush() would wait on it forever
+            self._drop(batch, e)
+         finally:
+            for _ in batch:
+               self._queue.task_done()
+      close_connection()
+
+   def _write(self, batch):
+      for attempt in range(WRITE_BEHIND_RETRIES):
+         try:
+            conn = get_connection()
+            with conn:
+               conn.executemany(
+                   "INSERT OR IGNORE INTO chats (id, session_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                   [(r["id"], r["session_id"], r["role"], r["content"], r["timestamp"]) for r in batch],
+               )
+            break
+         except sqlite3.OperationalError as e:
+            # Locked/busy database: transient, retried with backoff
+            if attempt == WRITE_BEHIND_RETRIES - 1:
+               raise
+            print(f"chat_history: batch insert failed ({e}), retrying")
+            time.sleep(0.1 * (attempt + 1))
+      self._forget(batch)
+
+   def _drop(self, batch, error):
+      """Give up on a batch: log which rows are lost and report the error to flush() callers."""
+      ids = [r["id"] for r in batch]
+      sessions = sorted({r["session_id"] for r in batch})
+      print(f"chat_history: dropped {len(batch)} queued messages (ids {ids[0]}..{ids[-1]}, "
+            f"sessions {', '.join(sessions)}): {type(error).__name__}: {error}")
+      self.dropped_rows += len(batch)
+      self._error = error
+      self._forget(batch)
+
+   def _forget(self, batch):
+      # Rows leave the pending view once committed (or dropped)
+      with self._pending_lock:
+         for row in batch:
+            rows = self._pending.get(row["session_id"])
+            if rows:
+               rows.remove(row)
+               if not rows:
+                  del self._pending[row["session_id"]]
+
+   def flush(self, timeout=WRITE_BEHIND_FLUSH_TIMEOUT):
+      """Block until every queued row is written.
+
+      Raises TimeoutError if that takes longer than `timeout` seconds, and
+      RuntimeError if rows were dropped since the last flush.
+      """
+      deadline = time.monotonic() + timeout
+      with self._queue.all_tasks_done:
+         while self._queue.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._thread.is_alive():
+               raise TimeoutError(
+                   f"chat_history: {self._queue.unfinished_tasks} queued messages not written after {timeout:.0f}s"
+               )
+            self._queue.all_tasks_done.wait(min(remaining, 1.0))
+      error, self._error = self._error, None
+      if error is not None:
+         raise RuntimeError(f"chat_history: queued messages were dropped: {error}") from error
+
+   def close(self, timeout=WRITE_BEHIND_FLUSH_TIMEOUT):
+      try:
+         self.flush(timeout)
+      except (TimeoutError, RuntimeError) as e:
+         print(e)
+      self._stop.set()
+      self._thread.join(timeout)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def enable_write_behind(**kwargs):
+   """Start the write-behind writer (idempotent); queued rows are flushed at exit."""
+   global _writer
+   with _writer_lock:
+      if _writer is None:
+         _writer = WriteBehindWriter(**kwargs)
+         atexit.register(_writer.close)
+      return _writer
+
+
+def flush():
+   """Write out any queued messages (no-op without write-behind)."""
+   if _writer is not None:
+      _writer.flush()
+
+
+def _merge_pending(rows, pending, keep=lambda row_id: True):
+   """Merge a snapshot of queued rows into `rows` read from the database (sorted by id)."""
+   seen = {r["id"] for r in rows}
+   extra = [
+       {"id": p["id"], "role": p["role"], "content": p["content"]}
+       for p in pending if p["id"] not in seen and keep(p["id"])
+   ]
+   return sorted(rows + extra, key=lambda r: r["id"])
+
+
+def pending_snapshot(session_id):
+   return _writer.pending_rows(session_id) if _writer is not None else []
 
 
 def save_message(session_id, role, content):
-   conn = sqlite3.connect(DB_FILE)
-   c = conn.cursor()
-   c.execute(
-       "INSERT INTO chats (session_id, role, content) VALUES (?, ?, ?)",
-       (session_id, role, content),
-   )
-   conn.commit()
-   conn.close()
+   """Insert a message and return the stored row (with its id and timestamp)."""
+   if _writer is not None:
+      return _writer.submit(session_id, role, content)
+   conn = get_connection()
+   with conn:
+      cur = conn.execute(
+          "INSERT INTO chats (session_id, role, content) VALUES (?, ?, ?)",
+          (session_id, role, content),
+      )
+      row_id = cur.lastrowid
+      timestamp = conn.execute("SELECT timestamp FROM chats WHERE id=?", (row_id,)).fetchone()[0]
+   return {"id": row_id, "session_id": session_id, "role": role, "content": content, "timestamp": timestamp}
 
 
 def load_messages(session_id):
-   conn = sqlite3.connect(DB_FILE)
-   c = conn.cursor()
-   c.execute(
-       "SELECT role, content FROM chats WHERE session_id=? ORDER BY id ASC",
+   # Snapshot queued rows before reading, so a row committed in between is
+   # found in one of the two (duplicates are dropped by id)
+   pending = pending_snapshot(session_id)
+   conn = get_connection()
+   rows = conn.execute(
+       "SELECT id, role, content FROM chats WHERE session_id=? ORDER BY id ASC",
        (session_id,),
-   )
-   rows = c.fetchall()
-   conn.close()
-   return [{"role": r, "content": c} for r, c in rows]
+   ).fetchall()
+   # Archived (compressed) messages of the session come first, then live rows
+   rows = _archived_rows(conn, session_id) + [{"id": i, "role": r, "content": c} for i, r, c in rows]
+   return _merge_pending(rows, pending) if pending else rows
+
+
+def load_messages_after(session_id, after_id):
+   """Messages of a session persisted after `after_id`, oldest first."""
+   pending = pending_snapshot(session_id)
+   conn = get_connection()
+   rows = conn.execute(
+       "SELECT id, role, content FROM chats WHERE session_id=? AND id > ? ORDER BY id ASC",
+       (session_id, after_id),
+   ).fetchall()
+   rows = [{"id": i, "role": r, "content": c} for i, r, c in rows]
+   rows = _archived_rows(conn, session_id, after_id=after_id) + rows
+   return _merge_pending(rows, pending, lambda row_id: row_id > after_id) if pending else rows
+
+
+def load_messages_page(session_id, before_id=None, limit=50):
+   """Return up to `limit` messages older than `before_id` (newest page if None).
+
+   Messages come back oldest first, with a flag telling whether older ones exist:
+   ``(messages, has_older)``.
+   """
+   pending = pending_snapshot(session_id)
+   conn = get_connection()
+   if before_id is None:
+      rows = conn.execute(
+          "SELECT id, role, content FROM chats WHERE session_id=? ORDER BY id DESC LIMIT ?",
+          (session_id, limit + 1),
+      ).fetchall()
+   else:
+      rows = conn.execute(
+          "SELECT id, role, content FROM chats WHERE session_id=? AND id < ? ORDER BY id DESC LIMIT ?",
+          (session_id, before_id, limit + 1),
+      ).fetchall()
+   rows = [{"id": i, "role": r, "content": c} for i, r, c in rows]
+   rows.reverse()
+   if len(rows) <= limit:
+      # Not enough live rows: continue into the archive, if the session has one
+      archived = _archived_rows(conn, session_id, before_id=before_id)
+      rows = archived[-(limit + 1 - len(rows)):] + rows if archived else rows
+   if pending:
+      rows = _merge_pending(rows, pending, lambda row_id: before_id is None or row_id < before_id)
+   has_older = len(rows) > limit
+   return rows[-limit:] if limit else [], has_older
 
 
 def list_sessions():
-   conn = sqlite3.connect(DB_FILE)
-   c = conn.cursor()
-   c.execute("""
-       SELECT session_id, MIN(timestamp)
-       FROM chats
-       GROUP BY session_id
-       ORDER BY MIN(timestamp) DESC
-   """)
-   rows = c.fetchall()
-   conn.close()
-   return [sid for sid, _ in rows]
+   conn = get_connection()
+   rows = conn.execute(
+       "SELECT session_id FROM sessions ORDER BY started_at DESC, session_id DESC"
+   ).fetchall()
+   return [sid for sid, in rows]
 
 
 # Optional: get a short preview of each session
 def list_sessions_with_preview(limit=30):
-   conn = sqlite3.connect(DB_FILE)
+   conn = get_connection()
+   rows = conn.execute("""
+       SELECT session_id, started_at, SUBSTR(preview, 1, ?), last_active, message_count
+       FROM sessions
+       ORDER BY started_at DESC, session_id DESC
+   """, (limit,)).fetchall()
+   return [
+       {"session_id": sid, "started": ts, "preview": preview or "", "last_active": last, "message_count": count}
+       for sid, ts, preview, last, count in rows
+   ]
+
+
+def list_sessions_page(after_ts=None, after_id=None, page_size=20, preview_chars=50):
+   """Keyset-paginated sessions, newest first.
+
+   Pass the `started`/`session_id` of the last session of the previous page as
+   `after_ts`/`after_id` to get the next page. Returns ``(sessions, next_cursor)``
+   where `next_cursor` is ``(after_ts, after_id)`` or None on the last page.
+   """
+   conn = get_connection()
+   if after_ts is None:
+      rows = conn.execute("""
+          SELECT session_id, started_at, SUBSTR(preview, 1, ?), last_active, message_count
+          FROM sessions
+          ORDER BY started_at DESC, session_id DESC
+          LIMIT ?
+      """, (preview_chars, page_size + 1)).fetchall()
+   else:
+      rows = conn.execute("""
+          SELECT session_id, started_at, SUBSTR(preview, 1, ?), last_active, message_count
+          FROM sessions
+          WHERE (started_at, session_id) < (?, ?)
+          ORDER BY started_at DESC, session_id DESC
+          LIMIT ?
+      """, (preview_chars, after_ts, after_id or "", page_size + 1)).fetchall()
+   sessions = [
+       {"session_id": sid, "started": ts, "preview": preview or "", "last_active": last, "message_count": count}
+       for sid, ts, preview, last, count in rows[:page_size]
+   ]
+   next_cursor = None
+   if len(rows) > page_size:
+      next_cursor = (sessions[-1]["started"], sessions[-1]["session_id"])
+   return sessions, next_cursor
+
+
+# --- Full-text search ---
+# Candidate matches are taken newest-first (FTS5 walks its index in rowid
+# order and stops early), then ranked by bm25 and grouped per session. This
+# keeps searches bounded on databases with millions of messages; older
+# matches beyond the candidate limit are not ranked, and results say so.
+SEARCH_CANDIDATES = int(os.getenv("CHAT_SEARCH_CANDIDATES", "2000"))
+SNIPPET_TOKENS = 12
+
+
+def _fts_query(query):
+   """Turn free text into an FTS5 query: every word must match, as a prefix."""
+   terms = re.findall(r"\w+", query or "")
+   return " ".join(f'"{t}"*' for t in terms)
+
+
+def search_sessions(query, limit=20, offset=0, candidates=SEARCH_CANDIDATES):
+   """Return sessions matching `query`, best match first, with a highlighted snippet.
+
+   Matched words in `snippet` are wrapped in ** (markdown bold). Only the
+   newest `candidates` matching messages are ranked (0 ranks all of them);
+   `truncated` is True on every result when that limit was reached, i.e.
+   older matches may be missing.
+   """
+   match = _fts_query(query)
+   if not match:
+      return []
+   conn = get_connection()
+   has_fts = conn.execute(
+       "SELECT 1 FROM sqlite_master WHERE type='table' AND name='chats_fts'"
+   ).fetchone()
+   if not has_fts:
+      return _search_sessions_like(conn, query, limit, offset)
+
+   rows = conn.execute("""
+       WITH hits AS (
+           SELECT rowid AS id, bm25(chats_fts) AS score
+           FROM chats_fts WHERE chats_fts MATCH ?
+           ORDER BY rowid DESC LIMIT ?
+       ),
+       ranked AS (
+           SELECT c.session_id, h.id, h.score,
+                  ROW_NUMBER() OVER (PARTITION BY c.session_id ORDER BY h.score, h.id DESC) AS rn
+           FROM hits h JOIN chats c ON c.id = h.id
+       )
+       SELECT r.session_id, r.id, r.score, s.started_at, s.preview, (SELECT COUNT(*) FROM hits)
+       FROM ranked r LEFT JOIN sessions s ON s.session_id = r.session_id
+       WHERE r.rn = 1
+       ORDER BY r.score, r.id DESC
+       LIMIT ? OFFSET ?
+   """, (match, candidates if candidates > 0 else -1, limit, offset)).fetchall()
+
+   results = []
+   for session_id, message_id, score, started, preview, hits in rows:
+      snippet = conn.execute(
+          f"SELECT snippet(chats_fts, 0, '**', '**', '…', {SNIPPET_TOKENS}) "
+          "FROM chats_fts WHERE chats_fts MATCH ? AND rowid = ?",
+          (match, message_id),
+      ).fetchone()
+      results.append({
+          "session_id": session_id,
+          "started": started,
+          "preview": preview or "",
+          "snippet": snippet[0] if snippet else "",
+          "message_id": message_id,
+          "score": score,
+          "truncated": candidates > 0 and hits >= candidates,
+      })
+   return results
+
+
+def _search_sessions_like(conn, query, limit, offset):
+   rows = conn.execute("""
+       SELECT c.session_id, MAX(c.id), s.started_at, s.preview
+       FROM chats c LEFT JOIN sessions s ON s.session_id = c.session_id
+       WHERE c.content LIKE ?
+       GROUP BY c.session_id
+       ORDER BY MAX(c.id) DESC
+       LIMIT ? OFFSET ?
+   """, (f"%{query}%", limit, offset)).fetchall()
+   return [
+       {"session_id": sid, "started": started, "preview": preview or "", "snippet": preview or "",
+        "message_id": mid, "score": 0.0, "truncated": False}
+       for sid, mid, started, preview in rows
+   ]
+
+
+# --- Tool call traces ---
+def save_tool_calls(session_id, turn, calls):
+   """Persist tool calls of one turn.
+
+   Each call is a dict with tool, latency_ms and optionally server, args_hash,
+   output_bytes, cache_hit and error.
+   """
+   if not calls:
+      return
+   conn = get_connection()
+   with conn:
+      conn.executemany("""
+          INSERT INTO tool_calls
+              (session_id, turn, server, tool, args_hash, latency_ms, output_bytes, cache_hit, error)
+          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+      """, [
+          (session_id, turn, c.get("server"), c["tool"], c.get("args_hash"), c["latency_ms"],
+           c.get("output_bytes", 0), int(bool(c.get("cache_hit"))), int(bool(c.get("error"))))
+          for c in calls
+      ])
+
+
+def load_tool_calls(session_id, turn=None):
+   conn = get_connection()
+   sql = """
+       SELECT turn, server, tool, args_hash, latency_ms, output_bytes, cache_hit, error, created_at
+       FROM tool_calls WHERE session_id=?
+   """
+   params = (session_id,)
+   if turn is not None:
+      sql += " AND turn=?"
+      params += (turn,)
+   rows = conn.execute(sql + " ORDER BY id", params).fetchall()
+   keys = ("turn", "server", "tool", "args_hash", "latency_ms", "output_bytes", "cache_hit", "error", "created_at")
+   return [dict(zip(keys, r)) for r in rows]
+
+
+def top_tools(window_hours=24, limit=10):
+   """Tools ranked by total time spent in them over the last `window_hours`."""
+   conn = get_connection()
+   rows = conn.execute("""
+       SELECT tool, MAX(server), COUNT(*), SUM(latency_ms), AVG(latency_ms),
+              AVG(output_bytes), SUM(cache_hit), SUM(error)
+       FROM tool_calls
+       WHERE created_at >= datetime('now', ?)
+       GROUP BY tool
+       ORDER BY SUM(latency_ms) DESC
+       LIMIT ?
+   """, (f"-{window_hours} hours", limit)).fetchall()
+   keys = ("tool", "server", "calls", "total_ms", "avg_ms", "avg_output_bytes", "cache_hits", "errors")
+   return [dict(zip(keys, r)) for r in rows]
+
+
+def tool_latency_percentiles(window_hours=24, pct=95):
+   """Nearest-rank latency percentile per tool over the last `window_hours`: {tool: ms}."""
+   conn = get_connection()
+   rows = conn.execute("""
+       WITH ranked AS (
+           SELECT tool, latency_ms,
+                  ROW_NUMBER() OVER (PARTITION BY tool ORDER BY latency_ms) AS rn,
+                  COUNT(*) OVER (PARTITION BY tool) AS n
+           FROM tool_calls
+           WHERE created_at >= datetime('now', ?)
+       )
+       SELECT tool, latency_ms FROM ranked
+       WHERE rn = MAX(1, CAST(n * ? / 100.0 + 0.999999 AS INTEGER))
+   """, (f"-{window_hours} hours", pct)).fetchall()
+   return dict(rows)
+
+
+# --- LangGraph checkpoints ---
+# The agent graph persists its state (including tool calls and tool results)
+# in the same database through langgraph's SQLite checkpointer, using the
+# Streamlit session_id as thread_id. Only the latest checkpoints of a thread
+# are needed to resume it, so older ones are compacted away.
+CHECKPOINT_KEEP_LAST = 5
+
+
+def compact_checkpoints(thread_id=None, keep_last=CHECKPOINT_KEEP_LAST):
+   """Delete all but the newest `keep_last` checkpoints (per thread) and their writes.
+
+   Returns the number of checkpoints removed.
+   """
+   conn = get_connection()
    c = conn.cursor()
-   c.execute("""
-       SELECT session_id, MIN(timestamp),
-              SUBSTR(MAX(CASE WHEN role='user' THEN content END), 1, ?) as preview
-       FROM chats
-       GROUP BY session_id
-       ORDER BY MIN(timestamp) DESC
-   """, (limit,))
-   rows = c.fetchall()
-   conn.close()
-   return [{"session_id": sid, "started": ts, "preview": preview or ""} for sid, ts, preview in rows]
\ No newline at end of file
+   c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='checkpoints'")
+   if c.fetchone() is None:
+      return 0
+
+   thread_filter = "WHERE thread_id = ?" if thread_id else ""
+   params = (thread_id,) if thread_id else ()
+   # checkpoint_id is a time-ordered UUIDv6, so ordering by it is chronological
+   c.execute(f"""
+       DELETE FROM checkpoints WHERE rowid IN (
+           SELECT rowid FROM (
+               SELECT rowid, ROW_NUMBER() OVER (
+                   PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+               ) AS rn
+               FROM checkpoints {thread_filter}
+           ) WHERE rn > ?
+       )
+   """, params + (keep_last,))
+   removed = c.rowcount
+   c.execute(f"""
+       DELETE FROM writes
+       {"WHERE thread_id = ? AND" if thread_id else "WHERE"} NOT EXISTS (
+           SELECT 1 FROM checkpoints cp
+           WHERE cp.thread_id = writes.thread_id
+             AND cp.checkpoint_ns = writes.checkpoint_ns
+             AND cp.checkpoint_id = writes.checkpoint_id
+       )
+   """, params)
+   conn.commit()
+   return removed
+
+
+
+# --- Archive, retention and vacuum ---
+# Sessions idle for ARCHIVE_AFTER_DAYS have their messages compressed into one
+# blob in chats_archive (zstd when the optional `zstandard` package is
+# installed, zlib otherwise) and removed from chats. load_messages* decompress
+# them transparently. Archived messages are no longer in the full-text index,
+# so archiving is opt-in.
+ARCHIVE_AFTER_DAYS = float(os.getenv("CHAT_HISTORY_ARCHIVE_AFTER_DAYS", "0"))  # 0 = never archive
+RETENTION_DAYS = float(os.getenv("CHAT_HISTORY_RETENTION_DAYS", "0"))  # 0 = keep forever
+MAX_DB_MB = float(os.getenv("CHAT_HISTORY_MAX_DB_MB", "0"))  # 0 = unlimited
+MAINTENANCE_INTERVAL = float(os.getenv("CHAT_HISTORY_MAINTENANCE_INTERVAL", "3600"))  # 0 = disabled
+MAINTENANCE_BATCH = 100
+
+try:
+   import zstandard
+except ImportError:
+   zstandard = None
+
+
+def _compress(data: bytes):
+   if zstandard is not None:
+      return "zstd", zstandard.ZstdCompressor(level=10).compress(data)
+   return "zlib", zlib.compress(data, 9)
+
+
+def _decompress(codec, payload):
+   if codec == "zstd":
+      if zstandard is None:
+         raise RuntimeError("Archived session uses zstd but the 'zstandard' package is not installed")
+      return zstandard.ZstdDecompressor().decompress(payload)
+   return zlib.decompress(payload)
+
+
+def _archive_payload(conn, session_id, after_id=None, before_id=None):
+   # first_id/last_id let callers skip decompressing archives outside the id range
+   row = conn.execute("""
+       SELECT codec, payload FROM chats_archive
+       WHERE session_id=? AND last_id > ? AND first_id < ?
+   """, (session_id, -1 if after_id is None else after_id, before_id or 2**63 - 1)).fetchone()
+   if row is None:
+      return []
+   return [
+       r for r in json.loads(_decompress(*row))
+       if (after_id is None or r[0] > after_id) and (before_id is None or r[0] < before_id)
+   ]
+
+
+def _archived_rows(conn, session_id, after_id=None, before_id=None):
+   """Archived messages of a session as load_messages-style dicts (oldest first)."""
+   return [
+       {"id": i, "role": r, "content": c}
+       for i, r, c, _ in _archive_payload(conn, session_id, after_id, before_id)
+   ]
+
+
+def _db_bytes(conn):
+   page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+   pages = conn.execute("PRAGMA page_count").fetchone()[0]
+   free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+   return (pages - free) * page_size, pages * page_size
+
+
+def archive_sessions(older_than_days=ARCHIVE_AFTER_DAYS):
+   """Compress messages of sessions idle for `older_than_days`. Returns stats."""
+   flush()
+   conn = get_connection()
+   stats = {"sessions": 0, "messages": 0, "raw_bytes": 0, "compressed_bytes": 0}
+   while True:
+      session_ids = [sid for sid, in conn.execute("""
+          SELECT session_id FROM sessions
+          WHERE last_active < datetime('now', ?)
+            AND EXISTS (SELECT 1 FROM chats WHERE chats.session_id = sessions.session_id)
+          LIMIT ?
+      """, (f"-{older_than_days} days", MAINTENANCE_BATCH)).fetchall()]
+      if not session_ids:
+         return stats
+      with conn:
+         for session_id in session_ids:
+            live = conn.execute(
+                "SELECT id, role, content, timestamp FROM chats WHERE session_id=? ORDER BY id",
+                (session_id,),
+            ).fetchall()
+            # A resumed session may already have an archive: merge into one blob
+            rows = _archive_payload(conn, session_id) + [list(r) for r in live]
+            raw = json.dumps(rows, ensure_ascii=False).encode("utf-8")
+            codec, payload = _compress(raw)
+            conn.execute("""
+                INSERT OR REPLACE INTO chats_archive
+                    (session_id, codec, payload, raw_bytes, message_count, first_id, last_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (session_id, codec, payload, len(raw), len(rows), rows[0][0], rows[-1][0]))
+            conn.execute("DELETE FROM chats WHERE session_id=?", (session_id,))
+            conn.execute("UPDATE sessions SET archived=1 WHERE session_id=?", (session_id,))
+            _delete_checkpoints(conn, session_id)
+            stats["sessions"] += 1
+            stats["messages"] += len(live)
+            stats["raw_bytes"] += len(raw)
+            stats["compressed_bytes"] += len(payload)
+
+
+def _delete_checkpoints(conn, session_id):
+   # Archived sessions resume by re-seeding from load_messages
+   has_checkpoints = conn.execute(
+       "SELECT 1 FROM sqlite_master WHERE type='table' AND name='checkpoints'"
+   ).fetchone()
+   if has_checkpoints:
+      conn.execute("DELETE FROM checkpoints WHERE thread_id=?", (session_id,))
+      conn.execute("DELETE FROM writes WHERE thread_id=?", (session_id,))
+
+
+def delete_sessions(session_ids):
+   conn = get_connection()
+   with conn:
+      for session_id in session_ids:
+         conn.execute("DELETE FROM chats WHERE session_id=?", (session_id,))
+         conn.execute("DELETE FROM chats_archive WHERE session_id=?", (session_id,))
+         conn.execute("DELETE FROM sessions WHERE session_id=?", (session_id,))
+         conn.execute("DELETE FROM tool_calls WHERE session_id=?", (session_id,))
+         _delete_checkpoints(conn, session_id)
+   return len(session_ids)
+
+
+def enforce_retention(max_age_days=RETENTION_DAYS, max_db_mb=MAX_DB_MB):
+   """Delete sessions idle longer than `max_age_days`, then oldest sessions until under `max_db_mb`."""
+   flush()
+   conn = get_connection()
+   deleted = 0
+   if max_age_days:
+      while True:
+         session_ids = [sid for sid, in conn.execute(
+             "SELECT session_id FROM sessions WHERE last_active < datetime('now', ?) LIMIT ?",
+             (f"-{max_age_days} days", MAINTENANCE_BATCH),
+         ).fetchall()]
+         if not session_ids:
+            break
+         deleted += delete_sessions(session_ids)
+   if max_db_mb:
+      # Used bytes (excluding free pages) shrink as sessions are deleted
+      while _db_bytes(conn)[0] > max_db_mb * 1024 * 1024:
+         session_ids = [sid for sid, in conn.execute(
+             "SELECT session_id FROM sessions ORDER BY last_active LIMIT ?", (MAINTENANCE_BATCH // 10,)
+         ).fetchall()]
+         if not session_ids:
+            break
+         deleted += delete_sessions(session_ids)
+   return deleted
+
+
+def enable_incremental_vacuum():
+   """One-off migration of a database created without incremental auto_vacuum.
+
+   Rewrites the whole file with VACUUM (needs free disk space of about the
+   database size and blocks writers meanwhile), so it is run by hand:
+   `python chat_history.py enable-incremental-vacuum`. Returns False if the
+   database already uses incremental auto_vacuum.
+   """
+   flush()
+   conn = get_connection()
+   if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+      return False
+   conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+   conn.execute("VACUUM")
+   return True
+
+
+def incremental_vacuum():
+   """Return free pages to the OS; returns False on databases without incremental auto_vacuum."""
+   conn = get_connection()
+   enabled = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+   if enabled:
+      # Frees one page per step; execute() would only step it once
+      conn.executescript("PRAGMA incremental_vacuum;")
+   conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+   return enabled
+
+
+def _probe_latency_ms(conn):
+   """Median time of the sidebar query and of loading the most recent sessions."""
+   session_ids = [sid for sid, in conn.execute(
+       "SELECT session_id FROM sessions ORDER BY last_active DESC LIMIT 20"
+   ).fetchall()]
+   samples = {"list_sessions_page": [], "load_messages": []}
+   for _ in range(3):
+      start = time.perf_counter()
+      list_sessions_page(page_size=20)
+      samples["list_sessions_page"].append((time.perf_counter() - start) * 1000)
+      start = time.perf_counter()
+      for session_id in session_ids:
+         load_messages(session_id)
+      samples["load_messages"].append((time.perf_counter() - start) * 1000 / max(1, len(session_ids)))
+   return {k: round(sorted(v)[1], 3) for k, v in samples.items()}
+
+
+def run_maintenance(archive_after_days=ARCHIVE_AFTER_DAYS, retention_days=RETENTION_DAYS, max_db_mb=MAX_DB_MB):
+   """Archive, enforce retention and vacuum; report space reclaimed and latency before/after."""
+   conn = get_connection()
+   used_before, file_before = _db_bytes(conn)
+   latency_before = _probe_latency_ms(conn)
+
+   archived = archive_sessions(archive_after_days) if archive_after_days else {}
+   deleted = enforce_retention(retention_days, max_db_mb)
+   vacuumed = incremental_vacuum()
+
+   used_after, file_after = _db_bytes(conn)
+   return {
+       "archived": archived,
+       "deleted_sessions": deleted,
+       "db_bytes_before": file_before,
+       "db_bytes_after": file_after,
+       # The WAL checkpoint can grow the main file a little, which is not "negative reclaim"
+       "reclaimed_bytes": max(0, file_before - file_after),
+       "incremental_vacuum": vacuumed,
+       "used_bytes_before": used_before,
+       "used_bytes_after": used_after,
+       "latency_ms_before": latency_before,
+       "latency_ms_after": _probe_latency_ms(conn),
+   }
+
+
+_maintenance_thread = None
+
+
+def start_maintenance(interval=MAINTENANCE_INTERVAL):
+   """Run run_maintenance() every `interval` seconds in a daemon thread (once per process)."""
+   global _maintenance_thread
+   if not interval or _maintenance_thread is not None:
+      return
+
+   def loop():
+      while True:
+         time.sleep(interval)
+         try:
+            report = run_maintenance()
+            print(f"chat_history maintenance: {json.dumps(report)}")
+         except Exception as e:
+            print(f"chat_history maintenance failed: {e}")
+
+   _maintenance_thread = threading.Thread(target=loop, name="chat-history-maintenance", daemon=True)
+   _maintenance_thread.start()
+
+
+
+# --- Export / import ---
+# One JSON object per message and line: {"id", "session_id", "role", "content",
+# "timestamp"}. Both directions stream in fixed-size batches, so memory use does
+# not grow with the size of the history.
+EXPORT_BATCH_ROWS = 1000
+IMPORT_BATCH_ROWS = 500
+
+
+def export_sessions(since=None, until=None):
+   """Yield every message (archived ones included) with since <= timestamp < until.
+
+   `since`/`until` are 'YYYY-MM-DD[ HH:MM:SS]' strings (UTC), or None for open ends.
+   """
+   flush()
+   conn = get_connection()
+   since = since or ""
+   until = until or "9999-12-31"
+
+   last_session = ""
+   while True:
+      session_ids = [sid for sid, in conn.execute(
+          "SELECT session_id FROM chats_archive WHERE session_id > ? ORDER BY session_id LIMIT ?",
+          (last_session, EXPORT_BATCH_ROWS),
+      ).fetchall()]
+      if not session_ids:
+         break
+      last_session = session_ids[-1]
+      for session_id in session_ids:
+         for row_id, role, content, timestamp in _archive_payload(conn, session_id):
+            if since <= (timestamp or "") < until:
+               yield {"id": row_id, "session_id": session_id, "role": role, "content": content, "timestamp": timestamp}
+
+   last_id = 0
+   while True:
+      rows = conn.execute("""
+          SELECT id, session_id, role, content, timestamp FROM chats
+          WHERE id > ? AND timestamp >= ? AND timestamp < ?
+          ORDER BY id LIMIT ?
+      """, (last_id, since, until, EXPORT_BATCH_ROWS)).fetchall()
+      if not rows:
+         return
+      last_id = rows[-1][0]
+      for row_id, session_id, role, content, timestamp in rows:
+         yield {"id": row_id, "session_id": session_id, "role": role, "content": content, "timestamp": timestamp}
+
+
+def _existing_ids(conn, batch):
+   """{id: session_id} of batch ids already stored, live or archived.
+
+   Archives are only decompressed when their id range overlaps the batch, and
+   only ids of the batch are kept, so memory is bounded by the batch size.
+   """
+   ids = [r["id"] for r in batch]
+   placeholders = ",".join("?" * len(ids))
+   existing = dict(conn.execute(f"SELECT id, session_id FROM chats WHERE id IN ({placeholders})", ids).fetchall())
+   wanted = set(ids)
+   for session_id in {r["session_id"] for r in batch}:
+      for archived in _archive_payload(conn, session_id, after_id=min(ids) - 1, before_id=max(ids) + 1):
+         if archived[0] in wanted:
+            existing[archived[0]] = session_id
+   return existing
+
+
+def import_sessions(stream, batch_rows=IMPORT_BATCH_ROWS):
+   """Import messages from JSONL lines (or dicts) produced by export_sessions().
+
+   Idempotent: a message whose (session_id, id) is already stored is skipped;
+   an id taken by another session is counted as a conflict and skipped. Each
+   batch is one transaction. Yields running totals after every batch, the last
+   one being the final result. Run it while the app is stopped (or without
+   write-behind), since ids reserved by a running writer are not visible here.
+   """
+   flush()
+   conn = get_connection()
+   stats = {"read": 0, "inserted": 0, "duplicates": 0, "conflicts": 0}
+
+   def write(batch):
+      existing = _existing_ids(conn, batch)
+      new_rows = []
+      for row in batch:
+         owner = existing.get(row["id"])
+         if owner is None:
+            new_rows.append(row)
+            existing[row["id"]] = row["session_id"]  # duplicates within the batch
+         elif owner == row["session_id"]:
+            stats["duplicates"] += 1
+         else:
+            stats["conflicts"] += 1
+      with conn:
+         cursor = conn.executemany(
+             "INSERT OR IGNORE INTO chats (id, session_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+             [(r["id"], r["session_id"], r["role"], r["content"], r["timestamp"]) for r in new_rows],
+         )
+      stats["inserted"] += cursor.rowcount
+
+   batch = []
+   for line in stream:
+      if isinstance(line, (str, bytes)):
+         if not line.strip():
+            continue
+         line = json.loads(line)
+      batch.append(line)
+      stats["read"] += 1
+      if len(batch) >= batch_rows:
+         write(batch)
+         batch = []
+         yield dict(stats)
+   if batch:
+      write(batch)
+   yield dict(stats)
+
+
+def _open_jsonl(path, mode):
+   if path in (None, "-"):
+      return sys.stdin if mode == "r" else sys.stdout
+   opener = gzip.open if path.endswith(".gz") else open
+   return opener(path, mode + "t", encoding="utf-8")
+
+
+def _progress(label, count, start, final=False):
+   elapsed = time.perf_counter() - start
+   rate = count / elapsed if elapsed else 0.0
+   print(f"\r{label}: {count} rows, {rate:,.0f} rows/s", end="\n" if final else "", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+   global DB_FILE
+   parser = argparse.ArgumentParser(description="Chat history export/import (JSONL, .gz supported) and maintenance")
+   parser.add_argument("--db", default=DB_FILE, help="Chat history database")
+   commands = parser.add_subparsers(dest="command", required=True)
+   export_cmd = commands.add_parser("export", help="Write messages as JSONL")
+   export_cmd.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+   export_cmd.add_argument("--since", help="Only messages at or after this UTC time (YYYY-MM-DD[ HH:MM:SS])")
+   export_cmd.add_argument("--until", help="Only messages before this UTC time")
+   import_cmd = commands.add_parser("import", help="Read messages from JSONL")
+   import_cmd.add_argument("input", nargs="?", default="-", help="Input file (default: stdin)")
+   import_cmd.add_argument("--batch-rows", type=int, default=IMPORT_BATCH_ROWS, help="Rows per transaction")
+   commands.add_parser(
+       "enable-incremental-vacuum",
+       help="Convert the database to incremental auto_vacuum (one-off full VACUUM)",
+   )
+   args = parser.parse_args(argv)
+
+   DB_FILE = args.db
+   init_db()
+   start = time.perf_counter()
+
+   if args.command == "enable-incremental-vacuum":
+      converted = enable_incremental_vacuum()
+      elapsed = time.perf_counter() - start
+      print("converted" if converted else "already incremental", f"in {elapsed:.1f}s", file=sys.stderr)
+   elif args.command == "export":
+      out = _open_jsonl(args.output, "w")
+      count = 0
+      try:
+         for row in export_sessions(args.since, args.until):
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+            if count % 10000 == 0:
+               _progress("exported", count, start)
+      finally:
+         if out is not sys.stdout:
+            out.close()
+      _progress("exported", count, start, final=True)
+   else:
+      stream = _open_jsonl(args.input, "r")
+      stats = {"read": 0}
+      try:
+         for stats in import_sessions(stream, batch_rows=args.batch_rows):
+            _progress("imported", stats["read"], start)
+      finally:
+         if stream is not sys.stdin:
+            stream.close()
+      _progress("imported", stats["read"], start, final=True)
+      print(json.dumps(stats), file=sys.stderr)
+
+
+if WRITE_BEHIND:
+   enable_write_behind()
+
+
+if __name__ == "__main__":
+   main()
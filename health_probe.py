@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+
+from fastapi.responses import JSONResponse
+
+# --- Probe settings (override via environment) ---
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "30"))
+# Results older than this no longer count as ready (e.g. the prober is stuck)
+HEALTH_PROBE_STALE_AFTER = float(os.getenv("HEALTH_PROBE_STALE_AFTER", str(3 * HEALTH_PROBE_INTERVAL)))
+
+
+class HealthProber:
+    """Runs upstream checks on an interval in a background thread and caches the results.
+
+    `checks` maps a name to a callable that raises (or returns False) when the
+    upstream is unhealthy; a returned string is kept as detail. Critical checks
+    decide readiness; the others only mark the service as degraded. Health
+    endpoints serve the cached results, so probes never wait on upstreams.
+    """
+
+    def __init__(self, checks, critical=(), interval=HEALTH_PROBE_INTERVAL, stale_after=HEALTH_PROBE_STALE_AFTER):
+        self.checks = checks
+        self.critical = set(critical)
+        self.interval = interval
+        self.stale_after = stale_after
+        self._results = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.started_at = time.time()
+
+    def start(self):
+        """Start the probe thread (once)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="health-prober", daemon=True)
+            self._thread.start()
+        return self
+
+    def _loop(self):
+        while True:
+            self.run_once()
+            time.sleep(self.interval)
+
+    def run_once(self):
+        for name, check in self.checks.items():
+            start = time.perf_counter()
+            try:
+                outcome = check()
+                ok, detail = outcome is not False, outcome if isinstance(outcome, str) else ""
+            except Exception as e:
+                ok, detail = False, str(e)
+            result = {
+                "ok": ok,
+                "detail": detail,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+                "checked_at": time.time(),
+            }
+            with self._lock:
+                self._results[name] = result
+
+    def alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        with self._lock:
+            results = {name: dict(r) for name, r in self._results.items()}
+        checks = {}
+        for name in self.checks:
+            r = results.get(name)
+            if r is None:
+                checks[name] = {"ok": None, "detail": "not checked yet", "critical": name in self.critical}
+                continue
+            r["age_s"] = round(now - r.pop("checked_at"), 1)
+            r["stale"] = r["age_s"] > self.stale_after
+            r["critical"] = name in self.critical
+            checks[name] = r
+
+        critical = [checks[name] for name in self.critical]
+        ready = all(c["ok"] and not c["stale"] for c in critical)
+        if any(c["ok"] is None for c in checks.values()):
+            status = "starting"
+        elif not ready:
+            status = "error"
+        elif all(c["ok"] for c in checks.values()):
+            status = "ok"
+        else:
+            status = "degraded"
+        return {
+            "status": status,
+            "ready": ready,
+            "uptime_s": round(now - self.started_at, 1),
+            "checks": checks,
+        }
+
+
+def add_health_routes(app, prober: HealthProber):
+    """/health (cached detail), /livez (process and prober alive) and /readyz (critical checks pass)."""
+
+    @app.get("/health")
+    def health_check():
+        snapshot = prober.snapshot()
+        return JSONResponse(content=snapshot, status_code=200 if snapshot["ready"] else 503)
+
+    @app.get("/livez")
+    def livez():
+        alive = prober.alive()
+        return JSONResponse(content={"status": "ok" if alive else "prober stopped"}, status_code=200 if alive else 503)
+
+    @app.get("/readyz")
+    def readyz():
+        snapshot = prober.snapshot()
+        return JSONResponse(content={"status": snapshot["status"]}, status_code=200 if snapshot["ready"] else 503)
@@ -1,74 +1,177 @@
 import subprocess
 from mcp.server.fastmcp import FastMCP
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
-import uvicorn
-import threading
-import time
 import os
+import signal
+import sqlite3
+import tracing
+from health_probe import HealthProber, add_health_routes
+from mcp_serving import serve
 
 # --- Initialize MCP server for Kubernetes ---
 # Bind to 0.0.0.0 so other containers can reach it
 mcp = FastMCP("Kubernetes", host="0.0.0.0", port=8000)
+# Every tool call is a span, joined to the caller's trace via its traceparent header
+tracing.instrument_mcp(mcp, "k8s-mcp")
 
 # --- FastAPI app for health ---
+# The apiserver is probed in the background; the routes serve cached results.
+# It is not critical: the server stays ready (reported as degraded) without a cluster.
 k8s_health_app = FastAPI()
+APISERVER_PROBE_TIMEOUT = int(os.getenv("APISERVER_PROBE_TIMEOUT", "5"))
 
-@k8s_health_app.get("/health")
-def health_check():
-    return JSONResponse(content={"status": "ok"})
+
+def check_apiserver():
+    result = subprocess.run(
+        ["kubectl", "get", "--raw", "/readyz", f"--request-timeout={APISERVER_PROBE_TIMEOUT}s"],
+        capture_output=True, text=True, timeout=APISERVER_PROBE_TIMEOUT + 5,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"kubectl exited with {result.returncode}")
+    return result.stdout.strip()
+
+
+k8s_prober = HealthProber({"apiserver": check_apiserver})
+add_health_routes(k8s_health_app, k8s_prober)
 
 # --- Detect if running inside a container ---
 def running_in_container() -> bool:
     return os.path.exists("/.dockerenv") or os.environ.get("KUBERNETES_CHAT_CONTAINER") == "true"
 
-active_forwards = {}
-
 # --- Utility: run kubectl safely ---
 def run_kubectl(command: str, empty_msg: str = None) -> str:
     """Run a kubectl command and return output, friendly message if empty, or unknown command."""
-    try:
-        result = subprocess.run(
-            command, shell=True, capture_output=True, text=True, check=True
+    # Only the verb and resource are recorded: arguments may carry secrets
+    with tracing.span("kubectl", command=" ".join(command.split()[:3])) as span:
+        try:
+            result = subprocess.run(
+                command, shell=True, capture_output=True, text=True, check=True
+            )
+            output = result.stdout.strip()
+            span.set(output_bytes=len(output))
+            if not output:
+                return empty_msg or "No resources found for your query."
+            return output
+        except subprocess.CalledProcessError as e:
+            stderr = e.stderr.strip()
+            span.set(exit_code=e.returncode)
+            span.fail(stderr)
+            if "unknown command" in stderr or "no resources found" in stderr.lower():
+                return "Sorry, I don’t have a tool for that action yet."
+            return f"Error: {stderr}"
+
+# --- Port-forward registry ---
+# kubectl port-forward processes are recorded in SQLite rather than in process
+# memory, so with several workers (see mcp_serving.py) any worker can stop a
+# forward another one started, and a restarted worker does not lose track.
+PORT_FORWARD_DB = os.getenv("PORT_FORWARD_DB", "data/port_forwards.db")
+
+_forward_procs = {}  # pid -> Popen, for the forwards started by this process
+
+
+def forward_registry():
+    os.makedirs(os.path.dirname(PORT_FORWARD_DB) or ".", exist_ok=True)
+    conn = sqlite3.connect(PORT_FORWARD_DB, timeout=10, isolation_level=None)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS port_forwards (
+            key TEXT PRIMARY KEY,
+            pid INTEGER NOT NULL,
+            local_port INTEGER NOT NULL,
+            remote_port INTEGER,
+            namespace TEXT,
+            target_type TEXT,
+            started_at DATETIME DEFAULT CURRENT_TIMESTAMP
         )
-        output = result.stdout.strip()
-        if not output:
-            return empty_msg or "No resources found for your query."
-        return output
-    except subprocess.CalledProcessError as e:
-        stderr = e.stderr.strip()
-        if "unknown command" in stderr or "no resources found" in stderr.lower():
-            return "Sorry, I don’t have a tool for that action yet."
-        return f"Error: {stderr}"
+    """)
+    return conn
+
+
+def forward_alive(pid: int) -> bool:
+    """True if `pid` is a running kubectl port-forward (not exited, not a reused pid)."""
+    if not os.path.isdir("/proc/self"):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            state = f.read().rsplit(")", 1)[1].split()[0]
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read()
+    except OSError:
+        return False
+    # An exited forward of another worker stays a zombie until that worker reaps it
+    return state != "Z" and b"port-forward" in cmdline
+
+
+def _reap_forwards():
+    for pid, proc in list(_forward_procs.items()):
+        if proc.poll() is not None:
+            del _forward_procs[pid]
+
+
+def _terminate_forward(pid: int):
+    proc = _forward_procs.pop(pid, None)
+    if proc is not None:
+        proc.terminate()
+        proc.wait()
+    elif forward_alive(pid):
+        os.kill(pid, signal.SIGTERM)  # started by another worker, which reaps it
+
+
+def _live_forwards(conn) -> dict:
+    """{key: local_port} of running forwards; rows of exited ones are dropped."""
+    live = {}
+    for key, pid, local_port in conn.execute("SELECT key, pid, local_port FROM port_forwards").fetchall():
+        if forward_alive(pid):
+            live[key] = local_port
+        else:
+            conn.execute("DELETE FROM port_forwards WHERE key=?", (key,))
+    return live
+
 
 # --- Start port-forward ---
 def start_port_forward(target_type: str, name: str, local_port: int, remote_port: int, namespace: str):
     key = f"{target_type}/{namespace}/{name}"
-
-    if key in active_forwards:
-        return f"⚠️ Port-forward already active for {key} on local port {active_forwards[key]['local_port']}"
-
-    # Bind address based on environment
-    addr = "0.0.0.0" if running_in_container() else "127.0.0.1"
-
-    cmd = [
-        "kubectl",
-        "port-forward",
-        f"{target_type}/{name}",
-        f"{local_port}:{remote_port}",
-        "-n",
-        namespace,
-        "--address", addr
-    ]
-
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    active_forwards[key] = {
-        "proc": proc,
-        "local_port": local_port,
-        "remote_port": remote_port,
-        "namespace": namespace,
-        "target_type": target_type
-    }
+    _reap_forwards()
+    conn = forward_registry()
+    try:
+        # Serializes starts across workers: the check and the insert happen in one transaction
+        conn.execute("BEGIN IMMEDIATE")
+        live = _live_forwards(conn)
+        if key in live:
+            return f"⚠️ Port-forward already active for {key} on local port {live[key]}"
+        busy = next((k for k, port in live.items() if port == local_port), None)
+        if busy:
+            return f"⚠️ Local port {local_port} is already used by the port-forward for {busy}"
+
+        # Bind address based on environment
+        addr = "0.0.0.0" if running_in_container() else "127.0.0.1"
+
+        cmd = [
+            "kubectl",
+            "port-forward",
+            f"{target_type}/{name}",
+            f"{local_port}:{remote_port}",
+            "-n",
+            namespace,
+            "--address", addr
+        ]
+
+        # Detached from the worker (own session, no pipes) so it outlives a worker restart
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        _forward_procs[proc.pid] = proc
+        conn.execute(
+            "INSERT INTO port_forwards (key, pid, local_port, remote_port, namespace, target_type) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, proc.pid, local_port, remote_port, namespace, target_type),
+        )
+    finally:
+        conn.commit()
+        conn.close()
 
     msg = f"✅ Port-forward active: {target_type}/{name}:{remote_port} -> local port {local_port}"
     if running_in_container():
@@ -81,17 +184,32 @@ def start_port_forward(target_type: str, name: str, local_port: int, remote_port
 # --- Stop port-forward ---
 def stop_port_forward(target_type: str, name: str, namespace: str = "default") -> str:
     key = f"{target_type}/{namespace}/{name}"
-    if key not in active_forwards:
-        return f"No active port-forward found for {key}"
-
-    proc = active_forwards[key]["proc"]
-    proc.terminate()
-    proc.wait()
-    del active_forwards[key]
+    _reap_forwards()
+    conn = forward_registry()
+    try:
+        row = conn.execute("SELECT pid FROM port_forwards WHERE key=?", (key,)).fetchone()
+        if row is None:
+            return f"No active port-forward found for {key}"
+        _terminate_forward(row[0])
+        conn.execute("DELETE FROM port_forwards WHERE key=?", (key,))
+    finally:
+        conn.close()
 
     return f"Port-forward stopped for {key}"
 
 
+def stop_all_port_forwards():
+    """Stop every registered port-forward (on server shutdown)."""
+    conn = forward_registry()
+    try:
+        for key, pid in conn.execute("SELECT key, pid FROM port_forwards").fetchall():
+            _terminate_forward(pid)
+            conn.execute("DELETE FROM port_forwards WHERE key=?", (key,))
+            print(f"Port-forward stopped for {key}")
+    finally:
+        conn.close()
+
+
 # --- Core resources ---
 @mcp.tool(name="get_nodes", description="List all nodes in the cluster")
 def get_nodes() -> str:
@@ -456,21 +574,8 @@ def list_contexts() -> str:
         "No contexts found in your kubeconfig."
     )
 
-# --- Run MCP server ---
-def run_k8s_mcp():
-    print("Kubernetes MCP server running on port 8000")
-    mcp.run(transport="streamable-http")
-
-# --- Run Health server ---
-def run_k8s_health_server():
-    print("Kubernetes Health server running on port 8001")
-    uvicorn.run(k8s_health_app, host="0.0.0.0", port=8001)
-
+# --- Run MCP and health servers ---
 if __name__ == "__main__":
-    # Start both servers in separate threads
-    threading.Thread(target=run_k8s_mcp, daemon=True).start()
-    threading.Thread(target=run_k8s_health_server, daemon=True).start()
-
-    # Keep main thread alive
-    while True:
-        time.sleep(1)
+    # One process by default; MCP_WORKERS=N serves N worker processes behind port 8000 (see mcp_serving.py)
+    serve(mcp, "k8_mcp_server:mcp", health_app=k8s_health_app, health_port=8001, prober=k8s_prober,
+          on_shutdown=stop_all_port_forwards)
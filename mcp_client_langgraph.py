@@ -1,41 +1,45 @@
+import argparse
 import asyncio
+import json
+import time
+from contextlib import AsyncExitStack
 from langchain_mcp_adapters.client import MultiServerMCPClient
-# from langchain_mistralai import ChatMistralAI
-from langchain_openai import ChatOpenAI   
+from langchain_mcp_adapters.tools import load_mcp_tools
 from langgraph.graph import StateGraph, MessagesState, START, END
 from langgraph.prebuilt import ToolNode
+from langchain_core.runnables import RunnableConfig
 import os
 from dotenv import load_dotenv
 
-# Load environment variables
+# Load environment variables before the project modules, which read their settings at import
 load_dotenv()
 
+from tool_router import bind_routed_tools  # noqa: E402
+import answer_cache  # noqa: E402
+from model_backend import create_chat_model  # noqa: E402
 
-async def run_k8s_query(user_input: str):
-    # mistral_key = os.getenv("MISTRAL_API_KEY")
-    deepseek_key = os.getenv("DEEPSEEK_API_KEY")
-
-    # Initialize Mistral model
-    # model = ChatMistralAI(model="mistral-medium-latest", api_key=mistral_key)
-    model = ChatOpenAI(
-        # model="deepseek-chat",
-        model="deepseek-reasoner",
-        api_key=deepseek_key,
-        base_url="https://api.deepseek.com",
-    )
+MCP_CONNECTIONS = {
+    "kubernetes": {
+        "transport": "streamable_http",
+        "url": os.getenv("MCP_SERVER_URL", "http://127.0.0.1:8000/mcp"),
+    }
+}
 
-    # Connect to your Kubernetes MCP server
-    client = MultiServerMCPClient(
-        {
-            "kubernetes": {
-                "transport": "streamable_http",
-                "url": "http://127.0.0.1:8000/mcp",
-            }
-        }
-    )
 
-    tools = await client.get_tools()
-    model_with_tools = model.bind_tools(tools)
+def create_model():
+    # Deepseek by default; LLM_BACKEND=fake selects the scripted offline model
+    return create_chat_model("deepseek-reasoner")
+
+
+def build_graph(model, tools):
+    """Compile the agent graph.
+
+    If the run config carries a ``stats`` dict under ``configurable``, model and
+    tool time (seconds) and call counts are accumulated into it, so concurrent
+    queries sharing one graph each get their own breakdown.
+    """
+    # Bind only the tools relevant to the conversation (falls back to all tools)
+    model_for = bind_routed_tools(model, tools)
     tool_node = ToolNode(tools)
 
     # LangGraph pipeline
@@ -46,22 +50,52 @@ async def run_k8s_query(user_input: str):
             return "tools"
         return END
 
-    async def call_model(state: MessagesState):
+    async def call_model(state: MessagesState, config: RunnableConfig):
         messages = state["messages"]
-        response = await model_with_tools.ainvoke(messages)
+        start = time.perf_counter()
+        response = await model_for(messages).ainvoke(messages)
+        stats = config.get("configurable", {}).get("stats")
+        if stats is not None:
+            stats["llm_s"] += time.perf_counter() - start
+            stats["llm_calls"] += 1
         return {"messages": [response]}
 
+    async def call_tools(state: MessagesState, config: RunnableConfig):
+        start = time.perf_counter()
+        result = await tool_node.ainvoke(state, config)
+        stats = config.get("configurable", {}).get("stats")
+        if stats is not None:
+            stats["tool_s"] += time.perf_counter() - start
+            stats["tool_calls"] += len(state["messages"][-1].tool_calls)
+        return result
+
     builder = StateGraph(MessagesState)
     builder.add_node("call_model", call_model)
-    builder.add_node("tools", tool_node)
+    builder.add_node("tools", call_tools)
     builder.add_edge(START, "call_model")
     builder.add_conditional_edges("call_model", should_continue)
     builder.add_edge("tools", "call_model")
 
-    graph = builder.compile()
+    return builder.compile()
+
+
+async def run_k8s_query(user_input: str):
+    model = create_model()
+
+    # Connect to your Kubernetes MCP server
+    client = MultiServerMCPClient(MCP_CONNECTIONS)
+
+    tools = await client.get_tools()
+
+    cached_answer = await answer_cache.lookup(user_input, model.model_name, tools)
+    if cached_answer is not None:
+        return cached_answer
+
+    graph = build_graph(model, tools)
 
     result = await graph.ainvoke({"messages": [{"role": "user", "content": user_input}]})
     last_msg = result["messages"][-1].content
+    answer_cache.record(user_input, model.model_name, result["messages"][1:], answer_cache.content_text(last_msg))
 
     # Fallback if command is not supported
     if "Mistral" in str(last_msg) and "tool" in str(last_msg).lower():
@@ -74,6 +108,108 @@ async def run_k8s_query(user_input: str):
     return last_msg if isinstance(last_msg, str) else str(last_msg)
 
 
+# --- Batch mode ---
+def read_queries(path: str):
+    """Read queries from a JSONL file.
+
+    Each line is an object with the query under ``query`` or ``input`` and an
+    optional ``request_id``/``id``. Other lines are skipped.
+    """
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            text = next((item[k] for k in ("query", "input") if item.get(k)), None)
+            if text is None:
+                print(f"Skipping line {line_no}: no query field")
+                continue
+            queries.append({"id": item.get("request_id") or item.get("id") or line_no, "query": text})
+    return queries
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+async def run_batch(input_path: str, output_path: str, concurrency: int):
+    queries = read_queries(input_path)
+    print(f"🚀 Running {len(queries)} queries with concurrency {concurrency}")
+
+    model = create_model()
+    client = MultiServerMCPClient(MCP_CONNECTIONS)
+
+    # One MCP session per server and one compiled graph, shared by all queries
+    async with AsyncExitStack() as stack:
+        tools = []
+        for server_name in MCP_CONNECTIONS:
+            session = await stack.enter_async_context(client.session(server_name))
+            tools.extend(await load_mcp_tools(session))
+        graph = build_graph(model, tools)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(item):
+            stats = {"llm_s": 0.0, "tool_s": 0.0, "llm_calls": 0, "tool_calls": 0}
+            record = {"id": item["id"], "query": item["query"], "answer": None, "error": None}
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    result = await graph.ainvoke(
+                        {"messages": [{"role": "user", "content": item["query"]}]},
+                        {"configurable": {"stats": stats}},
+                    )
+                    record["answer"] = answer_cache.content_text(result["messages"][-1].content)
+                except Exception as e:
+                    record["error"] = str(e)
+                record["latency_s"] = round(time.perf_counter() - start, 4)
+            record.update({k: round(v, 4) if isinstance(v, float) else v for k, v in stats.items()})
+            return record
+
+        wall_start = time.perf_counter()
+        tasks = [asyncio.create_task(run_one(item)) for item in queries]
+        results = []
+        with open(output_path, "w", encoding="utf-8") as out:
+            for task in asyncio.as_completed(tasks):
+                record = await task
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                results.append(record)
+                status = "error" if record["error"] else "ok"
+                print(f"  [{len(results)}/{len(queries)}] {record['id']}: {status} in {record['latency_s']:.2f}s")
+        wall = time.perf_counter() - wall_start
+
+    print_batch_summary(results, wall, output_path)
+
+
+def print_batch_summary(results, wall: float, output_path: str):
+    latencies = [r["latency_s"] for r in results]
+    errors = sum(1 for r in results if r["error"])
+    llm_total = sum(r["llm_s"] for r in results)
+    tool_total = sum(r["tool_s"] for r in results)
+
+    print(f"\n📊 Batch summary ({len(results)} queries, {errors} errors) → {output_path}")
+    print(f"  Wall time:   {wall:.2f}s")
+    print(f"  Throughput:  {len(results) / wall if wall else 0:.2f} queries/s")
+    print(
+        f"  Latency:     p50 {percentile(latencies, 50):.2f}s  p90 {percentile(latencies, 90):.2f}s  "
+        f"p99 {percentile(latencies, 99):.2f}s  max {max(latencies, default=0):.2f}s"
+    )
+    print(f"  LLM time:    {llm_total:.2f}s total ({sum(r['llm_calls'] for r in results)} calls)")
+    print(f"  Tool time:   {tool_total:.2f}s total ({sum(r['tool_calls'] for r in results)} calls)")
+    print("  Tool calls per query:")
+    for r in sorted(results, key=lambda r: str(r["id"])):
+        print(f"    {r['id']}: {r['tool_calls']}")
+
+
 async def main():
     print("🚀 Kubernetes MCP Client (interactive)")
     print("Type 'exit' to quit.\n")
@@ -93,4 +229,13 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Kubernetes MCP client (interactive or batch)")
+    parser.add_argument("--batch", metavar="FILE", help="Run queries from a JSONL file instead of interactively")
+    parser.add_argument("--concurrency", type=int, default=4, help="Queries run in parallel in batch mode")
+    parser.add_argument("--output", default="batch_results.jsonl", help="Where batch results are written (JSONL)")
+    args = parser.parse_args()
+
+    if args.batch:
+        asyncio.run(run_batch(args.batch, args.output, max(1, args.concurrency)))
+    else:
+        asyncio.run(main())
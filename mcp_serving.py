@@ -0,0 +1,346 @@
+"""Serving mode for the MCP servers: one process, or N worker processes behind one port.
+
+With MCP_WORKERS=1 (the default) the MCP app and its health app run in one
+process, as before. With more, the process becomes a supervisor: it starts N
+workers (each a full copy of the server listening on a private Unix socket),
+proxies the public port to them and keeps every streamable-http session on the
+worker that created it, keyed by the mcp-session-id header. Dead workers are
+restarted with backoff. SIGTERM/SIGINT stop accepting connections, let
+in-flight requests finish (up to MCP_GRACEFUL_TIMEOUT) and then stop the
+workers; SIGHUP restarts the workers one at a time.
+
+State shared by all workers must not live in worker memory (see the
+port-forward registry in k8_mcp_server.py). Everything else, such as the
+boto3 client pool, is per worker.
+
+    MCP_WORKERS=4 python k8_mcp_server.py
+"""
+import argparse
+import collections
+import contextlib
+import importlib
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# --- Serving settings (override via environment) ---
+MCP_WORKERS = int(os.getenv("MCP_WORKERS", "1"))
+# Seconds in-flight requests (and open SSE streams) get to finish on shutdown
+MCP_GRACEFUL_TIMEOUT = float(os.getenv("MCP_GRACEFUL_TIMEOUT", "30"))
+# Idle sessions beyond this many are forgotten by the proxy (least recently used first)
+MAX_TRACKED_SESSIONS = 10000
+RESTART_BACKOFF_MAX = 30.0
+WORKER_START_TIMEOUT = 30.0
+
+SESSION_HEADER = "mcp-session-id"
+# Connection-level headers the proxy does not pass on
+HOP_HEADERS = {"connection", "keep-alive", "proxy-connection", "transfer-encoding", "te", "trailer", "upgrade"}
+PROXY_METHODS = ["GET", "POST", "DELETE", "PUT", "PATCH", "OPTIONS", "HEAD"]
+
+
+def _server(app, **kwargs):
+    return uvicorn.Server(uvicorn.Config(app, timeout_graceful_shutdown=int(MCP_GRACEFUL_TIMEOUT), **kwargs))
+
+
+# --- Worker processes ---
+class Worker:
+    def __init__(self, index: int, socket_path: str):
+        self.index = index
+        self.socket_path = socket_path
+        self.proc = None
+        self.client = None  # httpx client over the worker's socket, owned by the proxy loop
+        self.started_at = 0.0
+        self.restart_at = None
+        self.backoff = 0.0
+        self.restarts = 0
+        self.in_flight = 0
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def ready(self) -> bool:
+        return self.alive() and os.path.exists(self.socket_path)
+
+
+class WorkerPool:
+    """Supervises the worker processes and proxies requests to them with session affinity."""
+
+    def __init__(self, name: str, app_spec: str, workers: int):
+        self.name = name
+        self.app_spec = app_spec
+        self.socket_dir = tempfile.mkdtemp(prefix="mcp-workers-")
+        self.workers = [Worker(i, os.path.join(self.socket_dir, f"worker-{i}.sock")) for i in range(workers)]
+        self.sessions = collections.OrderedDict()  # session id -> worker index, touched by the proxy loop only
+        self._next = 0
+
+    # --- Process management (main thread) ---
+    def spawn(self, worker: Worker):
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(worker.socket_path)
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                           env.get("PYTHONPATH")]))
+        # Own session: terminal signals reach the supervisor only, which then stops workers in order
+        worker.proc = subprocess.Popen(
+            [sys.executable, "-m", "mcp_serving", "worker", self.app_spec, worker.socket_path],
+            env=env, start_new_session=True,
+        )
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        print(f"[{self.name}] worker {worker.index} started (pid {worker.proc.pid})")
+
+    def start(self):
+        for worker in self.workers:
+            self.spawn(worker)
+
+    def supervise(self):
+        """Restart workers that exited; a worker that keeps crashing is restarted with growing backoff."""
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.proc is None or worker.alive():
+                continue
+            if worker.restart_at is None:
+                if now - worker.started_at > RESTART_BACKOFF_MAX:
+                    worker.backoff = 0.0
+                else:
+                    worker.backoff = min(RESTART_BACKOFF_MAX, max(1.0, worker.backoff * 2))
+                worker.restart_at = now + worker.backoff
+                print(f"[{self.name}] worker {worker.index} (pid {worker.proc.pid}) exited with "
+                      f"{worker.proc.returncode}; restarting in {worker.backoff:.0f}s")
+            if now >= worker.restart_at:
+                worker.restarts += 1
+                self.spawn(worker)
+
+    def _terminate(self, workers, timeout: float):
+        for worker in workers:
+            if worker.alive():
+                worker.proc.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            if worker.proc is None:
+                continue
+            try:
+                worker.proc.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                print(f"[{self.name}] worker {worker.index} did not stop in {timeout:.0f}s; killing it")
+                worker.proc.kill()
+                worker.proc.wait()
+
+    def rolling_restart(self, stop: threading.Event):
+        """Restart the workers one at a time so the others keep serving."""
+        for worker in self.workers:
+            if stop.is_set():
+                return
+            self._terminate([worker], MCP_GRACEFUL_TIMEOUT)
+            self.spawn(worker)
+            deadline = time.monotonic() + WORKER_START_TIMEOUT
+            while not worker.ready() and worker.alive() and time.monotonic() < deadline and not stop.is_set():
+                time.sleep(0.1)
+
+    def stop(self, timeout: float = MCP_GRACEFUL_TIMEOUT):
+        self._terminate(self.workers, timeout)
+        shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+    def check(self):
+        """Health check: fails when no worker accepts requests."""
+        ready = sum(w.ready() for w in self.workers)
+        if not ready:
+            raise RuntimeError("no MCP worker is running")
+        return f"{ready}/{len(self.workers)} workers ready"
+
+    # --- Proxy (event loop of the public server) ---
+    def _pick(self):
+        """Ready workers for a new session, fewest in-flight requests first."""
+        ready = [w for w in self.workers if w.ready()]
+        self._next = (self._next + 1) % len(self.workers)
+        return sorted(ready, key=lambda w: (w.in_flight, (w.index - self._next) % len(self.workers)))
+
+    def _remember(self, session_id: str, index: int):
+        self.sessions[session_id] = index
+        self.sessions.move_to_end(session_id)
+        while len(self.sessions) > MAX_TRACKED_SESSIONS:
+            self.sessions.popitem(last=False)
+
+    async def proxy(self, request):
+        import httpx
+
+        session_id = request.headers.get(SESSION_HEADER)
+        if session_id is None:
+            candidates = self._pick()
+        else:
+            index = self.sessions.get(session_id)
+            if index is None:
+                # Unknown here (e.g. the supervisor restarted): any worker answers 404, the client re-initializes
+                candidates = self._pick()[:1]
+            else:
+                self.sessions.move_to_end(session_id)
+                candidates = [self.workers[index]]
+
+        body = await request.body()
+        headers = [(k, v) for k, v in request.headers.raw if k.decode("latin-1").lower() not in HOP_HEADERS]
+        url = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+        for worker in candidates:
+            worker.in_flight += 1
+            try:
+                upstream = await worker.client.send(
+                    worker.client.build_request(request.method, url, headers=headers, content=body), stream=True
+                )
+            except httpx.ConnectError:
+                worker.in_flight -= 1
+                if session_id is not None:
+                    # The worker holding the session is gone, and the session with it
+                    self.sessions.pop(session_id, None)
+                    return JSONResponse({"error": "session not found"}, status_code=404)
+                continue  # still starting or just died: try the next worker
+            except BaseException:
+                worker.in_flight -= 1
+                raise
+
+            new_session = upstream.headers.get(SESSION_HEADER)
+            if new_session and session_id is None:
+                self._remember(new_session, worker.index)
+            if request.method == "DELETE" and session_id is not None:
+                self.sessions.pop(session_id, None)
+
+            async def release(upstream=upstream, worker=worker):
+                await upstream.aclose()
+                worker.in_flight -= 1
+
+            return StreamingResponse(
+                upstream.aiter_raw(),
+                status_code=upstream.status_code,
+                headers={k: v for k, v in upstream.headers.items() if k.lower() not in HOP_HEADERS},
+                background=BackgroundTask(release),
+            )
+        return JSONResponse({"error": "no MCP worker available"}, status_code=503)
+
+    def proxy_app(self):
+        # httpx is only needed by the proxy, so single-process serving does not import it
+        import httpx
+
+        @contextlib.asynccontextmanager
+        async def lifespan(app):
+            for worker in self.workers:
+                worker.client = httpx.AsyncClient(
+                    transport=httpx.AsyncHTTPTransport(uds=worker.socket_path),
+                    base_url="http://mcp-worker",
+                    # SSE streams stay open as long as the session: no read timeout
+                    timeout=httpx.Timeout(connect=5.0, read=None, write=30.0, pool=None),
+                    limits=httpx.Limits(max_connections=None, max_keepalive_connections=100),
+                )
+            yield
+            for worker in self.workers:
+                await worker.client.aclose()
+
+        return Starlette(routes=[Route("/{path:path}", self.proxy, methods=PROXY_METHODS)], lifespan=lifespan)
+
+
+def run_worker(app_spec: str, socket_path: str):
+    """Entry point of a worker process: serve the FastMCP app of `module:attr` on a Unix socket."""
+    module_name, attr = app_spec.split(":")
+    mcp = getattr(importlib.import_module(module_name), attr)
+    server = _server(mcp.streamable_http_app(), uds=socket_path, log_level=mcp.settings.log_level.lower())
+    parent = os.getppid()
+
+    def watch_parent():
+        # Exit with the supervisor even if it was killed without stopping us
+        while os.getppid() == parent:
+            time.sleep(1)
+        server.should_exit = True
+
+    threading.Thread(target=watch_parent, name="mcp-parent-watch", daemon=True).start()
+    server.run()  # handles SIGTERM/SIGINT itself: drain, then exit
+
+
+# --- Entry point used by the servers ---
+def serve(mcp, app_spec: str, health_app=None, health_port: int = None, prober=None, on_shutdown=None,
+          workers: int = MCP_WORKERS):
+    """Run an MCP server (and its health app) until SIGTERM/SIGINT, then shut down gracefully.
+
+    `app_spec` ("module:attr") is how worker processes import the FastMCP
+    instance. `on_shutdown` runs after the MCP server stopped.
+    """
+    name, host, port = mcp.name, mcp.settings.host, mcp.settings.port
+    pool = None
+    if workers > 1:
+        pool = WorkerPool(name, app_spec, workers)
+        pool.start()
+        front = _server(pool.proxy_app(), host=host, port=port)
+        if prober is not None:
+            prober.checks["workers"] = pool.check
+            prober.critical.add("workers")
+        print(f"{name} MCP server running on port {port} ({workers} workers)")
+    else:
+        front = _server(mcp.streamable_http_app(), host=host, port=port, log_level=mcp.settings.log_level.lower())
+        print(f"{name} MCP server running on port {port}")
+
+    servers = [front]
+    if health_app is not None:
+        servers.append(_server(health_app, host="0.0.0.0", port=health_port))
+        print(f"{name} Health server running on port {health_port}")
+    if prober is not None:
+        prober.start()
+    threads = [threading.Thread(target=s.run, name=f"mcp-serve-{i}", daemon=True) for i, s in enumerate(servers)]
+    for t in threads:
+        t.start()
+
+    stop, reload = threading.Event(), threading.Event()
+
+    def on_signal(signum, frame):
+        if signum == signal.SIGHUP:
+            reload.set()
+            return
+        if stop.is_set():
+            # Second signal: stop waiting for in-flight requests
+            for s in servers:
+                s.force_exit = True
+        stop.set()
+
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, on_signal)
+
+    exit_code = 0
+    while not stop.wait(0.5):
+        if not all(t.is_alive() for t in threads):
+            print(f"[{name}] a server stopped unexpectedly; shutting down")
+            exit_code = 1
+            break
+        if pool is not None:
+            if reload.is_set():
+                reload.clear()
+                print(f"[{name}] SIGHUP: restarting workers")
+                pool.rolling_restart(stop)
+            pool.supervise()
+
+    print(f"[{name}] shutting down")
+    front.should_exit = True  # stop accepting, let in-flight requests finish
+    threads[0].join(MCP_GRACEFUL_TIMEOUT + 5)
+    if pool is not None:
+        pool.stop()
+    if on_shutdown is not None:
+        on_shutdown()
+    for s, t in zip(servers[1:], threads[1:]):
+        s.should_exit = True
+        t.join(5)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MCP worker process (started by the supervisor in serve())")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker_parser = sub.add_parser("worker")
+    worker_parser.add_argument("app", help="FastMCP instance as module:attr")
+    worker_parser.add_argument("socket", help="Unix socket to listen on")
+    args = parser.parse_args()
+    run_worker(args.app, args.socket)
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import Field
+
+# --- Backend selection (override via environment) ---
+# LLM_BACKEND=deepseek (default) talks to api.deepseek.com; LLM_BACKEND=fake uses
+# the scripted model below, so the agent loop can run offline. FAKE_LLM_SCRIPT
+# (JSON file) and FAKE_LLM_LATENCY_MS configure the fake. They are read when a
+# model is created, not at import, so values loaded from .env later still apply.
+
+# Default script: call one cheap read-only tool, then answer with its output
+DEFAULT_SCRIPT = [
+    {"tool_calls": [{"name": "get_current_context", "args": {}}]},
+    {"content": "{tool_output}"},
+]
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Deterministic chat model that replays a script of steps.
+
+    Each step is either ``{"tool_calls": [{"name": ..., "args": {...}}, ...]}`` or
+    ``{"content": "..."}``. The step is chosen by the number of AI messages since
+    the last user message, so every turn replays the script from the top.
+    ``{tool_output}`` in a content step is replaced with the last tool result.
+    Every call sleeps for ``latency_ms`` to stand in for model latency.
+    """
+
+    script: List[dict] = Field(default_factory=lambda: list(DEFAULT_SCRIPT))
+    latency_ms: float = 0.0
+    model_name: str = "scripted-fake"
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def bind_tools(self, tools, **kwargs: Any):
+        # The script decides which tools are called, so bound tools are ignored
+        return self
+
+    def _next_message(self, messages) -> AIMessage:
+        step_index = 0
+        tool_output = ""
+        for message in reversed(messages):
+            if message.type == "human":
+                break
+            if message.type == "ai":
+                step_index += 1
+            elif message.type == "tool" and not tool_output:
+                tool_output = message.content if isinstance(message.content, str) else str(message.content)
+
+        if step_index >= len(self.script):
+            return AIMessage(content=tool_output or "Done.")
+
+        step = self.script[step_index]
+        if step.get("tool_calls"):
+            return AIMessage(
+                content="",
+                tool_calls=[
+                    {"name": call["name"], "args": call.get("args", {}), "id": f"call_{step_index}_{i}"}
+                    for i, call in enumerate(step["tool_calls"])
+                ],
+            )
+        return AIMessage(content=step.get("content", "").replace("{tool_output}", tool_output))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+
+def load_script(path: str = None):
+    if path is None:
+        path = os.getenv("FAKE_LLM_SCRIPT", "")
+    if not path:
+        return list(DEFAULT_SCRIPT)
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def create_chat_model(model_name: str = "deepseek-reasoner"):
+    """Return the chat model for the configured backend."""
+    if os.getenv("LLM_BACKEND", "deepseek").lower() == "fake":
+        return ScriptedChatModel(script=load_script(), latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "0")))
+
+    from langchain_openai import ChatOpenAI
+
+    # mistral_key = os.getenv("MISTRAL_API_KEY")
+    # model = ChatMistralAI(model=model_name, api_key=mistral_key)
+    return ChatOpenAI(
+        model=model_name,
+        api_key=os.getenv("DEEPSEEK_API_KEY"),
+        base_url="https://api.deepseek.com",
+    )
@@ -0,0 +1,277 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Inventory settings (override via environment) ---
+# A local SQLite copy of bucket listings (key, size, last_modified, storage
+# class) so du/find/largest questions don't need a full crawl each time.
+INVENTORY_DB = os.getenv("S3_INVENTORY_DB", "data/s3_inventory.db")
+INVENTORY_WORKERS = int(os.getenv("S3_INVENTORY_WORKERS", "8"))
+# Partitions crawled longer ago than this are re-listed on refresh
+INVENTORY_MAX_AGE = float(os.getenv("S3_INVENTORY_MAX_AGE", "3600"))
+WRITE_BATCH_ROWS = 1000
+ROOT_PARTITION = ""
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+def get_connection():
+    """Thread-local connection to the inventory database (created on first use)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "db_file", None) != INVENTORY_DB:
+        os.makedirs(os.path.dirname(INVENTORY_DB) or ".", exist_ok=True)
+        conn = sqlite3.connect(INVENTORY_DB, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS objects (
+                bucket TEXT NOT NULL,
+                key TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_modified TEXT,
+                storage_class TEXT,
+                generation INTEGER NOT NULL,
+                PRIMARY KEY (bucket, key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_objects_size ON objects(bucket, size DESC);
+            CREATE TABLE IF NOT EXISTS partitions (
+                bucket TEXT NOT NULL,
+                prefix TEXT NOT NULL,
+                crawled_at REAL NOT NULL,
+                generation INTEGER NOT NULL,
+                objects INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                PRIMARY KEY (bucket, prefix)
+            );
+        """)
+        _local.conn = conn
+        _local.db_file = INVENTORY_DB
+    return conn
+
+
+def prefix_upper_bound(prefix: str) -> str:
+    """Smallest string greater than every key starting with `prefix` (for PK range scans)."""
+    if not prefix:
+        return "\U0010ffff"
+    if prefix[-1] == "\U0010ffff":
+        # No character above it: the bound of the shorter prefix covers these keys
+        return prefix_upper_bound(prefix[:-1])
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _partition_filter(prefix: str):
+    """SQL condition (and params) selecting the keys of one partition."""
+    if prefix == ROOT_PARTITION:
+        # Objects at the top level of the bucket (no "/" in the key)
+        return "instr(key, '/') = 0", ()
+    return "key >= ? AND key < ?", (prefix, prefix_upper_bound(prefix))
+
+
+# --- Crawl ---
+def discover_partitions(s3, bucket: str):
+    """Top-level prefixes of the bucket ("a/", "b/", ...) plus the root partition."""
+    prefixes = [ROOT_PARTITION]
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Delimiter="/"):
+        prefixes.extend(p["Prefix"] for p in page.get("CommonPrefixes", []))
+    return prefixes
+
+
+def _put(pages: queue.Queue, item, stop: threading.Event) -> bool:
+    """Put into the bounded queue unless the writer gave up (then return False)."""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _crawl_partition(s3, bucket: str, prefix: str, pages: queue.Queue, stop: threading.Event):
+    """List one partition and hand its pages to the writer."""
+    paginator = s3.get_paginator("list_objects_v2")
+    params = {"Bucket": bucket, "Prefix": prefix}
+    if prefix == ROOT_PARTITION:
+        params["Delimiter"] = "/"  # only the keys at the top level
+    for page in paginator.paginate(**params):
+        rows = [
+            (bucket, obj["Key"], obj["Size"], obj["LastModified"].isoformat(), obj.get("StorageClass", "STANDARD"))
+            for obj in page.get("Contents", [])
+        ]
+        if rows and not _put(pages, (prefix, rows), stop):
+            return
+
+
+def refresh(s3, bucket: str, max_age: float = INVENTORY_MAX_AGE, full: bool = False,
+            workers: int = INVENTORY_WORKERS) -> dict:
+    """Build or incrementally refresh the inventory of a bucket.
+
+    Top-level prefixes are crawled in parallel. Only partitions that are new or
+    older than `max_age` seconds (all of them with full=True) are re-listed;
+    keys that disappeared from a re-listed partition are removed, as are
+    partitions that no longer exist.
+    """
+    start = time.perf_counter()
+    conn = get_connection()
+    current = discover_partitions(s3, bucket)
+    known = dict(conn.execute(
+        "SELECT prefix, crawled_at FROM partitions WHERE bucket=?", (bucket,)
+    ).fetchall())
+    now = time.time()
+    stale = [p for p in current if full or p not in known or now - known[p] > max_age]
+    removed = [p for p in known if p not in current]
+    generation = int(now * 1000)
+
+    pages = queue.Queue(maxsize=workers * 4)
+    counts = {p: [0, 0] for p in stale}
+    written = 0
+
+    errors = []
+    # Set when the writer fails, so the listing threads stop instead of blocking on a full queue
+    stop = threading.Event()
+
+    def crawl():
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for future in [pool.submit(_crawl_partition, s3, bucket, p, pages, stop) for p in stale]:
+                    future.result()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            _put(pages, None, stop)
+
+    crawler = threading.Thread(target=crawl, name="s3-inventory-crawl")
+    crawler.start()
+
+    # Single writer: listing runs in parallel, SQLite takes one writer at a time
+    with _write_lock:
+        batch = []
+        try:
+            while True:
+                item = pages.get()
+                if item is not None:
+                    prefix, rows = item
+                    counts[prefix][0] += len(rows)
+                    counts[prefix][1] += sum(r[2] for r in rows)
+                    batch.extend(r + (generation,) for r in rows)
+                if batch and (item is None or len(batch) >= WRITE_BATCH_ROWS):
+                    with conn:
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO objects "
+                            "(bucket, key, size, last_modified, storage_class, generation) VALUES (?, ?, ?, ?, ?, ?)",
+                            batch,
+                        )
+                    written += len(batch)
+                    batch = []
+                if item is None:
+                    break
+        except BaseException:
+            # SQLite busy, disk full, ...: stop the crawl and unblock any pending put
+            stop.set()
+            while True:
+                try:
+                    pages.get_nowait()
+                except queue.Empty:
+                    break
+            crawler.join()
+            raise
+        crawler.join()
+        if errors:
+            raise errors[0]
+
+        with conn:
+            for prefix in stale:
+                condition, params = _partition_filter(prefix)
+                conn.execute(
+                    f"DELETE FROM objects WHERE bucket=? AND generation < ? AND {condition}",
+                    (bucket, generation) + params,
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO partitions (bucket, prefix, crawled_at, generation, objects, bytes) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (bucket, prefix, now, generation, counts[prefix][0], counts[prefix][1]),
+                )
+            for prefix in removed:
+                condition, params = _partition_filter(prefix)
+                conn.execute(f"DELETE FROM objects WHERE bucket=? AND {condition}", (bucket,) + params)
+                conn.execute("DELETE FROM partitions WHERE bucket=? AND prefix=?", (bucket, prefix))
+
+    return {
+        "partitions": len(current),
+        "refreshed": len(stale),
+        "removed": len(removed),
+        "objects_listed": written,
+        "elapsed_s": time.perf_counter() - start,
+    }
+
+
+# --- Queries ---
+def status(bucket: str):
+    """Object count, bytes and age (seconds) of the bucket's inventory, or None if never built."""
+    row = get_connection().execute(
+        "SELECT COUNT(*), SUM(objects), SUM(bytes), MIN(crawled_at) FROM partitions WHERE bucket=?", (bucket,)
+    ).fetchone()
+    if not row[0]:
+        return None
+    return {"partitions": row[0], "objects": row[1], "bytes": row[2], "age_s": time.time() - row[3]}
+
+
+def du(bucket: str, prefix: str = "", limit: int = 50):
+    """(group, objects, bytes) per next path level under `prefix`, largest first."""
+    conn = get_connection()
+    if not prefix:
+        # Top level: the per-partition totals recorded by the crawl
+        return conn.execute("""
+            SELECT CASE WHEN prefix = '' THEN '(objects at this level)' ELSE prefix END, objects, bytes
+            FROM partitions WHERE bucket = ? ORDER BY bytes DESC LIMIT ?
+        """, (bucket, limit)).fetchall()
+    start = len(prefix) + 1
+    return conn.execute("""
+        SELECT CASE WHEN instr(substr(key, ?), '/') > 0
+                    THEN substr(key, 1, ? + instr(substr(key, ?), '/'))
+                    ELSE '(objects at this level)' END AS grp,
+               COUNT(*), SUM(size)
+        FROM objects
+        WHERE bucket = ? AND key >= ? AND key < ?
+        GROUP BY grp
+        ORDER BY SUM(size) DESC
+        LIMIT ?
+    """, (start, start - 1, start, bucket, prefix, prefix_upper_bound(prefix), limit)).fetchall()
+
+
+def find(bucket: str, pattern: str, limit: int = 100):
+    """Keys matching a glob pattern ("*" also matches "/"): [(key, size, last_modified)]."""
+    # The literal part before the first wildcard narrows the primary key range
+    literal = pattern
+    for i, ch in enumerate(pattern):
+        if ch in "*?[":
+            literal = pattern[:i]
+            break
+    return get_connection().execute("""
+        SELECT key, size, last_modified FROM objects
+        WHERE bucket = ? AND key >= ? AND key < ? AND key GLOB ?
+        ORDER BY key
+        LIMIT ?
+    """, (bucket, literal, prefix_upper_bound(literal), pattern, limit)).fetchall()
+
+
+def largest(bucket: str, prefix: str = "", limit: int = 20):
+    """Largest objects under `prefix`: [(key, size, last_modified, storage_class)]."""
+    conn = get_connection()
+    if not prefix:
+        # Walks idx_objects_size, stopping after `limit` rows
+        return conn.execute("""
+            SELECT key, size, last_modified, storage_class FROM objects
+            WHERE bucket = ? ORDER BY size DESC LIMIT ?
+        """, (bucket, limit)).fetchall()
+    # "+size" keeps the planner on the primary key range instead of the size index
+    return conn.execute("""
+        SELECT key, size, last_modified, storage_class FROM objects
+        WHERE bucket = ? AND key >= ? AND key < ?
+        ORDER BY +size DESC LIMIT ?
+    """, (bucket, prefix, prefix_upper_bound(prefix), limit)).fetchall()
@@ -0,0 +1,244 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+# --- Router settings (override via environment) ---
+ROUTER_ENABLED = os.getenv("TOOL_ROUTER_ENABLED", "true").lower() == "true"
+ROUTER_TOP_K = int(os.getenv("TOOL_ROUTER_TOP_K", "12"))
+ROUTER_MIN_SCORE = float(os.getenv("TOOL_ROUTER_MIN_SCORE", "1.5"))
+ROUTER_HISTORY_TURNS = int(os.getenv("TOOL_ROUTER_HISTORY_TURNS", "2"))
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "an", "the", "in", "on", "of", "for", "to", "and", "or", "is", "are",
+    "me", "my", "all", "show", "list", "get", "what", "which", "whats", "please",
+    "with", "from", "it", "its", "this", "that", "there", "any", "can", "you",
+    "do", "does", "how", "i", "we", "our", "be", "by", "at", "as", "default",
+    "use", "using", "most", "some", "currently", "now",
+}
+
+# Keyword rules: a query matching the pattern is expanded with extra tokens,
+# so that user phrasing ("crashing", "cpu usage") reaches the right tool names.
+KEYWORD_RULES = [
+    (r"\b(s3|buckets?|aws)\b", ["bucket"]),
+    (r"\b(objects?|files?|keys?|upload|download)\b", ["object", "file"]),
+    (r"\bpolic(y|ies)\b", ["policy"]),
+    (r"\bversion(ing|ed)?\b", ["versioning"]),
+    (r"\b(crash\w*|failing|broken|unhealthy|oom\w*|imagepull\w*)\b", ["crashloop", "unhealthy"]),
+    (r"\b(pending|stuck|unscheduled)\b", ["pending"]),
+    (r"\blogs?\b", ["log"]),
+    (r"\b(cpu|memory|usage|metrics?|utili[sz]ation)\b", ["top", "metric"]),
+    (r"\b(restart|redeploy)\b", ["rollout", "restart"]),
+    (r"\b(rollback|revert|undo)\b", ["rollback", "rollout"]),
+    (r"\b(port[- ]?forward\w*|expose|tunnel)\b", ["port", "forward"]),
+    (r"\b(rbac|permissions?|allowed|authori[sz]\w*|identity)\b", ["perform", "role", "whoami"]),
+    (r"\b(contexts?|kubeconfig)\b", ["context"]),
+    (r"\b(storage|volumes?|disks?|pvcs?|pvs?)\b", ["pv", "pvc", "storageclass"]),
+    (r"\b(yaml|manifest)\b", ["yaml", "manifest"]),
+    (r"\b(exec|run|shell)\b", ["exec"]),
+    (r"\b(dns|resolve|nslookup)\b", ["dns"]),
+    (r"\b(drain|cordon|maintenance)\b", ["drain", "cordon", "uncordon"]),
+    (r"\b(replicas?|scale)\b", ["scale"]),
+]
+_COMPILED_RULES = [(re.compile(p, re.IGNORECASE), tokens) for p, tokens in KEYWORD_RULES]
+
+
+def _stem(token: str) -> str:
+    """Very small plural stemmer: pods -> pod, policies -> policy, ingresses -> ingress."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith("sses"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list:
+    tokens = re.split(r"[^a-z0-9]+", (text or "").lower())
+    return [_stem(t) for t in tokens if t and t not in STOPWORDS]
+
+
+def _message_text(message):
+    """Return (role, text) for LangChain messages and plain role/content dicts."""
+    if isinstance(message, dict):
+        return message.get("role"), message.get("content") or ""
+    role = {"human": "user", "ai": "assistant"}.get(getattr(message, "type", ""), getattr(message, "type", ""))
+    content = getattr(message, "content", "")
+    return role, content if isinstance(content, str) else str(content)
+
+
+class ToolRouter:
+    """Pick the top-K tools relevant to a conversation using BM25 plus keyword rules.
+
+    The index is built once from tool names, descriptions and argument names.
+    When the best match scores below ``min_score`` the router falls back to the
+    full tool set, and the fallback rate is tracked in ``stats()``.
+    """
+
+    def __init__(self, tools, top_k: int = ROUTER_TOP_K, min_score: float = ROUTER_MIN_SCORE,
+                 history_turns: int = ROUTER_HISTORY_TURNS):
+        self.tools = list(tools)
+        self.top_k = top_k
+        self.min_score = min_score
+        self.history_turns = history_turns
+        self._lock = threading.Lock()
+        self._selections = 0
+        self._fallbacks = 0
+        self._selected_total = 0
+        self._build_index()
+
+    # --- Index ---
+    def _build_index(self):
+        self._docs = []
+        for tool in self.tools:
+            name_tokens = tokenize(tool.name.replace("_", " "))
+            args = getattr(tool, "args", None) or {}
+            # Tool names carry most of the signal, so they are counted twice
+            doc = name_tokens * 2 + tokenize(getattr(tool, "description", "") or "") + tokenize(" ".join(args))
+            self._docs.append(Counter(doc))
+        self._doc_lens = [sum(d.values()) for d in self._docs]
+        self._avg_len = (sum(self._doc_lens) / len(self._docs)) if self._docs else 0.0
+        doc_freq = Counter()
+        for doc in self._docs:
+            doc_freq.update(doc.keys())
+        n = len(self._docs)
+        self._idf = {t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t, df in doc_freq.items()}
+
+    def _score(self, query_tokens):
+        scores = []
+        for doc, doc_len in zip(self._docs, self._doc_lens):
+            score = 0.0
+            for token, qtf in query_tokens.items():
+                tf = doc.get(token)
+                if not tf:
+                    continue
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * doc_len / self._avg_len)
+                score += qtf * self._idf[token] * tf * (BM25_K1 + 1) / norm
+            scores.append(score)
+        return scores
+
+    # --- Query ---
+    def _query_tokens(self, messages):
+        user_texts = []
+        for message in reversed(messages):
+            role, text = _message_text(message)
+            if role == "user":
+                user_texts.append(text)
+                if len(user_texts) > self.history_turns:
+                    break
+        if not user_texts:
+            return Counter()
+
+        # Latest question weighs more than the recent turns before it
+        tokens = Counter()
+        for i, text in enumerate(user_texts):
+            weight = 2 if i == 0 else 1
+            for token in tokenize(text):
+                tokens[token] += weight
+            for pattern, extra in _COMPILED_RULES:
+                if pattern.search(text):
+                    for token in tokenize(" ".join(extra)):
+                        tokens[token] += weight
+        return tokens
+
+    def select(self, messages):
+        """Return the tools to bind for this conversation state."""
+        query_tokens = self._query_tokens(messages)
+        scores = self._score(query_tokens) if query_tokens else []
+        best = max(scores) if scores else 0.0
+
+        if best < self.min_score or len(self.tools) <= self.top_k:
+            selected = self.tools
+            fallback = best < self.min_score
+        else:
+            ranked = sorted(range(len(self.tools)), key=lambda i: scores[i], reverse=True)
+            keep = {i for i in ranked[:self.top_k] if scores[i] > 0}
+            # Tools already called in this conversation stay bound so the
+            # model can follow up on their results
+            called = set()
+            for message in messages:
+                for call in getattr(message, "tool_calls", None) or []:
+                    called.add(call["name"])
+            selected = [t for i, t in enumerate(self.tools) if i in keep or t.name in called]
+            fallback = False
+
+        with self._lock:
+            self._selections += 1
+            self._selected_total += len(selected)
+            if fallback:
+                self._fallbacks += 1
+        return selected
+
+    def stats(self) -> dict:
+        with self._lock:
+            selections = self._selections
+            return {
+                "tools": len(self.tools),
+                "selections": selections,
+                "fallbacks": self._fallbacks,
+                "fallback_rate": (self._fallbacks / selections) if selections else 0.0,
+                "avg_tools_bound": (self._selected_total / selections) if selections else 0.0,
+            }
+
+
+# --- Module-level router cache ---
+# Built once per distinct tool set and reused across queries (and Streamlit reruns).
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_tool_router(tools) -> ToolRouter:
+    key = tuple(sorted(t.name for t in tools))
+    with _routers_lock:
+        router = _routers.get(key)
+        if router is None:
+            router = ToolRouter(tools)
+            _routers[key] = router
+        return router
+
+
+def router_stats() -> dict:
+    """Aggregate router metrics across all tool sets seen by this process."""
+    with _routers_lock:
+        routers = list(_routers.values())
+    selections = fallbacks = 0
+    for router in routers:
+        s = router.stats()
+        selections += s["selections"]
+        fallbacks += s["fallbacks"]
+    return {
+        "selections": selections,
+        "fallbacks": fallbacks,
+        "fallback_rate": (fallbacks / selections) if selections else 0.0,
+    }
+
+
+def bind_routed_tools(model, tools):
+    """Return a function ``for_messages(messages) -> model`` giving the model bound to the routed tools.
+
+    The function is synchronous; callers invoke the returned model, e.g.
+    ``await model_for(messages).ainvoke(messages)``. Bound models are cached per
+    selection so repeated loop iterations with the same tool subset don't
+    rebuild the tool schemas.
+    """
+    if not ROUTER_ENABLED:
+        model_with_tools = model.bind_tools(tools)
+        return lambda messages: model_with_tools
+
+    router = get_tool_router(tools)
+    bound = {}
+
+    def for_messages(messages):
+        selected = router.select(messages)
+        key = tuple(t.name for t in selected)
+        if key not in bound:
+            bound[key] = model.bind_tools(selected)
+        return bound[key]
+
+    return for_messages
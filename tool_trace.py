@@ -0,0 +1,80 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import tracing
+from answer_cache import content_text
+
+
+def args_hash(args) -> str:
+    text = json.dumps(args, sort_keys=True, default=str) if not isinstance(args, str) else args
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+async def load_tools_by_server(client, server_names):
+    """Load tools of every server concurrently: (tools, {tool name: server name})."""
+    per_server = await asyncio.gather(*(client.get_tools(server_name=name) for name in server_names))
+    tools, servers = [], {}
+    for name, server_tools in zip(server_names, per_server):
+        tools.extend(server_tools)
+        servers.update({t.name: name for t in server_tools})
+    return tools, servers
+
+
+class ToolCallRecorder(BaseCallbackHandler):
+    """Callback handler collecting per-tool-call timings of one run.
+
+    Pass it in the run config (``{"callbacks": [recorder]}``); every tool the
+    graph (or the answer cache) invokes is recorded with its latency, output
+    size and whether it failed. ``calls`` is ready for
+    ``chat_history.save_tool_calls``. Each call is also recorded as a client
+    span of the trace active when the recorder is created.
+    """
+
+    def __init__(self, servers=None):
+        self.servers = servers or {}
+        self.calls = []
+        self._started = {}
+        self._lock = threading.Lock()
+        self.trace_parent = tracing.current()
+
+    def on_tool_start(self, serialized, input_str, *, run_id, inputs=None, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+        with self._lock:
+            digest = args_hash(inputs if inputs is not None else input_str)
+            self._started[run_id] = (name, digest, time.perf_counter(), time.time_ns())
+
+    def _finish(self, run_id, output_bytes, error):
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            if started is None:
+                return
+            name, digest, start, start_ns = started
+            self.calls.append({
+                "server": self.servers.get(name),
+                "tool": name,
+                "args_hash": digest,
+                "latency_ms": (time.perf_counter() - start) * 1000,
+                "output_bytes": output_bytes,
+                "error": error,
+            })
+        tracing.record_span(
+            f"tool {name}", start_ns, time.time_ns(), parent=self.trace_parent, kind="client",
+            error="tool error" if error else None, server=self.servers.get(name), output_bytes=output_bytes,
+        )
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        text = content_text(getattr(output, "content", output))
+        self._finish(run_id, len(text.encode("utf-8")), False)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, 0, True)
+
+    def mark_cache_hit(self):
+        """Flag the recorded calls as cache validations (no model round trip)."""
+        for call in self.calls:
+            call["cache_hit"] = True
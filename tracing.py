@@ -0,0 +1,435 @@
+"""Lightweight distributed tracing: one trace per chat turn, across the web app and both MCP servers.
+
+The web app opens a ``turn`` span in run_multi_query and sends its W3C
+``traceparent`` header with every MCP request of the turn. Each MCP server
+reads the header when a tool runs (see instrument_mcp), so its ``tool``,
+``kubectl`` and ``s3`` spans join the same trace. Spans are appended as
+JSON lines to TRACE_DIR/<service>.jsonl and, when
+OTEL_EXPORTER_OTLP_ENDPOINT is set, also posted to an OTLP/HTTP collector
+(Jaeger, Tempo, an OpenTelemetry collector) as OTLP JSON.
+
+Print the slowest recent turns as waterfalls:
+
+    python -m tracing --last 5
+    python -m tracing --trace 4bf92f3577b34da6a3ce929d0e0e4736
+"""
+import argparse
+import atexit
+import contextlib
+import contextvars
+import functools
+import glob
+import inspect
+import json
+import os
+import queue
+import re
+import threading
+import time
+import urllib.request
+
+# --- Tracing settings (override via environment) ---
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_DIR = os.getenv("TRACE_DIR", "data/traces")
+# A span file larger than this is rotated to <service>.jsonl.1 (previous .1 is dropped)
+TRACE_MAX_MB = float(os.getenv("TRACE_MAX_MB", "50"))
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "").rstrip("/")
+EXPORT_INTERVAL = 1.0
+EXPORT_BATCH_SPANS = 512
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+class SpanContext:
+    """Trace and span id of a parent span (local, or remote from a traceparent header)."""
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+class Span(SpanContext):
+    def __init__(self, name, service, parent=None, kind="internal", attributes=None, start_ns=None):
+        super().__init__(parent.trace_id if parent else os.urandom(16).hex(), os.urandom(8).hex())
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.service = service
+        self.kind = kind
+        self.attributes = {k: v for k, v in (attributes or {}).items() if v is not None}
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def fail(self, message):
+        self.error = str(message)[:500]
+
+    def end(self, end_ns=None):
+        if self.end_ns is None:
+            self.end_ns = end_ns or time.time_ns()
+            _exporter.submit(self.to_dict())
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Stands in for a span outside a trace, so callers need no checks."""
+
+    def set(self, **attributes):
+        pass
+
+    def fail(self, message):
+        pass
+
+    def end(self, end_ns=None):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def current():
+    """The active span of this context (task/thread), or None outside a trace."""
+    return _current.get()
+
+
+def parse_traceparent(header):
+    match = _TRACEPARENT.match((header or "").strip().lower())
+    return SpanContext(match.group(1), match.group(2)) if match else None
+
+
+def inject(headers=None) -> dict:
+    """Add the traceparent of the active span to `headers` (for outgoing requests)."""
+    headers = dict(headers or {})
+    span = current()
+    if span is not None:
+        headers["traceparent"] = span.traceparent()
+    return headers
+
+
+def start_span(name, service=None, parent=None, kind="internal", root=False, **attributes):
+    """Start a span without making it active; child spans are skipped outside a trace unless root=True."""
+    parent = parent or current()
+    if not TRACING_ENABLED or (parent is None and not root):
+        return NOOP_SPAN
+    service = service or getattr(parent, "service", None) or "unknown"
+    return Span(name, service, parent=parent, kind=kind, attributes=attributes)
+
+
+@contextlib.contextmanager
+def span(name, service=None, parent=None, kind="internal", root=False, **attributes):
+    """Run a block as the active span; an exception escaping the block marks it failed."""
+    s = start_span(name, service=service, parent=parent, kind=kind, root=root, **attributes)
+    if s is NOOP_SPAN:
+        yield s
+        return
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+
+def record_span(name, start_ns, end_ns, parent=None, service=None, kind="internal", error=None, **attributes):
+    """Record an already finished span (e.g. timed by a callback) under `parent`."""
+    s = start_span(name, service=service, parent=parent, kind=kind, **attributes)
+    if s is NOOP_SPAN:
+        return
+    s.start_ns = start_ns
+    if error:
+        s.fail(error)
+    s.end(end_ns)
+
+
+# --- Integrations ---
+def instrument_mcp(mcp, service: str):
+    """Wrap every tool registered on a FastMCP server afterwards in a server span.
+
+    The span joins the caller's trace when the HTTP request carries a
+    traceparent header, so kubectl/boto3 spans inside the tool land there too.
+    Call it right after creating the server, before the @mcp.tool decorators.
+    """
+    register = mcp.tool
+
+    def request_parent():
+        try:
+            request = mcp.get_context().request_context.request
+            return parse_traceparent(request.headers.get("traceparent"))
+        except (AttributeError, LookupError, ValueError):
+            return None  # not an HTTP request (e.g. stdio) or no active request
+
+    def traced(fn, tool_name):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with span(f"tool {tool_name}", service=service, parent=request_parent(), kind="server", root=True):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with span(f"tool {tool_name}", service=service, parent=request_parent(), kind="server", root=True):
+                    return fn(*args, **kwargs)
+        return wrapper
+
+    def tool(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+
+        def wrap(fn):
+            decorator(traced(fn, kwargs.get("name") or (args[0] if args else None) or fn.__name__))
+            return fn  # module-level callers keep the plain function
+
+        return wrap
+
+    mcp.tool = tool
+    return mcp
+
+
+def instrument_botocore(client, service: str):
+    """Record a client span per API call of a boto3 client (retries included) made inside a trace."""
+
+    def before_call(model, params, context, **kwargs):
+        context["trace_span"] = start_span(f"s3 {model.name}", service=service, kind="client",
+                                           bucket=params.get("Bucket"))
+
+    def after_call(context, http_response=None, exception=None, **kwargs):
+        s = context.pop("trace_span", NOOP_SPAN)
+        if exception is not None:
+            s.fail(f"{type(exception).__name__}: {exception}")
+        elif http_response is not None:
+            s.set(status=http_response.status_code)
+            if http_response.status_code >= 400:
+                s.fail(f"HTTP {http_response.status_code}")
+        s.end()
+
+    client.meta.events.register("before-call.s3", before_call)
+    client.meta.events.register("after-call.s3", after_call)
+    client.meta.events.register("after-call-error.s3", after_call)
+    return client
+
+
+# --- Export ---
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans) -> dict:
+    """OTLP/HTTP JSON payload (ExportTraceServiceRequest) for a batch of span dicts."""
+    by_service = {}
+    for s in spans:
+        by_service.setdefault(s["service"], []).append({
+            "traceId": s["trace_id"],
+            "spanId": s["span_id"],
+            "parentSpanId": s["parent_id"] or "",
+            "name": s["name"],
+            "kind": _OTLP_KINDS.get(s["kind"], 1),
+            "startTimeUnixNano": str(s["start_ns"]),
+            "endTimeUnixNano": str(s["end_ns"]),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s["attributes"].items()],
+            "status": {"code": 2, "message": s["error"]} if s["error"] else {"code": 1},
+        })
+    return {"resourceSpans": [
+        {
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": otlp_spans}],
+        }
+        for service, otlp_spans in by_service.items()
+    ]}
+
+
+class _Exporter:
+    """Background thread writing finished spans in batches, so span.end() never blocks on I/O."""
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=10000)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, record):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="trace-exporter", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _drain(self):
+        batch = []
+        while len(batch) < EXPORT_BATCH_SPANS:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            time.sleep(EXPORT_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            batch = self._drain()
+            while batch:
+                self._export(batch)
+                batch = self._drain()
+
+    def _export(self, batch):
+        by_service = {}
+        for record in batch:
+            by_service.setdefault(record["service"], []).append(record)
+        for service, records in by_service.items():
+            try:
+                _write_file(service, records)
+            except OSError as e:
+                print(f"tracing: cannot write spans: {e}")
+        if OTLP_ENDPOINT:
+            request = urllib.request.Request(
+                f"{OTLP_ENDPOINT}/v1/traces", data=json.dumps(to_otlp(batch)).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+            )
+            try:
+                urllib.request.urlopen(request, timeout=5).close()
+            except OSError as e:
+                print(f"tracing: OTLP export to {OTLP_ENDPOINT} failed: {e}")
+
+
+def _write_file(service, records):
+    if not TRACE_DIR:
+        return
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    path = os.path.join(TRACE_DIR, f"{service}.jsonl")
+    with contextlib.suppress(FileNotFoundError):
+        if os.path.getsize(path) > TRACE_MAX_MB * 1024 * 1024:
+            os.replace(path, path + ".1")
+    # One write per batch in append mode: lines from several workers don't interleave
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("".join(json.dumps(r) + "\n" for r in records))
+
+
+_exporter = _Exporter()
+
+
+def flush():
+    """Write out the spans still queued (e.g. before a CLI exits)."""
+    _exporter.flush()
+
+
+# --- Waterfall CLI ---
+def load_spans(paths):
+    spans = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                with contextlib.suppress(json.JSONDecodeError):
+                    spans.append(json.loads(line))
+    return spans
+
+
+def waterfall(spans, width: int = 40, min_ms: float = 0.0) -> str:
+    """Indented span tree of one trace with offset, duration and a time bar per span."""
+    by_id = {s["span_id"]: s for s in spans}
+    children = {}
+    roots = []
+    for s in sorted(spans, key=lambda s: s["start_ns"]):
+        # A span whose parent was not recorded (or is in a file not read) is shown as a root
+        if s["parent_id"] in by_id:
+            children.setdefault(s["parent_id"], []).append(s)
+        else:
+            roots.append(s)
+    start = min(s["start_ns"] for s in spans)
+    total = max(max(s["end_ns"] for s in spans) - start, 1)
+    lines = [f"{'offset ms':>10} {'dur ms':>9}  {'':<{width}}  span"]
+
+    def walk(s, depth):
+        duration_ms = (s["end_ns"] - s["start_ns"]) / 1e6
+        if depth and duration_ms < min_ms:
+            return
+        left = int((s["start_ns"] - start) / total * width)
+        bar = max(1, round((s["end_ns"] - s["start_ns"]) / total * width))
+        bar_text = (" " * left + "█" * bar)[:width]
+        attrs = " ".join(f"{k}={v}" for k, v in s["attributes"].items() if k not in ("session_id",))
+        flag = "  ✗ " + s["error"] if s.get("error") else ""
+        lines.append(
+            f"{(s['start_ns'] - start) / 1e6:>10.1f} {duration_ms:>9.1f}  {bar_text:<{width}}  "
+            f"{'  ' * depth}{s['name']} [{s['service']}] {attrs}{flag}".rstrip()
+        )
+        for child in children.get(s["span_id"], []):
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print per-turn trace waterfalls from span files")
+    parser.add_argument("files", nargs="*", help=f"Span files (default: {TRACE_DIR}/*.jsonl)")
+    parser.add_argument("--trace", help="Trace id to show")
+    parser.add_argument("--last", type=int, default=5, help="Most recent turns to show")
+    parser.add_argument("--slowest", action="store_true", help="Pick the slowest turns instead of the latest")
+    parser.add_argument("--min-ms", type=float, default=0.0, help="Hide spans shorter than this")
+    parser.add_argument("--width", type=int, default=40, help="Width of the time bar")
+    args = parser.parse_args(argv)
+
+    paths = args.files or sorted(glob.glob(os.path.join(TRACE_DIR, "*.jsonl")))
+    spans = load_spans(paths)
+    traces = {}
+    for s in spans:
+        traces.setdefault(s["trace_id"], []).append(s)
+    if args.trace:
+        selected = [args.trace] if args.trace in traces else []
+    else:
+        turns = [s for s in spans if s["name"] == "turn" and s["parent_id"] is None]
+        key = (lambda s: s["end_ns"] - s["start_ns"]) if args.slowest else (lambda s: s["start_ns"])
+        selected = [s["trace_id"] for s in sorted(turns, key=key, reverse=True)[:args.last]]
+    if not selected:
+        print(f"No matching traces in {len(paths)} file(s)")
+        return
+    for trace_id in selected:
+        trace = traces[trace_id]
+        root = min(trace, key=lambda s: s["start_ns"])
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(root["start_ns"] / 1e9))
+        print(f"\ntrace {trace_id}  {started}  {len(trace)} spans")
+        print(waterfall(trace, width=args.width, min_ms=args.min_ms))
+
+
+if __name__ == "__main__":
+    main()
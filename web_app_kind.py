@@ -1,53 +1,97 @@
 import asyncio
 import streamlit as st
-from langchain_mcp_adapters.client import MultiServerMCPClient
-# from langchain_mistralai import ChatMistralAI
-from langchain_openai import ChatOpenAI
-from langgraph.graph import StateGraph, MessagesState, START, END
-from langgraph.prebuilt import ToolNode
 import os
+import threading
 import uuid
 from dotenv import load_dotenv
 
+# Load .env before the project modules below, which read their settings at import
+load_dotenv()
+
 # DB helper
-from chat_history import init_db, save_message, load_messages, list_sessions_with_preview
+from chat_history import (
+    DB_FILE, init_db, save_message, load_messages, load_messages_after, load_messages_page, list_sessions_page,
+    search_sessions, compact_checkpoints, start_maintenance, save_tool_calls, top_tools, tool_latency_percentiles,
+)
+from tool_router import bind_routed_tools, router_stats
+import answer_cache
+import tracing
+
+# Messages shown per "load older messages" step in the chat pane
+MESSAGES_PAGE_SIZE = 50
+# Messages kept in the chat pane while a session grows; older ones are
+# dropped from memory and can be loaded again on demand
+MESSAGES_WINDOW = 2 * MESSAGES_PAGE_SIZE
+# Import the agent stack in the background at startup instead of on the first question
+PRELOAD_AGENT_MODULES = os.getenv("PRELOAD_AGENT_MODULES", "true").lower() == "true"
+
+
+def _preload_agent_modules():
+    # The agent stack (langchain, langgraph, MCP client) is imported by
+    # run_multi_query; warming it here keeps it off the first question
+    import langchain_mcp_adapters.client  # noqa: F401
+    import langgraph.checkpoint.sqlite.aio  # noqa: F401
+    import langgraph.prebuilt  # noqa: F401
+    import model_backend  # noqa: F401
+    import tool_trace  # noqa: F401
+
+
+# Streamlit re-runs this script on every interaction; startup work runs once per process
+@st.cache_resource
+def startup():
+    init_db()  # Ensure DB exists
+    start_maintenance()  # Periodic archive/retention/vacuum
+    if PRELOAD_AGENT_MODULES:
+        threading.Thread(target=_preload_agent_modules, name="preload-agent", daemon=True).start()
+    return True
 
-# Load .env file
-load_dotenv()
-init_db()  # Ensure DB exists
+
+startup()
 
 # --- Backend call to MCP ---
-async def run_multi_query(user_input, model_name="deepseek-reasoner"):
-    # mistral_key = os.getenv("MISTRAL_API_KEY")
-    deepseek_key = os.getenv("DEEPSEEK_API_KEY")
+async def run_multi_query(user_input, model_name="deepseek-reasoner", turn=None):
+    # One trace per chat turn; the MCP servers join it through the traceparent header
+    with tracing.span("turn", service="web_app", root=True, session_id=st.session_state.session_id,
+                      turn=turn, model=model_name) as turn_span:
+        answer, from_cache = await _run_turn(user_input, model_name, turn)
+        turn_span.set(from_cache=from_cache)
+        return answer, from_cache
+
+
+async def _run_turn(user_input, model_name, turn):
+    from langchain_mcp_adapters.client import MultiServerMCPClient
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    from langgraph.graph import END, START, MessagesState, StateGraph
+    from langgraph.prebuilt import ToolNode
+
+    from model_backend import create_chat_model
+    from tool_trace import ToolCallRecorder, load_tools_by_server
 
     mcp_server_url = os.getenv("MCP_SERVER_URL", "http://127.0.0.1:8000/mcp")
     # aws_s3_mcp_url = os.getenv("AWS_S3_MCP_URL", "http://127.0.0.1:8010/mcp")
 
-    # model = ChatMistralAI(model=model_name, api_key=mistral_key)
-    model = ChatOpenAI(
-        # model="deepseek-chat",
-        model=model_name,
-        api_key=deepseek_key,
-        base_url="https://api.deepseek.com",
-    )
+    # Deepseek by default; LLM_BACKEND=fake selects the scripted offline model
+    model = create_chat_model(model_name)
 
     # Multi-server MCP client
-    client = MultiServerMCPClient(
-        {
-            "kubernetes": {
-                "transport": "streamable_http",
-                "url": mcp_server_url,
-            },
-            # "aws_s3": {
-            #     "transport": "streamable_http",
-            #     "url": aws_s3_mcp_url,
-            # }
-        }
-    )
+    connections = {
+        "kubernetes": {
+            "transport": "streamable_http",
+            "headers": tracing.inject(),
+            "url": mcp_server_url,
+        },
+        # "aws_s3": {
+        #     "transport": "streamable_http",
+        #     "url": aws_s3_mcp_url,
+        # }
+    }
+    client = MultiServerMCPClient(connections)
+
+    with tracing.span("load_tools", servers=len(connections)):
+        tools, tool_servers = await load_tools_by_server(client, list(connections))
 
-    tools = await client.get_tools()
-    model_with_tools = model.bind_tools(tools)
+    # Bind only the tools relevant to the conversation (falls back to all tools)
+    model_for = bind_routed_tools(model, tools)
     tool_node = ToolNode(tools)
 
     def should_continue(state: MessagesState):
@@ -59,7 +103,11 @@ async def run_multi_query(user_input, model_name="deepseek-reasoner"):
 
     async def call_model(state: MessagesState):
         messages = state["messages"]
-        response = await model_with_tools.ainvoke(messages)
+        with tracing.span("model", model=model_name, messages=len(messages)) as span:
+            response = await model_for(messages).ainvoke(messages)
+            usage = getattr(response, "usage_metadata", None) or {}
+            span.set(input_tokens=usage.get("input_tokens"), output_tokens=usage.get("output_tokens"),
+                     tool_calls=len(response.tool_calls))
         return {"messages": [response]}
 
     # Build LangGraph pipeline
@@ -69,31 +117,93 @@ async def run_multi_query(user_input, model_name="deepseek-reasoner"):
     builder.add_edge(START, "call_model")
     builder.add_conditional_edges("call_model", should_continue)
     builder.add_edge("tools", "call_model")
-    graph = builder.compile()
-
-    # Updated system prompt to include both K8s and S3
-    conversation_history = [
-        {
-            "role": "system",
-            "content": (
-                "You are an assistant capable of managing both Kubernetes and AWS S3. "
-                "Answer concisely and directly based on the user request. "
-                "Use Kubernetes tools for cluster-related queries and AWS S3 tools for bucket/object queries. "
-                "Do not give generic suggestions unless explicitly asked."
-            ),
-        }
-    ] + [
-        {"role": m["role"], "content": m["content"]}
-        for m in st.session_state.messages
-    ]
-    conversation_history.append({"role": "user", "content": user_input})
-
-    # Run with full context
-    result = await graph.ainvoke({"messages": conversation_history})
+
+    # Graph state (including tool calls/results) is checkpointed in the chat
+    # history database, one thread per chat session
+    session_id = st.session_state.session_id
+    # Every tool call of the turn is timed and stored in the tool_calls table
+    recorder = ToolCallRecorder(tool_servers)
+    config = {"configurable": {"thread_id": session_id}, "callbacks": [recorder]}
+    async with AsyncSqliteSaver.from_conn_string(DB_FILE) as checkpointer:
+        graph = builder.compile(checkpointer=checkpointer)
+        snapshot = await graph.aget_state(config)
+        prior_messages = snapshot.values.get("messages", [])
+        prior_len = len(prior_messages)
+        if prior_len:
+            history = prior_messages
+        else:
+            # No checkpoint yet (first turn, or a session saved before checkpointing):
+            # the whole persisted conversation, archived messages included, not just
+            # the window shown in the chat pane. The question itself is already saved.
+            history = [m for m in load_messages(session_id) if m["id"] != turn]
+        # The cache key includes the preceding exchange, so a follow-up question
+        # never gets an answer given in another conversation
+        context = answer_cache.conversation_key(history)
+
+        # Serve repeated read-only questions from cache if the tool results they
+        # relied on are unchanged
+        with tracing.span("answer_cache.lookup") as span:
+            cached_answer = await answer_cache.lookup(
+                user_input, model_name, tools, {"callbacks": [recorder]}, context=context
+            )
+            span.set(hit=cached_answer is not None)
+        if cached_answer is not None:
+            recorder.mark_cache_hit()
+            save_tool_calls(session_id, turn, recorder.calls)
+            if prior_len:
+                await graph.aupdate_state(
+                    config,
+                    {"messages": [{"role": "user", "content": user_input},
+                                  {"role": "assistant", "content": cached_answer}]},
+                    as_node="call_model",
+                )
+            return cached_answer, True
+
+        if prior_len:
+            # Resume from the checkpoint: only the new question is sent
+            input_messages = [{"role": "user", "content": user_input}]
+        else:
+            # First turn (or a session saved before checkpointing): seed from the persisted history
+            # Updated system prompt to include both K8s and S3
+            input_messages = [
+                {
+                    "role": "system",
+                    "content": (
+                        "You are an assistant capable of managing both Kubernetes and AWS S3. "
+                        "Answer concisely and directly based on the user request. "
+                        "Use Kubernetes tools for cluster-related queries and AWS S3 tools for bucket/object queries. "
+                        "Do not give generic suggestions unless explicitly asked."
+                    ),
+                }
+            ] + [
+                {"role": m["role"], "content": m["content"]}
+                for m in history
+            ]
+            input_messages.append({"role": "user", "content": user_input})
+
+        result = await graph.ainvoke({"messages": input_messages}, config)
+
+    compact_checkpoints(thread_id=session_id)
+    save_tool_calls(session_id, turn, recorder.calls)
+
     last_msg = result["messages"][-1].content
-    return last_msg if isinstance(last_msg, str) else str(last_msg)
+    answer = last_msg if isinstance(last_msg, str) else str(last_msg)
+
+    answer_cache.record(
+        user_input, model_name, result["messages"][prior_len + len(input_messages):], answer, context=context
+    )
+    return answer, False
 
 # --- Streamlit UI ---
+def append_message(row):
+    """Append a persisted message to the session history, keeping a bounded window."""
+    st.session_state.messages.append({"id": row["id"], "role": row["role"], "content": row["content"]})
+    st.session_state.last_persisted_id = max(st.session_state.last_persisted_id, row["id"])
+    if len(st.session_state.messages) > MESSAGES_WINDOW:
+        st.session_state.messages = st.session_state.messages[-MESSAGES_WINDOW:]
+        st.session_state.has_older = True
+
+
 def main():
     st.set_page_config(
         page_title="Kubernetes Chat", 
@@ -107,8 +217,15 @@ def main():
         st.session_state.session_id = str(uuid.uuid4())
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "has_older" not in st.session_state:
+        st.session_state.has_older = False
+    if "last_persisted_id" not in st.session_state:
+        st.session_state.last_persisted_id = 0
     if "sessions_page" not in st.session_state:
         st.session_state.sessions_page = 0
+    if "sessions_cursors" not in st.session_state:
+        # Keyset cursor at which each visited sidebar page starts
+        st.session_state.sessions_cursors = [None]
 
     # Sidebar with session management
     with st.sidebar:
@@ -133,32 +250,39 @@ def main():
         if st.button("➕ New Session", use_container_width=True):
             st.session_state.session_id = str(uuid.uuid4())
             st.session_state.messages = []
+            st.session_state.has_older = False
+            st.session_state.last_persisted_id = 0
             st.session_state.sessions_page = 0  # Reset to first page
+            st.session_state.sessions_cursors = [None]
             st.rerun()
 
         # Search box
         search_query = st.text_input("🔍 Search chats", placeholder="Type to search...")
-        
-        # Load sessions with preview
-        sessions_data = list_sessions_with_preview(limit=50)
-        
-        # Filter sessions based on search query
-        if search_query:
-            filtered_sessions = [
-                s for s in sessions_data 
-                if search_query.lower() in s["preview"].lower() or search_query.lower() in s["session_id"].lower()
-            ]
-        else:
-            filtered_sessions = sessions_data
-        
+        if search_query != st.session_state.get("last_search_query", ""):
+            st.session_state.last_search_query = search_query
+            st.session_state.sessions_page = 0
+            st.session_state.sessions_cursors = [None]
+
         # Increase sessions per page for list view
         sessions_per_page = 20
-        total_sessions = len(filtered_sessions)
-        start_idx = st.session_state.sessions_page * sessions_per_page
-        end_idx = min(start_idx + sessions_per_page, total_sessions)
-        paginated_sessions = filtered_sessions[start_idx:end_idx]
 
-        if not filtered_sessions:
+        # Load one page of sessions with preview (keyset cursor), or of
+        # full-text search results with a snippet
+        if search_query:
+            results = search_sessions(
+                search_query, limit=sessions_per_page + 1, offset=st.session_state.sessions_page * sessions_per_page
+            )
+            paginated_sessions = [{**s, "preview": s["snippet"] or s["preview"]} for s in results[:sessions_per_page]]
+            has_next_page = len(results) > sessions_per_page
+            next_cursor = None
+            if results and results[0]["truncated"]:
+                st.caption("Many chats match: only the most recent matches were ranked. Add words to find older chats.")
+        else:
+            cursor = st.session_state.sessions_cursors[st.session_state.sessions_page] or (None, None)
+            paginated_sessions, next_cursor = list_sessions_page(*cursor, page_size=sessions_per_page)
+            has_next_page = next_cursor is not None
+
+        if not paginated_sessions:
             st.info("No sessions found")
         else:
             # Display sessions as a clean list using radio buttons for selection
@@ -185,10 +309,15 @@ def main():
             # Update session if changed
             if selected_session_id and selected_session_id != st.session_state.session_id:
                 st.session_state.session_id = selected_session_id
-                st.session_state.messages = load_messages(selected_session_id)
+                st.session_state.messages, st.session_state.has_older = load_messages_page(
+                    selected_session_id, limit=MESSAGES_PAGE_SIZE
+                )
+                st.session_state.last_persisted_id = (
+                    st.session_state.messages[-1]["id"] if st.session_state.messages else 0
+                )
                 st.rerun()
         # Pagination controls
-        if total_sessions > sessions_per_page:
+        if st.session_state.sessions_page > 0 or has_next_page:
             st.divider()
             col1, col2, col3 = st.columns([1, 2, 1])
             with col1:
@@ -197,15 +326,17 @@ def main():
                         st.session_state.sessions_page -= 1
                         st.rerun()
             with col2:
-                total_pages = max(1, (total_sessions + sessions_per_page - 1) // sessions_per_page)
                 st.markdown(
-                    f"<div style='text-align: center; padding: 4px; font-size: 12px;'>Page {st.session_state.sessions_page+1} / {total_pages}</div>",
+                    f"<div style='text-align: center; padding: 4px; font-size: 12px;'>Page {st.session_state.sessions_page+1}</div>",
                     unsafe_allow_html=True
                 )
             with col3:
-                if end_idx < total_sessions:
+                if has_next_page:
                     if st.button("➡️", use_container_width=True):
                         st.session_state.sessions_page += 1
+                        # Remember where the next page starts so Prev/Next are O(page size)
+                        cursors = st.session_state.sessions_cursors[:st.session_state.sessions_page]
+                        st.session_state.sessions_cursors = cursors + [next_cursor]
                         st.rerun()
         
         st.divider()
@@ -213,9 +344,62 @@ def main():
         # Display current session info
         st.info(f"Current Session: `{st.session_state.session_id[:8]}...`")
 
+        # Tool router metrics
+        stats = router_stats()
+        if stats["selections"]:
+            st.caption(
+                f"Tool router: {stats['fallbacks']}/{stats['selections']} calls fell back "
+                f"to all tools ({stats['fallback_rate']:.0%})"
+            )
+        cache_stats = answer_cache.get_answer_cache().stats()
+        if cache_stats["hits"] or cache_stats["misses"]:
+            st.caption(
+                f"Answer cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                f"({cache_stats['entries']} entries)"
+            )
+
+        # Ops view: where tool time went over the last day
+        with st.expander("🛠️ Tool calls (24h)"):
+            slowest = top_tools(window_hours=24, limit=10)
+            if not slowest:
+                st.caption("No tool calls recorded yet")
+            else:
+                p95 = tool_latency_percentiles(window_hours=24, pct=95)
+                st.dataframe(
+                    [
+                        {
+                            "tool": t["tool"],
+                            "calls": t["calls"],
+                            "total s": round(t["total_ms"] / 1000, 2),
+                            "p95 ms": round(p95.get(t["tool"], 0.0), 1),
+                            "avg KB": round(t["avg_output_bytes"] / 1024, 1),
+                            "cached": t["cache_hits"],
+                            "errors": t["errors"],
+                        }
+                        for t in slowest
+                    ],
+                    hide_index=True,
+                    use_container_width=True,
+                )
+
     # Main chat area
     st.title("Kubernetes MCP Chat")
     
+    # Older messages are loaded on demand, one page at a time
+    if st.session_state.has_older and st.session_state.messages:
+        if st.button("⬆️ Load older messages"):
+            older, st.session_state.has_older = load_messages_page(
+                st.session_state.session_id,
+                before_id=st.session_state.messages[0]["id"],
+                limit=MESSAGES_PAGE_SIZE,
+            )
+            st.session_state.messages = older + st.session_state.messages
+            st.rerun()
+
+    # Pick up messages persisted by other tabs on the same session (index range scan)
+    for row in load_messages_after(st.session_state.session_id, st.session_state.last_persisted_id):
+        append_message(row)
+
     # Display chat history
     for msg in st.session_state.messages:
         with st.chat_message(msg["role"]):
@@ -229,22 +413,28 @@ def main():
             st.markdown(user_input)
         
         # Save user message to DB
-        save_message(st.session_state.session_id, "user", user_input)
+        is_new_session = st.session_state.last_persisted_id == 0
+        user_row = save_message(st.session_state.session_id, "user", user_input)
         
         # Get assistant response
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
-                answer = asyncio.run(run_multi_query(user_input, st.session_state.selected_model))
+                answer, from_cache = asyncio.run(run_multi_query(
+                    user_input, st.session_state.selected_model, turn=user_row["id"]
+                ))
                 st.markdown(answer)
+                if from_cache:
+                    st.caption("⚡ Served from cache (tool results unchanged)")
         
-        # Save assistant message to DB
-        save_message(st.session_state.session_id, "assistant", answer)
-        
-        # Reload messages to keep session state in sync
-        st.session_state.messages = load_messages(st.session_state.session_id)
-        
-        # Rerun to update the UI and sidebar
-        st.rerun()
+        # Save assistant message to DB and append both rows to the in-memory
+        # history; both are already rendered above, so no reload is needed
+        assistant_row = save_message(st.session_state.session_id, "assistant", answer)
+        append_message(user_row)
+        append_message(assistant_row)
+
+        # Only a brand-new session needs a rerun, to show up in the sidebar
+        if is_new_session:
+            st.rerun()
 
 if __name__ == "__main__":
     main()